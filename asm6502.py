@@ -31,6 +31,7 @@
 #
 
 import os, struct
+from array import array
 
 asm = dict()
 
@@ -798,38 +799,45 @@ def assemble (strProg):
 
     return prog
      
+def makeTestMemory (progName):
+    # Returns a 64kb array('B') holding the named test program from
+    # progs at $8000, the interrupt and reset vectors and the values
+    # the test programs expect to find in memory.
+    program = assemble (progs[progName])
+    sm = array('B', [0] * 0x10000)
+    # Load program into memory starting from $8000
+    sm[0x8000 : 0x8000 + len(program)] = array('B', program)
+    # Set some inital memory values used by the test cases
+    sm[0xFFFA] = 0x00  # vector low address for NMI
+    sm[0xFFFB] = 0x00  # vector high address for NMI
+    sm[0xFFFE] = 0x27  # vector low address for IRQ and BRK
+    sm[0xFFFF] = 0x05  # vector high address for IRQ and BRK
+    sm[0xFFFC] = 0x00  # vector low byte for RESET
+    sm[0xFFFD] = 0x80  # vector high byte for RESET, addr = $8000
+    sm[0x0527] = 0x40  # RTI, so IRQ and BRK return immediately
+    #sm[0x0527] = 0x4C  # JMP
+    #sm[0x0528] = 0x00  # JMP low addr byte
+    #sm[0x0529] = 0x80  # JMP high addr byte
+    # Test values on stack
+    sm[0x0101] = 0xFF
+    sm[0x0102] = 0x7F  # For status register: All but 'N' bit on
+    # Values for test programs
+    sm[0x0000] = 0x10
+    sm[0x0001] = 0x11
+    sm[0x0002] = 0x12
+    sm[0x0003] = 0x13
+    sm[0x0004] = 0xFF
+    sm[0x0005] = 0x01
+    sm[0x0006] = 0x80
+    sm[0x0007] = 0x03
+    sm[0x0008] = 0x00
+    return sm
+
 # BROKEN:  6502 sim no longer holds its own .memory
 def setProgram (sim, progName):
     if progs.has_key (progName):
         print 'Setting 6502 memory to test config and program %s'%progName
-        program = assemble (progs[progName])
-        # Load program into memory starting from $8000
-        sim.initMemory(0x8000, program)
-        sm = sim.memory
-        # Set some inital memory values used by the test cases
-        sm[0xFFFA] = 0x00  # vector low address for NMI
-        sm[0xFFFB] = 0x00  # vector high address for NMI
-        sm[0xFFFE] = 0x27  # vector low address for IRQ and BRK
-        sm[0xFFFF] = 0x05  # vector high address for IRQ and BRK
-        sm[0xFFFC] = 0x00  # vector low byte for RESET
-        sm[0xFFFD] = 0x80  # vector high byte for RESET, addr = $8000
-        sm[0x0527] = 0x40  # RTI, so IRQ and BRK return immediately
-        #sm[0x0527] = 0x4C  # JMP
-        #sm[0x0528] = 0x00  # JMP low addr byte
-        #sm[0x0529] = 0x80  # JMP high addr byte
-        # Test values on stack
-        sm[0x0101] = 0xFF
-        sm[0x0102] = 0x7F  # For status register: All but 'N' bit on
-        # Values for test programs
-        sm[0x0000] = 0x10
-        sm[0x0001] = 0x11
-        sm[0x0002] = 0x12
-        sm[0x0003] = 0x13
-        sm[0x0004] = 0xFF
-        sm[0x0005] = 0x01
-        sm[0x0006] = 0x80
-        sm[0x0007] = 0x03
-        sm[0x0008] = 0x00
+        sim.memory = makeTestMemory(progName)
     else:
         print 'Setting 6502 memory to ROM image %s'%progName
         if os.path.exists (progName):
@@ -0,0 +1,298 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+#------------------------------------------------------------------------------
+#
+# batchSim.py
+# Runs the console simulation without a display until a number of frames,
+# a number of half clocks, or a wall clock time has been reached, whichever
+# comes first.  Frames are saved to an output directory along with a
+# summary.json describing the run.  For example:
+#
+#   python batchSim.py roms/SpaceInvaders.bin --frames 2 --out outBatch
+#   python batchSim.py roms/Pitfall.bin --half-clocks 100000 --seconds 600
+#   python batchSim.py roms/Asteroids.bin --frames 100 --steady-state stop
+#
+# With --steady-state, the run watches for the console returning to a
+# state it was in at an earlier VSYNC.  From then on the simulation only
+# repeats itself, so 'stop' ends the run there, and 'skip' jumps over as
+# many repeats as fit in the frame or half clock limit.
+#
+# Run with --help for all options.
+#
+
+import argparse, json, os, sys, time
+import params
+import simBackends
+from imageRaw import ImageRaw
+from sim2600Console import Sim2600Console
+
+class BatchSim:
+    def __init__(self, romFilePath, backendName=None, outputDir=None,
+                 fileFormat='ppm', startSnapshotFile=None,
+                 checkpointCacheDir=None, chips=None):
+        self.romFilePath = romFilePath
+        self.backendName = backendName
+        if backendName == None:
+            self.backendName = params.circuitSimulatorBackend
+        self.outputDir = outputDir
+
+        self.sim = Sim2600Console(romFilePath, self.backendName, chips)
+        if checkpointCacheDir != None:
+            self.sim.useCheckpointCache(checkpointCacheDir,
+                                        params.checkpointInterval,
+                                        params.checkpointCacheMaxBytes)
+        if startSnapshotFile != None:
+            self.sim.loadSnapshot(startSnapshotFile)
+        else:
+            self.sim.resumeFromCheckpoint()
+
+        self.image = ImageRaw(outputDir, fileFormat)
+
+    def run(self, maxFrames=None, maxHalfClocks=None, maxSeconds=None,
+            frameCallback=None, steadyState='run'):
+        """ Runs until one of the limits is reached.  A limit of None
+            is no limit.  Returns a summary dict of the run.
+            frameCallback, if not None, is called as
+            frameCallback(frameIndex, framePath, tiaHalfClkCount) each
+            time a frame is finished.  framePath is None if frames
+            aren't saved.
+            steadyState is what to do if the console settles into a
+            loop: 'run' on without looking for one, 'stop', or 'skip'
+            the repeats that fit in maxFrames and maxHalfClocks.
+            Skipped frames are counted but not saved or passed to
+            frameCallback. """
+        sim = self.sim
+        tia = sim.simTIA
+        cpu = sim.sim6507
+        image = self.image
+        if steadyState != 'run':
+            sim.useLoopDetection()
+
+        startHalfClock = tia.halfClkCount
+        startWires = cpu.numWiresRecalculated + tia.numWiresRecalculated
+        startTime = time.time()
+        numHalfClocks = 0
+        numFrames = 0
+        numFramesSkipped = 0
+        # TIA half clock at which each frame was finished
+        frameHalfClocks = []
+        stopReason = None
+
+        while True:
+            if maxFrames != None and numFrames >= maxFrames:
+                stopReason = 'frames'
+                break
+            if maxHalfClocks != None and numHalfClocks >= maxHalfClocks:
+                stopReason = 'halfClocks'
+                break
+            if maxSeconds != None and time.time() - startTime >= maxSeconds:
+                stopReason = 'seconds'
+                break
+
+            sim.advanceOneHalfClock()
+            numHalfClocks += 1
+
+            if sim.stateLoop != None and steadyState != 'run':
+                # Frames finished in one time around the loop.  Not
+                # the same as VSYNCs, as short frames aren't counted.
+                loopStart = sim.stateLoop['startTIAHalfClock']
+                framesPerLoop = len([hc for hc in frameHalfClocks
+                                     if hc >= loopStart])
+                if steadyState == 'skip':
+                    framesLeft = None
+                    if maxFrames != None and framesPerLoop > 0:
+                        framesLeft = maxFrames - numFrames
+                    halfClocksLeft = None
+                    if maxHalfClocks != None:
+                        halfClocksLeft = maxHalfClocks - numHalfClocks
+                    if framesLeft != None or halfClocksLeft != None:
+                        numLoops = self.skipStateLoops(framesPerLoop, framesLeft,
+                                                       halfClocksLeft)
+                        numHalfClocks += numLoops * sim.stateLoop['periodTIAHalfClocks']
+                        numFrames += numLoops * framesPerLoop
+                        numFramesSkipped += numLoops * framesPerLoop
+                # Stop if running on can't reach any of the limits
+                # other than the time limit
+                if steadyState == 'stop' or (maxHalfClocks == None and
+                        (maxFrames == None or framesPerLoop == 0)):
+                    stopReason = 'steadyState'
+                    break
+
+            # Get pixel color when TIA clock (~3mHz) is low, as in mainSim.py
+            if tia.isLow(tia.padIndCLK0):
+                if tia.isHigh(tia.vsync):
+                    if image.restartImage():
+                        numFrames += 1
+                        frameHalfClocks.append(tia.halfClkCount)
+                        if frameCallback != None:
+                            framePath = None
+                            if image.outputDir != None:
+                                framePath = image.framePaths[-1]
+                            frameCallback(numFrames - 1, framePath,
+                                          tia.halfClkCount)
+                image.setNextPixel(tia.getColorRGBA8())
+
+        elapsedSec = time.time() - startTime
+        numWires = cpu.numWiresRecalculated + tia.numWiresRecalculated - startWires
+        summary = dict()
+        summary['rom'] = self.romFilePath
+        summary['romSHA1'] = sim.getROMHash()
+        summary['backend'] = self.backendName
+        summary['stopReason'] = stopReason
+        summary['frames'] = numFrames
+        summary['framesSkipped'] = numFramesSkipped
+        summary['stateLoop'] = sim.stateLoop
+        summary['framePaths'] = list(image.framePaths)
+        summary['startTIAHalfClock'] = startHalfClock
+        summary['tiaHalfClocks'] = tia.halfClkCount
+        summary['cpuHalfClocks'] = cpu.halfClkCount
+        summary['halfClocksRun'] = numHalfClocks
+        summary['elapsedSec'] = elapsedSec
+        summary['halfClocksPerSec'] = 0.0
+        summary['wiresPerClock'] = 0.0
+        if elapsedSec > 0:
+            summary['halfClocksPerSec'] = numHalfClocks / elapsedSec
+        if numHalfClocks > 0:
+            summary['wiresPerClock'] = 2.0 * numWires / numHalfClocks
+        if sim.checkpointCache != None:
+            summary['checkpoints'] = sim.checkpointCache.getStatsStr()
+        return summary
+
+    def skipStateLoops(self, framesPerLoop, framesLeft, halfClocksLeft):
+        # Skips as many whole loops as fit in both limits.  A limit of
+        # None is no limit, but at least one must be given.  Returns
+        # the number of loops skipped.
+        sim = self.sim
+        maxLoops = None
+        if framesLeft != None:
+            maxLoops = framesLeft // framesPerLoop
+        maxHalfClkCount = sim.simTIA.halfClkCount
+        if halfClocksLeft != None:
+            maxHalfClkCount += halfClocksLeft
+        else:
+            maxHalfClkCount += maxLoops * sim.stateLoop['periodTIAHalfClocks']
+        return sim.skipStateLoops(maxHalfClkCount, maxLoops)
+
+def writeSummary(summary, filePath):
+    of = open(filePath, 'w')
+    json.dump(summary, of, indent=2, sort_keys=True)
+    of.write('\n')
+    of.close()
+
+def getArgParser():
+    parser = argparse.ArgumentParser(description='Run the Atari 2600 ' +
+                 'simulation without a display, for a limited number of ' +
+                 'frames, half clocks, or seconds.')
+    parser.add_argument('romFile', help='cartridge ROM file')
+    parser.add_argument('--frames', type=int, default=None,
+                        help='stop after this many frames')
+    parser.add_argument('--half-clocks', type=int, default=None,
+                        dest='halfClocks',
+                        help='stop after this many TIA half clocks')
+    parser.add_argument('--seconds', type=float, default=None,
+                        help='stop after this much wall clock time')
+    parser.add_argument('--backend', default=None,
+                        choices=simBackends.getBackendNames(),
+                        help='circuit simulator, default from params.py')
+    parser.add_argument('--out', default=params.imageOutputDir,
+                        help='directory for frames and summary.json')
+    parser.add_argument('--format', default='ppm',
+                        choices=['ppm', 'png', 'rgba', 'npy', 'none'],
+                        help='frame image format, or none to not save frames')
+    parser.add_argument('--summary', default=None,
+                        help='summary file, default OUT/summary.json')
+    parser.add_argument('--snapshot', default=None,
+                        help='console snapshot file to start from')
+    parser.add_argument('--checkpoint-dir', default=params.checkpointCacheDir,
+                        dest='checkpointDir',
+                        help='checkpoint cache directory to resume from and save to')
+    parser.add_argument('--steady-state', default='run', dest='steadyState',
+                        choices=['run', 'stop', 'skip'],
+                        help='when the console repeats a state it was in at an '
+                             'earlier VSYNC: keep running, stop, or skip the '
+                             'repeats that fit in the limits')
+    parser.add_argument('--recalc-stats', action='store_true',
+                        dest='recalcStats',
+                        help='count the work done for each wire and transistor ' +
+                             'and write it to OUT/recalcStats_<chip>.json and .csv')
+    parser.add_argument('--record-signals', default=None, dest='recordSignals',
+                        help='record a logic analyzer trace of the chips to ' +
+                             'this file.  See signalRecorder.py')
+    parser.add_argument('--signal', action='append', default=None,
+                        dest='signals',
+                        help='signal or bus to record, like cpu:R/W or tia:DB.  ' +
+                             'Can be given more than once.  Default is the ' +
+                             'buses and control signals between the chips')
+    parser.add_argument('--quiet', action='store_true',
+                        help="don't print the simulation's messages")
+    return parser
+
+def main(argv):
+    args = getArgParser().parse_args(argv)
+    if args.frames == None and args.halfClocks == None and args.seconds == None:
+        print('ERROR: Give at least one of --frames, --half-clocks or --seconds')
+        return 2
+
+    if not os.path.exists(args.out):
+        os.makedirs(args.out)
+    framesDir = args.out
+    if args.format == 'none':
+        framesDir = None
+    summaryPath = args.summary
+    if summaryPath == None:
+        summaryPath = os.path.join(args.out, 'summary.json')
+
+    stdout = sys.stdout
+    if args.quiet:
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        batch = BatchSim(args.romFile, args.backend, framesDir, args.format,
+                         args.snapshot, args.checkpointDir)
+        chips = [batch.sim.sim6507, batch.sim.simTIA]
+        if args.recalcStats:
+            for chip in chips:
+                chip.enableRecalcStats()
+        if args.recordSignals != None:
+            batch.sim.recordSignals(args.recordSignals, args.signals)
+        summary = batch.run(args.frames, args.halfClocks, args.seconds,
+                            steadyState=args.steadyState)
+        batch.sim.stopRecordingSignals()
+        if args.recalcStats:
+            for chip in chips:
+                statsPath = os.path.join(args.out, 'recalcStats_' +
+                                         chip.__class__.__name__)
+                chip.recalcStats.writeJSON(statsPath + '.json')
+                chip.recalcStats.writeCSV(statsPath)
+    finally:
+        if args.quiet:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    writeSummary(summary, summaryPath)
+    print('%d frames, %d half clocks in %.1f sec, %.1f half clocks/sec, ' \
+          '%d wires/clk.  Wrote %s'%
+          (summary['frames'], summary['halfClocksRun'], summary['elapsedSec'],
+           summary['halfClocksPerSec'], summary['wiresPerClock'], summaryPath))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,470 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+#------------------------------------------------------------------------------
+#
+# batchedConsole.py
+# Any number of consoles run at once on batched chips, see
+# circuitSimulatorBatched.py.  Each lane is a console with its own
+# ROM, PIA RAM, i/o and timer, joystick and console switches and TIA
+# input pads, each kept in a numpy array with a row or entry per lane.
+# The half clock is the same as Sim2600Console's, with the wires copied
+# between the chips and the ROM and PIA accesses done for all of the
+# lanes at once.
+#
+# Like bitSlicedConsole.py, each lane starts as a Sim2600Console would
+# and getLaneConsole() puts a lane's state in a Sim2600Console.  It's
+# for running one cartridge with many inputs: --sweep-joystick gives
+# each lane a different joystick direction.
+#
+#   python batchedConsole.py roms/Pitfall.bin --lanes 256 --half-clocks 2000
+#   python batchedConsole.py roms/Pitfall.bin --lanes 16 --sweep-joystick --verify
+#
+
+import argparse, os, sys, time
+from array import array
+import numpy
+import params
+import simBackends
+from sim6502 import Sim6502
+from simTIA import SimTIA
+from sim2600Console import Sim2600Console
+from circuitSimulatorBatched import BatchedCircuitSimulator
+
+# The PIA timer period set by writing to 0x294 - 0x297
+timerPeriods = numpy.array([1, 8, 64, 1024], dtype=numpy.int64)
+
+class BatchedConsole:
+    def __init__(self, romFilePaths, backendName=None):
+        """ romFilePaths has the ROM for each lane.  The chips are loaded
+            once with backendName, which is only used to set the lanes up
+            and by getLaneConsole(). """
+        numLanes = len(romFilePaths)
+        if numLanes < 1:
+            raise RuntimeError('ERROR: Give at least one ROM, one per lane')
+        self.numLanes = numLanes
+        self.allLanes = numpy.ones(numLanes, dtype=bool)
+        self.romFilePaths = list(romFilePaths)
+
+        # One Sim2600Console per ROM, all on one pair of chips, as
+        # BitSlicedConsole does
+        cpu = simBackends.makeChipClass(Sim6502, backendName)()
+        tia = simBackends.makeChipClass(SimTIA, backendName)()
+        self.chips = (cpu, tia)
+        loadedStates = (cpu.getChipState(), tia.getChipState())
+        self.romConsoles = dict()
+        for romFilePath in romFilePaths:
+            if not romFilePath in self.romConsoles:
+                cpu.setChipState(loadedStates[0])
+                tia.setChipState(loadedStates[1])
+                console = Sim2600Console(romFilePath, backendName, self.chips)
+                self.romConsoles[romFilePath] = (console, console.getSnapshot())
+
+        romLen = max([len(console.rom) for console, snapshot in
+                      self.romConsoles.values()])
+        self.rom = numpy.zeros((numLanes, romLen), dtype=numpy.uint8)
+        self.programLen = numpy.zeros(numLanes, dtype=numpy.int64)
+        self.bankSwitchROMOffset = numpy.zeros(numLanes, dtype=numpy.int64)
+        self.ram = numpy.zeros((numLanes, 0x80), dtype=numpy.uint8)
+        self.iot = numpy.zeros((numLanes, 0x297 - 0x280 + 1), dtype=numpy.uint8)
+        self.timerPeriod = numpy.zeros(numLanes, dtype=numpy.int64)
+        self.timerValue = numpy.zeros(numLanes, dtype=numpy.int64)
+        self.timerClockCount = numpy.zeros(numLanes, dtype=numpy.int64)
+        self.timerFinished = numpy.zeros(numLanes, dtype=bool)
+        self.cpuHalfClkCount = numpy.zeros(numLanes, dtype=numpy.int64)
+        # TIA input pads I0-I5, high when not pressed
+        self.inputPadValue = numpy.full(numLanes, (1 << len(params.tiaInputPadNames)) - 1,
+                                        dtype=numpy.int64)
+
+        self.sim6507 = None
+        for lane, romFilePath in enumerate(romFilePaths):
+            console, snapshot = self.romConsoles[romFilePath]
+            console.restoreSnapshot(snapshot)
+            if self.sim6507 == None:
+                self.sim6507 = BatchedCircuitSimulator(cpu, numLanes)
+                self.simTIA = BatchedCircuitSimulator(tia, numLanes)
+            else:
+                self.sim6507.setLaneChipState(lane, cpu.getChipState())
+                self.simTIA.setLaneChipState(lane, tia.getChipState())
+            self.setLaneFromConsole(lane, console)
+
+        self.initWireIndices()
+
+    def setLaneFromConsole(self, lane, console):
+        # The parts of the lane's console that aren't chips
+        rom = numpy.frombuffer(console.rom, dtype=numpy.uint8)
+        self.rom[lane, :len(rom)] = rom
+        self.programLen[lane] = console.programLen
+        self.bankSwitchROMOffset[lane] = console.bankSwitchROMOffset
+        pia = console.emuPIA
+        self.ram[lane] = numpy.frombuffer(pia.ram, dtype=numpy.uint8)
+        self.iot[lane] = numpy.frombuffer(pia.iot, dtype=numpy.uint8)
+        self.timerPeriod[lane] = pia.timerPeriod
+        self.timerValue[lane] = pia.timerValue
+        self.timerClockCount[lane] = pia.timerClockCount
+        self.timerFinished[lane] = pia.timerFinished
+        self.cpuHalfClkCount[lane] = console.sim6507.halfClkCount
+
+    def initWireIndices(self):
+        cpu = self.sim6507
+        tia = self.simTIA
+        self.cpuAddressBusPads = [cpu.getWireIndex(name) for name in
+                                  params.cpuAddressBusPadNames]
+        self.cpuDataBusPads = [cpu.getWireIndex(name) for name in
+                               params.dataBusPadNames]
+        self.tiaAddressBusPads = [tia.getWireIndex(name) for name in
+                                  params.tiaAddressBusPadNames]
+        self.tiaDataBusPads = [tia.getWireIndex(name) for name in
+                               params.dataBusPadNames]
+        self.tiaInputPads = [tia.getWireIndex(name) for name in
+                             params.tiaInputPadNames]
+        self.tiaDataBusDrivers = [tia.getWireIndex(name) for name in
+                                  params.tiaDataBusDrivers]
+        self.cpuPadIndRW = cpu.getWireIndex('R/W')
+        self.cpuPadIndCLK0 = cpu.getWireIndex('CLK0')
+        self.cpuPadIndRDY = cpu.getWireIndex('RDY')
+        self.cpuPadIndCLK1Out = cpu.getWireIndex('CLK1OUT')
+        self.cpuPadIndSYNC = cpu.getWireIndex('SYNC')
+        self.cpuPadReset = cpu.getWireIndex('RES')
+        self.tiaPadIndRW = tia.getWireIndex('R/W')
+        self.tiaPadIndCLK0 = tia.getWireIndex('CLK0')
+        self.tiaPadIndCLK2 = tia.getWireIndex('CLK2')
+        self.tiaPadIndPH0 = tia.getWireIndex('PH0')
+        self.tiaPadIndsCS0CS3 = [tia.getWireIndex('CS0'), tia.getWireIndex('CS3')]
+        self.tiaPadIndDEL = tia.getWireIndex('del')
+        self.tiaIndRDY_lowCtrl = tia.getWireIndex('RDY_lowCtrl')
+        self.tiaIndDB6_drvLo = tia.getWireIndex('DB6_drvLo')
+        self.tiaIndDB6_drvHi = tia.getWireIndex('DB6_drvHi')
+        self.tiaIndDB7_drvLo = tia.getWireIndex('DB7_drvLo')
+        self.tiaIndDB7_drvHi = tia.getWireIndex('DB7_drvHi')
+
+    # Inputs, each an array of a value per lane.  Each takes effect
+    # from the next half clock.
+    def setInputPads(self, values):
+        """ Sets the TIA input pads I0-I5 as the bits of each lane's
+            value.  A bit is 0 when the pad is pulled low, like I4 with
+            the left joystick's button pressed. """
+        self.inputPadValue[:] = values
+
+    def setJoysticks(self, values):
+        # The PIA's port A, read at 0x280.  A bit is 0 for a direction
+        # pressed.
+        self.iot[:, 0x280 - 0x280] = values
+
+    def setSwitches(self, values):
+        # The console switches, read at 0x282
+        self.iot[:, 0x282 - 0x280] = values
+
+    def restoreLaneSnapshot(self, lane, snapshot):
+        """ Sets one lane to a snapshot from Sim2600Console.getSnapshot()
+            of a console running the lane's ROM """
+        console, loadedSnapshot = self.romConsoles[self.romFilePaths[lane]]
+        console.restoreSnapshot(snapshot)
+        cpu, tia = self.chips
+        self.sim6507.setLaneChipState(lane, cpu.getChipState())
+        self.simTIA.setLaneChipState(lane, tia.getChipState())
+        self.setLaneFromConsole(lane, console)
+
+    def getLaneConsole(self, lane):
+        """ Returns the lane's Sim2600Console set to the lane's state.
+            The consoles share one pair of chips, so it's only in that
+            state until getLaneConsole() is called for another lane. """
+        console, snapshot = self.romConsoles[self.romFilePaths[lane]]
+        cpu, tia = self.chips
+        cpuState = self.sim6507.getLaneChipState(lane)
+        cpu.setChipState((int(self.cpuHalfClkCount[lane]),) + cpuState[1:])
+        tia.setChipState(self.simTIA.getLaneChipState(lane))
+        pia = console.emuPIA
+        pia.ram = array('B', self.ram[lane].tostring())
+        pia.iot = array('B', self.iot[lane].tostring())
+        pia.timerPeriod = int(self.timerPeriod[lane])
+        pia.timerValue = int(self.timerValue[lane])
+        pia.timerClockCount = int(self.timerClockCount[lane])
+        pia.timerFinished = bool(self.timerFinished[lane])
+        console.bankSwitchROMOffset = int(self.bankSwitchROMOffset[lane])
+        return console
+
+    def getLaneStateHash(self, lane):
+        # Sim2600Console.getStateHash() for the lane
+        return self.getLaneConsole(lane).getStateHash()
+
+    def getLaneSnapshot(self, lane):
+        return self.getLaneConsole(lane).getSnapshot()
+
+    def readMemory(self, lanes, addrs):
+        # Sim2600Console.readMemory() in each of lanes, a boolean array,
+        # setting the 6507 data bus to the byte read
+        cpu = self.sim6507
+        tia = self.simTIA
+        bad = lanes & (addrs > 0x02FF) & (addrs < 0x8000)
+        for lane in numpy.flatnonzero(bad):
+            print('ERROR: lane %d 6507 ROM reading addr from 0x1000 to 0x1FFF: 0x%X'%
+                  (lane, addrs[lane]))
+        lanes = lanes & ~bad
+
+        datas = numpy.zeros(self.numLanes, dtype=numpy.int64)
+        isRAM = lanes & (((addrs >= 0x80) & (addrs <= 0xFF)) |
+                         ((addrs >= 0x180) & (addrs <= 0x1FF)))
+        datas[isRAM] = self.ram[isRAM, (addrs[isRAM] & 0xFF) - 0x80]
+        isIOT = lanes & (addrs >= 0x0280) & (addrs <= 0x0297)
+        datas[isIOT] = self.iot[isIOT, addrs[isIOT] - 0x0280]
+        isROM = lanes & ~isRAM & ~isIOT & \
+                ((addrs >= 0xF000) | ((addrs >= 0xD000) & (addrs <= 0xDFFF) &
+                                      (self.programLen == 8192)))
+        datas[isROM] = self.rom[isROM, addrs[isROM] - 0xF000 +
+                                self.bankSwitchROMOffset[isROM]]
+        # TIA reads are handled by the drive-low and drive-high wires,
+        # and reads from TIA write-only addresses happen all the time
+        isTIA = ((addrs >= 0x30) & (addrs <= 0x3D)) | (addrs <= 0x2C) | \
+                ((addrs >= 0x100) & (addrs <= 0x12C))
+        for lane in numpy.flatnonzero(lanes & ~isRAM & ~isIOT & ~isROM & ~isTIA):
+            print('WARNING: lane %d unhandled address in readMemory: 0x%4.4X'%
+                  (lane, addrs[lane]))
+
+        sync = cpu.isHigh(self.cpuPadIndSYNC)
+        driving = numpy.zeros(self.numLanes, dtype=bool)
+        for wireIndex in self.tiaDataBusDrivers:
+            driving |= tia.isHigh(wireIndex)
+        for lane in numpy.flatnonzero(lanes & sync & driving):
+            print('ERROR: lane %d TIA driving DB when 6502 fetching '%(lane) +
+                  'instruction at addr 0x%X'%(addrs[lane]))
+        drives = lanes & ~sync
+        datas[drives & tia.isHigh(self.tiaIndDB6_drvLo)] &= 0xFF ^ (1<<6)
+        datas[drives & tia.isHigh(self.tiaIndDB6_drvHi)] |= 1<<6
+        datas[drives & tia.isHigh(self.tiaIndDB7_drvLo)] &= 0xFF ^ (1<<7)
+        datas[drives & tia.isHigh(self.tiaIndDB7_drvHi)] |= 1<<7
+
+        changedPads = []
+        cpu.setValues(self.cpuDataBusPads, datas, changedPads, lanes)
+        if len(changedPads) > 0:
+            cpu.recalcWireList(changedPads)
+
+    def writeMemory(self, lanes, addrs, datas):
+        # Sim2600Console.writeMemory() in each of lanes, without the
+        # message for each write
+        cpu = self.sim6507
+        reset = lanes & cpu.isLow(self.cpuPadReset)
+        for lane in numpy.flatnonzero(reset):
+            print('Skipping 6507 write during reset in lane %d.  addr: 0x%X'%
+                  (lane, addrs[lane]))
+        lanes = lanes & ~reset
+
+        isROM = lanes & (addrs >= 0xF000)
+        isBanked = isROM & (self.programLen == 8192)
+        self.bankSwitchROMOffset[isBanked & (addrs == 0xFFF9)] = 0x2000
+        self.bankSwitchROMOffset[isBanked & (addrs == 0xFFF8)] = 0x1000
+        for lane in numpy.flatnonzero(isROM & ~isBanked):
+            raise RuntimeError('ERROR: lane %d 6507 writing to ROM space '%(lane) +
+                               'addr 0x%4.4X data 0x%2.2X'%(addrs[lane], datas[lane]))
+
+        isSwitches = lanes & ((addrs == 0x282) | (addrs == 0x280))
+        for lane in numpy.flatnonzero(isSwitches):
+            print('ERROR: lane %d 6507 writing to console or joystick '%(lane) +
+                  'switches addr 0x%4.4X  data 0x%2.2X'%(addrs[lane], datas[lane]))
+        lanes = lanes & ~isSwitches
+
+        isRAM = lanes & (((addrs >= 0x80) & (addrs <= 0xFF)) |
+                         ((addrs >= 0x180) & (addrs <= 0x1FF)))
+        self.ram[isRAM, (addrs[isRAM] & 0xFF) - 0x80] = datas[isRAM]
+        isIOT = lanes & (addrs >= 0x0280) & (addrs <= 0x0297)
+        self.iot[isIOT, addrs[isIOT] - 0x0280] = datas[isIOT]
+        # As Sim2600Console does, a timer write sets the period and the
+        # timer counts on from timerValue
+        isTimer = isIOT & (addrs >= 0x294)
+        self.timerPeriod[isTimer] = timerPeriods[addrs[isTimer] - 0x294]
+        self.timerClockCount[isTimer] = 0
+        self.timerFinished[isTimer] = False
+
+    def checkDataBusDrivers(self):
+        tia = self.simTIA
+        driving = numpy.zeros(self.numLanes, dtype=bool)
+        for wireIndex in self.tiaDataBusDrivers:
+            driving |= tia.isHigh(wireIndex)
+        bad = driving & self.sim6507.isHigh(self.cpuPadIndSYNC)
+        if bad.any():
+            print('ERROR: TIA driving DB when 6502 fetching instruction in lanes %s'%
+                  (numpy.flatnonzero(bad).tolist()))
+
+    def advanceOneHalfClock(self):
+        # Sim2600Console.advanceOneHalfClock() for every lane at once
+        cpu = self.sim6507
+        tia = self.simTIA
+
+        changedPads = []
+        tia.setValues(self.tiaInputPads, self.inputPadValue, changedPads)
+        tia.setPulledList([self.tiaPadIndDEL], [self.allLanes], changedPads)
+        tia.setPulledList([self.tiaPadIndRW], [cpu.isHigh(self.cpuPadIndRW)], changedPads)
+        tia.setPulledList(self.tiaAddressBusPads,
+                          [cpu.isHigh(i) for i in
+                           self.cpuAddressBusPads[:len(self.tiaAddressBusPads)]],
+                          changedPads)
+        notTIAAddr = cpu.getValues(self.cpuAddressBusPads) > 0x7F
+        tia.setPulledList(self.tiaPadIndsCS0CS3, [notTIAAddr, notTIAAddr], changedPads)
+        tia.setPulledList(self.tiaDataBusPads,
+                          [cpu.isHigh(i) for i in self.cpuDataBusPads], changedPads)
+        if len(changedPads) > 0:
+            tia.recalcWireList(changedPads)
+        self.checkDataBusDrivers()
+
+        changed = tia.setPulled(self.tiaPadIndCLK2, cpu.isHigh(self.cpuPadIndCLK1Out))
+        if changed.any():
+            tia.recalcWire(self.tiaPadIndCLK2, changed)
+
+        tia.setPulled(self.tiaPadIndCLK0, ~tia.isHigh(self.tiaPadIndCLK0))
+        tia.recalcWire(self.tiaPadIndCLK0)
+        tia.halfClkCount += 1
+
+        changed = cpu.setPulled(self.cpuPadIndRDY, ~tia.isHigh(self.tiaIndRDY_lowCtrl))
+        if changed.any():
+            cpu.recalcWire(self.cpuPadIndRDY, changed)
+
+        # Lanes whose 6507 clock follows the TIA's PH0 this half clock
+        clkHigh = tia.isHigh(self.tiaPadIndPH0)
+        clkLanes = clkHigh != cpu.isHigh(self.cpuPadIndCLK0)
+        if not clkLanes.any():
+            return
+
+        # The PIA timer
+        counting = clkLanes & clkHigh
+        finished = counting & self.timerFinished
+        self.timerValue[finished] -= 1
+        self.timerValue[finished & (self.timerValue < 0)] = 0
+        counting &= ~self.timerFinished
+        self.timerClockCount[counting] += 1
+        expired = counting & (self.timerClockCount >= self.timerPeriod)
+        self.timerValue[expired] -= 1
+        self.timerClockCount[expired] = 0
+        expired &= self.timerValue < 0
+        self.timerFinished[expired] = True
+        self.timerValue[expired] = 0xFF
+        timerAddrs = numpy.full(self.numLanes, 0x284, dtype=numpy.int64)
+        self.writeMemory(clkLanes & ~clkHigh, timerAddrs, self.timerValue)
+        self.cpuHalfClkCount[clkLanes] += 1
+
+        cpu.setPulled(self.cpuPadIndCLK0, clkHigh, clkLanes)
+        cpu.recalcWire(self.cpuPadIndCLK0, clkLanes)
+        cpu.halfClkCount += 1
+
+        cpuClkHigh = cpu.isHigh(self.cpuPadIndCLK0)
+        reading = cpu.isHigh(self.cpuPadIndRW)
+        writeLanes = clkLanes & cpuClkHigh & cpu.isLow(self.cpuPadIndRW)
+        readLanes = clkLanes & ~cpuClkHigh & reading
+        if not writeLanes.any() and not readLanes.any():
+            return
+
+        addrs = cpu.getValues(self.cpuAddressBusPads)
+        if writeLanes.any():
+            self.writeMemory(writeLanes, addrs, cpu.getValues(self.cpuDataBusPads))
+        if readLanes.any():
+            self.readMemory(readLanes, addrs)
+
+    def advanceToHalfClock(self, halfClkCount):
+        while self.simTIA.halfClkCount < halfClkCount:
+            self.advanceOneHalfClock()
+
+
+def getJoystickSweep(numLanes):
+    # Port A values holding each combination of the left joystick's
+    # directions in turn, starting from none pressed
+    return numpy.array([0xFF ^ ((lane % 16) << 4) for lane in xrange(numLanes)],
+                       dtype=numpy.int64)
+
+def getArgParser():
+    parser = argparse.ArgumentParser(description='Run many consoles at once ' +
+                 'on batched chips, and optionally check each lane against a ' +
+                 'console run on its own.')
+    parser.add_argument('romFiles', nargs='+',
+                        help='cartridge ROM files, given to the lanes in turn')
+    parser.add_argument('--lanes', type=int, default=None,
+                        help='number of lanes.  Default is one per ROM')
+    parser.add_argument('--half-clocks', type=int, default=2000, dest='halfClocks',
+                        help='TIA half clocks to run')
+    parser.add_argument('--sweep-joystick', action='store_true', dest='sweepJoystick',
+                        help='give the lanes each combination of joystick ' +
+                             'directions in turn')
+    parser.add_argument('--backend', default=None,
+                        help='circuit simulator backend for setting the lanes ' +
+                             'up and for --verify')
+    parser.add_argument('--verify', action='store_true',
+                        help='run a console on its own for each ROM and ' +
+                             'joystick and compare its state hash with its ' +
+                             'lanes at the end')
+    return parser
+
+def main(argv):
+    args = getArgParser().parse_args(argv)
+    numLanes = args.lanes
+    if numLanes == None:
+        numLanes = len(args.romFiles)
+    romFilePaths = [args.romFiles[i % len(args.romFiles)] for i in xrange(numLanes)]
+    joysticks = numpy.full(numLanes, 0xFF, dtype=numpy.int64)
+    if args.sweepJoystick:
+        joysticks = getJoystickSweep(numLanes)
+
+    # Setting the chips up prints a lot for each lane, so only that is
+    # silenced.  Messages from the run, like bad addresses, still show.
+    stdout = sys.stdout
+    start = time.time()
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        sim = BatchedConsole(romFilePaths, args.backend)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    sim.setJoysticks(joysticks)
+    initSec = time.time() - start
+    start = time.time()
+    sim.advanceToHalfClock(args.halfClocks)
+    runSec = time.time() - start
+    print('%d lanes, %d half clocks in %.1f sec (%.1f sec to set up), '%
+          (numLanes, args.halfClocks, runSec, initSec) +
+          '%.1f half clocks/sec, %.1f lane half clocks/sec'%
+          (args.halfClocks / runSec, numLanes * args.halfClocks / runSec))
+    hashes = [sim.getLaneStateHash(lane) for lane in xrange(numLanes)]
+    for lane in xrange(numLanes):
+        print('lane %3d %016x %s joystick 0x%02X'%(lane, hashes[lane],
+              romFilePaths[lane], joysticks[lane]))
+
+    if not args.verify:
+        return 0
+    numBad = 0
+    lanes = [(romFilePaths[lane], joysticks[lane]) for lane in xrange(numLanes)]
+    for romFilePath, joystick in sorted(set(lanes)):
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            console = Sim2600Console(romFilePath, args.backend)
+            console.emuPIA.iot[0x280 - 0x280] = joystick
+            console.advanceToHalfClock(args.halfClocks)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        expected = console.getStateHash()
+        for lane in xrange(numLanes):
+            if lanes[lane] == (romFilePath, joystick) and hashes[lane] != expected:
+                print('lane %d differs from %s with joystick 0x%02X run alone: %016x'%
+                      (lane, romFilePath, joystick, expected))
+                numBad += 1
+    if numBad == 0:
+        print('All lanes match their consoles run alone')
+        return 0
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
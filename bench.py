@@ -0,0 +1,374 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+#------------------------------------------------------------------------------
+#
+# bench.py
+# Runs fixed workloads from a fixed starting state, for one or more
+# circuit simulators, and writes how fast they ran and how much work
+# the simulation did to a JSON file.  The workloads are:
+#
+#   load     loadCircuit() of the 6502 and the TIA
+#   6502     Sim6502 alone running an asm6502.py test program from reset
+#   tia      SimTIA alone, clocked with its inputs held still
+#   console  the whole console running each ROM, from power on or from
+#            the checkpoint at --start TIA half clocks
+#
+# Each run reports half clocks per second, and for each chip the wires
+# recalculated, the wires added to groups per wire recalculated, and
+# the recalcs run and the iterations they took, and the hits and
+# misses of the recalc cache if --recalc-cache gives it entries.  The
+# state hash at the end of a run is reported too, and is the same for
+# every simulator.  For example:
+#
+#   python bench.py --backend arrays --backend compiled --out bench.json
+#   python bench.py --workload console --rom roms/Pitfall.bin \
+#                   --start 250000 --checkpoint-dir checkpoints
+#   python bench.py --workload 6502 --recalc-cache 5000
+#
+# Run with --help for all options.
+#
+
+import argparse, glob, json, os, platform, sys, time
+import asm6502
+import params
+import simBackends
+from sim2600Console import Sim2600Console
+from sim6502 import Sim6502
+from simTIA import SimTIA
+
+workloadNames = ['load', '6502', 'tia', 'console']
+
+class Bench:
+    def __init__(self, backendName, repeat=3):
+        self.backendName = backendName
+        self.repeat = repeat
+        self.cpu = None
+        self.tia = None
+        self.cpuLoadState = None
+        self.tiaLoadState = None
+
+    def getChips(self):
+        # Chips are loaded once and put back in their just loaded
+        # state each time they're handed out.
+        if self.cpu == None:
+            self.cpu = simBackends.makeChipClass(Sim6502, self.backendName)()
+            self.tia = simBackends.makeChipClass(SimTIA, self.backendName)()
+            self.cpuLoadState = self.cpu.getChipState()
+            self.tiaLoadState = self.tia.getChipState()
+        self.cpu.setChipState(self.cpuLoadState)
+        self.tia.setChipState(self.tiaLoadState)
+        return self.cpu, self.tia
+
+    def benchLoad(self):
+        """ Times constructing each chip, which loads its netlist. """
+        result = self.makeResult('load')
+        for chipClass in [Sim6502, SimTIA]:
+            chipClass = simBackends.makeChipClass(chipClass, self.backendName)
+            times = []
+            for i in xrange(self.repeat):
+                startTime = time.time()
+                chip = chipClass()
+                times.append(time.time() - startTime)
+            result[chipClass.__name__] = {'seconds': min(times),
+                                          'allSeconds': times,
+                                          'wires': chip.numWires,
+                                          'transistors': chip.numFets}
+        result['seconds'] = result['Sim6502']['seconds'] + \
+                            result['SimTIA']['seconds']
+        return result
+
+    def bench6502(self, programName, numHalfClocks):
+        """ Runs Sim6502 alone with the named asm6502 test program in
+            memory, from the end of the 6502's reset sequence. """
+        cpu = self.getChips()[0]
+        memory = asm6502.makeTestMemory(programName)
+        cpu.resetChip()
+        startState = cpu.getChipState()
+        startMemory = memory[:]
+
+        def run():
+            clk = cpu.padIndCLK0
+            rw = cpu.padIndRW
+            for i in xrange(numHalfClocks):
+                clkHigh = not cpu.isHigh(clk)
+                cpu.setPulled(clk, clkHigh)
+                cpu.recalcWire(clk)
+                cpu.halfClkCount += 1
+                addr = cpu.getAddressBusValue()
+                if clkHigh:
+                    if cpu.isLow(rw):
+                        memory[addr] = cpu.getDataBusValue()
+                elif cpu.isHigh(rw):
+                    changedPads = cpu.setDataBusValue(memory[addr])
+                    if len(changedPads) > 0:
+                        cpu.recalcWireList(changedPads)
+
+        def restart():
+            cpu.setChipState(startState)
+            memory[:] = startMemory
+
+        result = self.makeResult('6502')
+        result['program'] = programName
+        self.timeRuns(result, [cpu], restart, run, numHalfClocks)
+        result['stateHash'] = '%016x'%(cpu.getStateHash())
+        return result
+
+    def benchTIA(self, numHalfClocks):
+        """ Runs SimTIA alone.  Its inputs are held high, the 6507 is
+            reading from an address that isn't the TIA's, and CLK2 is
+            given the TIA's PH0 output, as the 6507 would. """
+        tia = self.getChips()[1]
+        for wireIndex in tia.inputPads + [tia.padIndDEL, tia.padIndRW] + \
+                         tia.padIndsCS0CS3:
+            tia.setPulledHigh(wireIndex)
+        tia.recalcAllWires()
+        startState = tia.getChipState()
+
+        def run():
+            clk0 = tia.padIndCLK0
+            clk2 = tia.padIndCLK2
+            ph0 = tia.padIndPH0
+            for i in xrange(numHalfClocks):
+                if tia.setPulled(clk2, tia.isHigh(ph0)):
+                    tia.recalcWire(clk2)
+                tia.setPulled(clk0, not tia.isHigh(clk0))
+                tia.recalcWire(clk0)
+                tia.halfClkCount += 1
+
+        def restart():
+            tia.setChipState(startState)
+
+        result = self.makeResult('tia')
+        self.timeRuns(result, [tia], restart, run, numHalfClocks)
+        result['stateHash'] = '%016x'%(tia.getStateHash())
+        return result
+
+    def benchConsole(self, romFilePath, numHalfClocks, startHalfClock=0,
+                     checkpointCacheDir=None):
+        """ Runs the whole console from startHalfClock TIA half clocks.
+            With a checkpoint cache, the console starts from the nearest
+            checkpoint before startHalfClock and one is saved there for
+            next time. """
+        sim = Sim2600Console(romFilePath, self.backendName, self.getChips())
+        if checkpointCacheDir != None:
+            sim.useCheckpointCache(checkpointCacheDir, 0,
+                                   params.checkpointCacheMaxBytes)
+        sim.advanceToHalfClock(startHalfClock)
+        if checkpointCacheDir != None:
+            sim.saveCheckpoint()
+        startSnapshot = sim.getSnapshot()
+
+        def run():
+            for i in xrange(numHalfClocks):
+                sim.advanceOneHalfClock()
+
+        def restart():
+            sim.restoreSnapshot(startSnapshot)
+
+        result = self.makeResult('console')
+        result['rom'] = romFilePath
+        result['romSHA1'] = sim.getROMHash()
+        result['startTIAHalfClock'] = sim.simTIA.halfClkCount
+        self.timeRuns(result, [sim.sim6507, sim.simTIA], restart, run,
+                      numHalfClocks)
+        result['stateHash'] = '%016x'%(sim.getStateHash())
+        return result
+
+    def makeResult(self, workloadName):
+        return {'workload': workloadName, 'backend': self.backendName}
+
+    def timeRuns(self, result, chips, restart, run, numHalfClocks):
+        # Runs the workload self.repeat times from the same state and
+        # fills in result with the fastest time and the chips' stats.
+        # The stats are the same for every run, so they're taken from
+        # the last one.
+        times = []
+        for i in xrange(self.repeat):
+            restart()
+            # Each run starts with an empty recalc cache, rather than
+            # one holding every result of the run before
+            for chip in chips:
+                if chip.recalcCache != None:
+                    chip.recalcCache.clear()
+            startStats = [getChipStats(chip) for chip in chips]
+            startTime = time.time()
+            run()
+            times.append(time.time() - startTime)
+        bestTime = min(times)
+        result['halfClocks'] = numHalfClocks
+        result['seconds'] = bestTime
+        result['allSeconds'] = times
+        result['halfClocksPerSec'] = 0.0
+        if bestTime > 0:
+            result['halfClocksPerSec'] = numHalfClocks / bestTime
+        for chip, startStat in zip(chips, startStats):
+            stats = getChipStats(chip)
+            for key in stats:
+                if key != 'maxRecalcSteps':
+                    stats[key] -= startStat[key]
+            result[chip.__class__.__name__] = summarizeChipStats(stats,
+                                                  numHalfClocks)
+
+def getChipStats(chip):
+    stats = {'wiresRecalculated': chip.numWiresRecalculated,
+             'wiresAddedToGroups': chip.numAddWireToGroup,
+             'recalcs': chip.numRecalcs,
+             'recalcSteps': chip.numRecalcSteps,
+             'maxRecalcSteps': chip.maxRecalcSteps,
+             'recalcCacheHits': 0,
+             'recalcCacheMisses': 0}
+    if chip.recalcCache != None:
+        stats['recalcCacheHits'] = chip.recalcCache.numHits
+        stats['recalcCacheMisses'] = chip.recalcCache.numMisses
+    return stats
+
+def summarizeChipStats(stats, numHalfClocks):
+    # Adds averages to the counts from getChipStats().  Every wire
+    # recalculated, other than ground and power, is recalculated by
+    # walking its group, so wires added to groups per wire recalculated
+    # is the mean group size.
+    summary = dict(stats)
+    summary['wiresPerHalfClock'] = 0.0
+    summary['meanGroupSize'] = 0.0
+    summary['meanRecalcSteps'] = 0.0
+    if numHalfClocks > 0:
+        summary['wiresPerHalfClock'] = float(stats['wiresRecalculated']) / \
+                                       numHalfClocks
+    if stats['wiresRecalculated'] > 0:
+        summary['meanGroupSize'] = float(stats['wiresAddedToGroups']) / \
+                                   stats['wiresRecalculated']
+    if stats['recalcs'] > 0:
+        summary['meanRecalcSteps'] = float(stats['recalcSteps']) / \
+                                     stats['recalcs']
+    return summary
+
+def getResultStr(result):
+    name = result['workload']
+    if name == 'console':
+        name += ' ' + os.path.basename(result['rom'])
+    elif name == '6502':
+        name += ' ' + result['program']
+    if name == 'load':
+        return '%-8s %-28s %.2f sec'%(result['backend'], name, result['seconds'])
+    return '%-8s %-28s %.1f half clocks/sec'%(result['backend'], name,
+                                              result['halfClocksPerSec'])
+
+def getArgParser():
+    parser = argparse.ArgumentParser(description='Benchmark the circuit ' +
+                 'simulators on fixed workloads and write the results ' +
+                 'to a JSON file.')
+    parser.add_argument('--backend', action='append', default=None,
+                        choices=simBackends.getBackendNames(),
+                        help='circuit simulator to benchmark.  Can be ' +
+                             'given more than once.  Default from params.py')
+    parser.add_argument('--workload', action='append', default=None,
+                        choices=workloadNames,
+                        help='workload to run.  Can be given more than ' +
+                             'once.  Default is all of them')
+    parser.add_argument('--half-clocks', type=int, default=2000,
+                        dest='halfClocks',
+                        help='half clocks in each 6502, tia and console run')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs of each workload.  The fastest is reported')
+    parser.add_argument('--program', default='JSR_RTS',
+                        choices=sorted(asm6502.progs.keys()),
+                        help='asm6502.py test program for the 6502 workload')
+    parser.add_argument('--rom', action='append', default=None,
+                        help='ROM for the console workload.  Can be given ' +
+                             'more than once.  Default is roms/*.bin')
+    parser.add_argument('--start', type=int, default=0,
+                        help='TIA half clock the console runs start from')
+    parser.add_argument('--checkpoint-dir', default=params.checkpointCacheDir,
+                        dest='checkpointDir',
+                        help='checkpoint cache directory to start the ' +
+                             'console runs from and save to')
+    parser.add_argument('--recalc-cache', type=int,
+                        default=params.recalcCacheMaxEntries,
+                        dest='recalcCache',
+                        help='entries in each chip\'s recalc cache, 0 ' +
+                             'for none.  Default from params.py')
+    parser.add_argument('--out', default='bench.json',
+                        help='JSON file to write the results to')
+    parser.add_argument('--verbose', action='store_true',
+                        help="print the simulation's messages")
+    return parser
+
+def main(argv):
+    args = getArgParser().parse_args(argv)
+    backendNames = args.backend
+    if backendNames == None:
+        backendNames = [params.circuitSimulatorBackend]
+    workloads = args.workload
+    if workloads == None:
+        workloads = workloadNames
+    romFiles = args.rom
+    if romFiles == None:
+        romFiles = sorted(glob.glob(os.path.join('roms', '*.bin')))
+    # Read by the chips when they're made
+    params.recalcCacheMaxEntries = args.recalcCache
+
+    report = dict()
+    report['python'] = platform.python_version()
+    report['platform'] = platform.platform()
+    report['time'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    report['halfClocks'] = args.halfClocks
+    report['repeat'] = args.repeat
+    report['collapseStaticNetlist'] = params.collapseStaticNetlist
+    report['recalcCacheMaxEntries'] = params.recalcCacheMaxEntries
+    results = []
+    report['results'] = results
+
+    stdout = sys.stdout
+    for backendName in backendNames:
+        bench = Bench(backendName, args.repeat)
+        for workload in workloads:
+            if workload == 'console':
+                jobs = [(bench.benchConsole, (romFile, args.halfClocks,
+                         args.start, args.checkpointDir)) for romFile in romFiles]
+            elif workload == 'load':
+                jobs = [(bench.benchLoad, ())]
+            elif workload == '6502':
+                jobs = [(bench.bench6502, (args.program, args.halfClocks))]
+            else:
+                jobs = [(bench.benchTIA, (args.halfClocks,))]
+
+            for func, funcArgs in jobs:
+                if not args.verbose:
+                    sys.stdout = open(os.devnull, 'w')
+                try:
+                    result = func(*funcArgs)
+                finally:
+                    if not args.verbose:
+                        sys.stdout.close()
+                        sys.stdout = stdout
+                results.append(result)
+                print(getResultStr(result))
+
+    of = open(args.out, 'w')
+    json.dump(report, of, indent=2, sort_keys=True)
+    of.write('\n')
+    of.close()
+    print('Wrote %s'%(args.out))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,496 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+#------------------------------------------------------------------------------
+#
+# bitSlicedConsole.py
+# Up to 64 consoles run at once on bit-sliced chips, see
+# circuitSimulatorBitSliced.py.  Each lane is a console with its own
+# ROM, PIA RAM, i/o and timer, joystick and console switches and TIA
+# input pads.  The half clock is the same as Sim2600Console's, with
+# the wires copied between the chips as lane masks, so it costs about
+# the same whichever lanes it applies to, and the ROM and PIA
+# accesses done lane by lane.
+#
+# Each lane starts as a Sim2600Console would, or from a snapshot, and
+# getLaneConsole() puts a lane's state in a Sim2600Console to save a
+# snapshot, compare state hashes or carry on one console at a time.
+# The TIA half clock count is shared, so lanes started from snapshots
+# must all be at the same one.
+#
+#   python bitSlicedConsole.py roms/Pitfall.bin roms/Asteroids.bin --lanes 64 --half-clocks 2000
+#   python bitSlicedConsole.py roms/Pitfall.bin --lanes 4 --half-clocks 2000 --verify
+#
+
+import argparse, os, sys, time
+from array import array
+import params
+import simBackends
+from sim6502 import Sim6502
+from simTIA import SimTIA
+from emuPIA import EmuPIA
+from sim2600Console import Sim2600Console
+from circuitSimulatorBitSliced import BitSlicedCircuitSimulator, maxLanes
+
+class ConsoleLane:
+    # The parts of a console that aren't chips
+    def __init__(self, console):
+        # console is a Sim2600Console running the lane's ROM.  Its
+        # chips are shared with other lanes' consoles, see
+        # BitSlicedConsole.getLaneConsole()
+        self.console = console
+        self.rom = console.rom
+        self.programLen = console.programLen
+        self.bankSwitchROMOffset = console.bankSwitchROMOffset
+        self.emuPIA = EmuPIA()
+        self.copyPIA(console.emuPIA, self.emuPIA)
+        self.cpuHalfClkCount = console.sim6507.halfClkCount
+        # TIA input pads I0-I5, high when not pressed
+        self.inputPadValue = (1 << len(params.tiaInputPadNames)) - 1
+
+    def copyPIA(self, src, dst):
+        dst.timerPeriod = src.timerPeriod
+        dst.timerValue = src.timerValue
+        dst.timerClockCount = src.timerClockCount
+        dst.timerFinished = src.timerFinished
+        dst.ram = array('B', src.ram)
+        dst.iot = array('B', src.iot)
+
+
+class BitSlicedConsole:
+    def __init__(self, romFilePaths, backendName=None):
+        """ romFilePaths has the ROM for each lane, up to 64.  The chips
+            are loaded once with backendName, which is only used to
+            set the lanes up and by getLaneConsole(). """
+        numLanes = len(romFilePaths)
+        if numLanes < 1 or numLanes > maxLanes:
+            raise RuntimeError('ERROR: Give from 1 to %d ROMs, one per lane'%(maxLanes))
+        self.numLanes = numLanes
+        self.allLanes = (1 << numLanes) - 1
+
+        # One Sim2600Console per ROM, all on one pair of chips.  The
+        # chips are set back to how they were after loading before each
+        # console starts, and each console's starting state is kept
+        # as a snapshot.
+        cpu = simBackends.makeChipClass(Sim6502, backendName)()
+        tia = simBackends.makeChipClass(SimTIA, backendName)()
+        self.chips = (cpu, tia)
+        loadedStates = (cpu.getChipState(), tia.getChipState())
+        romConsoles = dict()
+        for romFilePath in romFilePaths:
+            if not romFilePath in romConsoles:
+                cpu.setChipState(loadedStates[0])
+                tia.setChipState(loadedStates[1])
+                console = Sim2600Console(romFilePath, backendName, self.chips)
+                romConsoles[romFilePath] = (console, console.getSnapshot())
+
+        self.lanes = []
+        self.sim6507 = None
+        for lane, romFilePath in enumerate(romFilePaths):
+            console, snapshot = romConsoles[romFilePath]
+            console.restoreSnapshot(snapshot)
+            if self.sim6507 == None:
+                self.sim6507 = BitSlicedCircuitSimulator(cpu, numLanes)
+                self.simTIA = BitSlicedCircuitSimulator(tia, numLanes)
+            else:
+                self.sim6507.setLaneChipState(lane, cpu.getChipState())
+                self.simTIA.setLaneChipState(lane, tia.getChipState())
+            self.lanes.append(ConsoleLane(console))
+
+        self.initWireIndices()
+        self.updateInputPadLanes()
+
+    def initWireIndices(self):
+        cpu = self.sim6507
+        tia = self.simTIA
+        self.cpuAddressBusPads = [cpu.getWireIndex(name) for name in
+                                  params.cpuAddressBusPadNames]
+        self.cpuDataBusPads = [cpu.getWireIndex(name) for name in
+                               params.dataBusPadNames]
+        self.tiaAddressBusPads = [tia.getWireIndex(name) for name in
+                                  params.tiaAddressBusPadNames]
+        self.tiaDataBusPads = [tia.getWireIndex(name) for name in
+                               params.dataBusPadNames]
+        self.tiaInputPads = [tia.getWireIndex(name) for name in
+                             params.tiaInputPadNames]
+        self.tiaDataBusDrivers = [tia.getWireIndex(name) for name in
+                                  params.tiaDataBusDrivers]
+        self.cpuPadIndRW = cpu.getWireIndex('R/W')
+        self.cpuPadIndCLK0 = cpu.getWireIndex('CLK0')
+        self.cpuPadIndRDY = cpu.getWireIndex('RDY')
+        self.cpuPadIndCLK1Out = cpu.getWireIndex('CLK1OUT')
+        self.cpuPadIndSYNC = cpu.getWireIndex('SYNC')
+        self.cpuPadReset = cpu.getWireIndex('RES')
+        self.tiaPadIndRW = tia.getWireIndex('R/W')
+        self.tiaPadIndCLK0 = tia.getWireIndex('CLK0')
+        self.tiaPadIndCLK2 = tia.getWireIndex('CLK2')
+        self.tiaPadIndPH0 = tia.getWireIndex('PH0')
+        self.tiaPadIndsCS0CS3 = [tia.getWireIndex('CS0'), tia.getWireIndex('CS3')]
+        self.tiaPadIndDEL = tia.getWireIndex('del')
+        self.tiaIndRDY_lowCtrl = tia.getWireIndex('RDY_lowCtrl')
+        self.tiaIndDB6_drvLo = tia.getWireIndex('DB6_drvLo')
+        self.tiaIndDB6_drvHi = tia.getWireIndex('DB6_drvHi')
+        self.tiaIndDB7_drvLo = tia.getWireIndex('DB7_drvLo')
+        self.tiaIndDB7_drvHi = tia.getWireIndex('DB7_drvHi')
+
+    # Per lane inputs.  Each takes effect from the next half clock.
+    def setLaneInputPads(self, lane, value):
+        """ Sets the TIA input pads I0-I5 as the bits of value.  A bit is
+            0 when the pad is pulled low, like I4 with the left joystick's
+            button pressed. """
+        self.lanes[lane].inputPadValue = value
+        self.updateInputPadLanes()
+
+    def setLaneJoysticks(self, lane, value):
+        # The PIA's port A, read at 0x280.  A bit is 0 for a direction
+        # pressed.
+        self.lanes[lane].emuPIA.iot[0x280 - 0x280] = value
+
+    def setLaneSwitches(self, lane, value):
+        # The console switches, read at 0x282
+        self.lanes[lane].emuPIA.iot[0x282 - 0x280] = value
+
+    def updateInputPadLanes(self):
+        values = [lane.inputPadValue for lane in self.lanes]
+        self.inputPadHighLanes = self.simTIA.getValueLanes(values,
+                                                           len(self.tiaInputPads))
+
+    def restoreLaneSnapshot(self, lane, snapshot):
+        """ Sets one lane to a snapshot from Sim2600Console.getSnapshot()
+            of a console running the lane's ROM """
+        console = self.lanes[lane].console
+        console.restoreSnapshot(snapshot)
+        cpu, tia = self.chips
+        self.sim6507.setLaneChipState(lane, cpu.getChipState())
+        self.simTIA.setLaneChipState(lane, tia.getChipState())
+        inputPadValue = self.lanes[lane].inputPadValue
+        self.lanes[lane] = ConsoleLane(console)
+        self.lanes[lane].inputPadValue = inputPadValue
+
+    def getLaneConsole(self, lane):
+        """ Returns the lane's Sim2600Console set to the lane's state.
+            The consoles share one pair of chips, so it's only in that
+            state until getLaneConsole() is called for another lane. """
+        laneData = self.lanes[lane]
+        console = laneData.console
+        cpu, tia = self.chips
+        cpuState = self.sim6507.getLaneChipState(lane)
+        cpu.setChipState((laneData.cpuHalfClkCount,) + cpuState[1:])
+        tia.setChipState(self.simTIA.getLaneChipState(lane))
+        laneData.copyPIA(laneData.emuPIA, console.emuPIA)
+        console.bankSwitchROMOffset = laneData.bankSwitchROMOffset
+        return console
+
+    def getLaneStateHash(self, lane):
+        # Sim2600Console.getStateHash() for the lane
+        return self.getLaneConsole(lane).getStateHash()
+
+    def getLaneSnapshot(self, lane):
+        return self.getLaneConsole(lane).getSnapshot()
+
+    def getLanes(self, mask):
+        # The lane numbers in a lane mask
+        return [lane for lane in xrange(self.numLanes) if (mask >> lane) & 1]
+
+    def readMemory(self, lane, addr, tiaDrivesLanes):
+        # Sim2600Console.readMemory() for one lane, without setting the
+        # data bus.  tiaDrivesLanes has the masks of DB6_drvLo,
+        # DB6_drvHi, DB7_drvLo and DB7_drvHi, or None during SYNC.
+        # Returns None if the lane's data bus shouldn't be set.
+        laneData = self.lanes[lane]
+        pia = laneData.emuPIA
+        if addr > 0x02FF and addr < 0x8000:
+            print('ERROR: lane %d 6507 ROM reading addr from 0x1000 to 0x1FFF: 0x%X'%
+                  (lane, addr))
+            return None
+
+        data = 0
+        if (addr >= 0x80 and addr <= 0xFF) or (addr >= 0x180 and addr <= 0x1FF):
+            data = pia.ram[(addr & 0xFF) - 0x80]
+        elif addr >= 0x0280 and addr <= 0x0297:
+            data = pia.iot[addr - 0x0280]
+        elif addr >= 0xF000 or \
+             (addr >= 0xD000 and addr <= 0xDFFF and laneData.programLen == 8192):
+            data = laneData.rom[addr - 0xF000 + laneData.bankSwitchROMOffset]
+        elif addr >= 0x30 and addr <= 0x3D:
+            # TIA read, handled by the drive-low and drive-high wires
+            pass
+        elif addr <= 0x2C or (addr >= 0x100 and addr <= 0x12C):
+            # Reads from TIA write-only addresses happen all the time
+            pass
+        else:
+            print('WARNING: lane %d unhandled address in readMemory: 0x%4.4X'%
+                  (lane, addr))
+
+        if tiaDrivesLanes != None:
+            db6Lo, db6Hi, db7Lo, db7Hi = [(mask >> lane) & 1 for mask in tiaDrivesLanes]
+            if db6Lo:
+                data = data & (0xFF ^ (1<<6))
+            if db6Hi:
+                data = data | (1<<6)
+            if db7Lo:
+                data = data & (0xFF ^ (1<<7))
+            if db7Hi:
+                data = data | (1<<7)
+        return data
+
+    def writeMemory(self, lane, addr, byteValue, resetLanes):
+        # Sim2600Console.writeMemory() for one lane, without the
+        # message for each write
+        laneData = self.lanes[lane]
+        pia = laneData.emuPIA
+        if (resetLanes >> lane) & 1:
+            print('Skipping 6507 write during reset in lane %d.  addr: 0x%X'%
+                  (lane, addr))
+            return
+
+        if addr >= 0xF000:
+            if laneData.programLen == 8192:
+                if addr == 0xFFF9:
+                    laneData.bankSwitchROMOffset = 0x2000
+                elif addr == 0xFFF8:
+                    laneData.bankSwitchROMOffset = 0x1000
+            else:
+                raise RuntimeError('ERROR: lane %d 6507 writing to ROM space '%(lane) +
+                                   'addr 0x%4.4X data 0x%2.2X'%(addr, byteValue))
+
+        if addr == 0x282 or addr == 0x280:
+            print('ERROR: lane %d 6507 writing to console or joystick '%(lane) +
+                  'switches addr 0x%4.4X  data 0x%2.2X'%(addr, byteValue))
+            return
+
+        if (addr >= 0x80 and addr <= 0xFF) or (addr >= 0x180 and addr <= 0x1FF):
+            pia.ram[(addr & 0xFF) - 0x80] = byteValue
+        elif addr >= 0x0280 and addr <= 0x0297:
+            pia.iot[addr - 0x0280] = byteValue
+            period = None
+            if addr == 0x294:
+                period = 1
+            elif addr == 0x295:
+                period = 8
+            elif addr == 0x296:
+                period = 64
+            elif addr == 0x297:
+                period = 1024
+            if period != None:
+                # As Sim2600Console does, the value written is kept in
+                # timerVal and the timer counts on from timerValue
+                pia.timerPeriod = period
+                pia.timerVal = byteValue
+                pia.timerClockCount = 0
+                pia.timerFinished = False
+
+    def checkDataBusDrivers(self):
+        tia = self.simTIA
+        driving = 0
+        for wireIndex in self.tiaDataBusDrivers:
+            driving |= tia.getHighLanes(wireIndex)
+        bad = driving & self.sim6507.getHighLanes(self.cpuPadIndSYNC)
+        if bad != 0:
+            print('ERROR: TIA driving DB when 6502 fetching instruction in lanes %s'%
+                  (self.getLanes(bad)))
+
+    def advanceOneHalfClock(self):
+        # Sim2600Console.advanceOneHalfClock() with every wire copied
+        # as a lane mask
+        cpu = self.sim6507
+        tia = self.simTIA
+        allLanes = self.allLanes
+
+        changedPads = []
+        tia.setPulledList(self.tiaInputPads, self.inputPadHighLanes, changedPads)
+        tia.setPulledList([self.tiaPadIndDEL], [allLanes], changedPads)
+        tia.setPulledList([self.tiaPadIndRW], [cpu.getHighLanes(self.cpuPadIndRW)],
+                          changedPads)
+        tia.setPulledList(self.tiaAddressBusPads,
+                          [cpu.getHighLanes(i) for i in
+                           self.cpuAddressBusPads[:len(self.tiaAddressBusPads)]],
+                          changedPads)
+        # The address is above 0x7F, not a TIA address, when any of
+        # AB7 and up is high
+        notTIAAddr = 0
+        for wireIndex in self.cpuAddressBusPads[7:]:
+            notTIAAddr |= cpu.getHighLanes(wireIndex)
+        tia.setPulledList(self.tiaPadIndsCS0CS3, [notTIAAddr, notTIAAddr], changedPads)
+        tia.setPulledList(self.tiaDataBusPads,
+                          [cpu.getHighLanes(i) for i in self.cpuDataBusPads],
+                          changedPads)
+        if len(changedPads) > 0:
+            tia.recalcWireList(changedPads)
+        self.checkDataBusDrivers()
+
+        changed = tia.setPulled(self.tiaPadIndCLK2,
+                                cpu.getHighLanes(self.cpuPadIndCLK1Out))
+        if changed != 0:
+            tia.recalcWire(self.tiaPadIndCLK2, changed)
+
+        tia.setPulled(self.tiaPadIndCLK0, ~tia.getHighLanes(self.tiaPadIndCLK0))
+        tia.recalcWire(self.tiaPadIndCLK0)
+        tia.halfClkCount += 1
+
+        changed = cpu.setPulled(self.cpuPadIndRDY,
+                                ~tia.getHighLanes(self.tiaIndRDY_lowCtrl))
+        if changed != 0:
+            cpu.recalcWire(self.cpuPadIndRDY, changed)
+
+        # Lanes whose 6507 clock follows the TIA's PH0 this half clock
+        clkHighLanes = tia.getHighLanes(self.tiaPadIndPH0)
+        clkLanes = (clkHighLanes ^ cpu.getHighLanes(self.cpuPadIndCLK0)) & allLanes
+        if clkLanes == 0:
+            return
+
+        resetLanes = cpu.getLowLanes(self.cpuPadReset)
+        for lane in self.getLanes(clkLanes):
+            laneData = self.lanes[lane]
+            pia = laneData.emuPIA
+            if (clkHighLanes >> lane) & 1:
+                # The PIA timer
+                if pia.timerFinished:
+                    pia.timerValue -= 1
+                    if pia.timerValue < 0:
+                        pia.timerValue = 0
+                else:
+                    pia.timerClockCount += 1
+                    if pia.timerClockCount >= pia.timerPeriod:
+                        pia.timerValue -= 1
+                        pia.timerClockCount = 0
+                        if pia.timerValue < 0:
+                            pia.timerFinished = True
+                            pia.timerValue = 0xFF
+            else:
+                self.writeMemory(lane, 0x284, pia.timerValue, resetLanes)
+            laneData.cpuHalfClkCount += 1
+
+        cpu.setPulled(self.cpuPadIndCLK0, clkHighLanes, clkLanes)
+        cpu.recalcWire(self.cpuPadIndCLK0, clkLanes)
+        cpu.halfClkCount += 1
+
+        clkHighLanes = cpu.getHighLanes(self.cpuPadIndCLK0) & clkLanes
+        readLanes = cpu.getHighLanes(self.cpuPadIndRW)
+        writeLanes = clkHighLanes & ~readLanes
+        readLanes &= clkLanes & ~clkHighLanes
+        if writeLanes == 0 and readLanes == 0:
+            return
+
+        addrs = cpu.getLaneValues(self.cpuAddressBusPads)
+        if writeLanes != 0:
+            datas = cpu.getLaneValues(self.cpuDataBusPads)
+            resetLanes = cpu.getLowLanes(self.cpuPadReset)
+            for lane in self.getLanes(writeLanes):
+                self.writeMemory(lane, addrs[lane], datas[lane], resetLanes)
+        if readLanes != 0:
+            tiaDrivesLanes = [tia.getHighLanes(i) for i in
+                              [self.tiaIndDB6_drvLo, self.tiaIndDB6_drvHi,
+                               self.tiaIndDB7_drvLo, self.tiaIndDB7_drvHi]]
+            syncLanes = cpu.getHighLanes(self.cpuPadIndSYNC)
+            datas = [0] * self.numLanes
+            for lane in self.getLanes(readLanes):
+                drives = tiaDrivesLanes
+                if (syncLanes >> lane) & 1:
+                    drives = None
+                data = self.readMemory(lane, addrs[lane], drives)
+                if data == None:
+                    # Sim2600Console.readMemory() leaves the bus alone
+                    readLanes &= ~(1 << lane)
+                else:
+                    datas[lane] = data
+            changedPads = []
+            cpu.setPulledList(self.cpuDataBusPads,
+                              cpu.getValueLanes(datas, len(self.cpuDataBusPads)),
+                              changedPads, readLanes)
+            if len(changedPads) > 0:
+                cpu.recalcWireList(changedPads)
+
+    def advanceToHalfClock(self, halfClkCount):
+        while self.simTIA.halfClkCount < halfClkCount:
+            self.advanceOneHalfClock()
+
+
+def getArgParser():
+    parser = argparse.ArgumentParser(description='Run up to 64 consoles at ' +
+                 'once on bit-sliced chips, and optionally check each lane ' +
+                 'against a console run on its own.')
+    parser.add_argument('romFiles', nargs='+',
+                        help='cartridge ROM files, given to the lanes in turn')
+    parser.add_argument('--lanes', type=int, default=None,
+                        help='number of lanes.  Default is one per ROM')
+    parser.add_argument('--half-clocks', type=int, default=2000, dest='halfClocks',
+                        help='TIA half clocks to run')
+    parser.add_argument('--backend', default=None,
+                        help='circuit simulator backend for setting the lanes ' +
+                             'up and for --verify')
+    parser.add_argument('--verify', action='store_true',
+                        help="run each ROM's console on its own too and compare " +
+                             'its state hash with its lanes at the end')
+    return parser
+
+def main(argv):
+    args = getArgParser().parse_args(argv)
+    numLanes = args.lanes
+    if numLanes == None:
+        numLanes = len(args.romFiles)
+    romFilePaths = [args.romFiles[i % len(args.romFiles)] for i in xrange(numLanes)]
+
+    # Setting the chips up prints a lot for each lane, so only that is
+    # silenced.  Messages from the run, like bad addresses, still show.
+    stdout = sys.stdout
+    start = time.time()
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        sim = BitSlicedConsole(romFilePaths, args.backend)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    initSec = time.time() - start
+    start = time.time()
+    sim.advanceToHalfClock(args.halfClocks)
+    runSec = time.time() - start
+    print('%d lanes, %d half clocks in %.1f sec (%.1f sec to set up), '%
+          (numLanes, args.halfClocks, runSec, initSec) +
+          '%.1f half clocks/sec, %.1f lane half clocks/sec'%
+          (args.halfClocks / runSec, numLanes * args.halfClocks / runSec))
+    hashes = [sim.getLaneStateHash(lane) for lane in xrange(numLanes)]
+    for lane in xrange(numLanes):
+        print('lane %2d %016x %s'%(lane, hashes[lane], romFilePaths[lane]))
+
+    if not args.verify:
+        return 0
+    numBad = 0
+    for romFilePath in sorted(set(romFilePaths)):
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            console = Sim2600Console(romFilePath, args.backend)
+            console.advanceToHalfClock(args.halfClocks)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        expected = console.getStateHash()
+        for lane in xrange(numLanes):
+            if romFilePaths[lane] == romFilePath and hashes[lane] != expected:
+                print('lane %d differs from %s run alone: %016x'%
+                      (lane, romFilePath, expected))
+                numBad += 1
+    if numBad == 0:
+        print('All lanes match their consoles run alone')
+        return 0
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,237 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+#------------------------------------------------------------------------------
+#
+# channelComponents.py
+# Splits a chip's wires into channel-connected components: the sets of
+# wires joined by transistor channels (side1 to side2), whatever the
+# states of the gates.  VSS and VCC are left out, as the simulators
+# never walk through them, so every group of wires the simulators find
+# lies within one component.
+#
+# Transistors joining the same two wires, or a wire and VSS or VCC,
+# are one edge of their component, which is on when any of them is.
+# For a component with at most maxTableEdges edges, the states of its
+# edges, as the bits of an integer, are a pattern, and the component's
+# table gives the group of each of its wires for every pattern:
+#   table[pattern * len(wires) + local index of the wire]
+#       = (wires of the group, in the order the simulators' depth-first
+#          walk from the wire adds them, VSS and VCC in the group as
+#          Wire.GROUNDED | Wire.HIGH, number of wires in the group
+#          counting VSS and VCC)
+# The walk follows each wire's transistors in the order of the netlist
+# arrays' WIRE_CT lists.  When two wires are joined by more than one
+# transistor, the order depends on which of them are on, not just on
+# the edge, so those components get no table.
+# See circuitSimulatorUsingTables.py.  For the sizes of the components
+# of the chips:
+#   python channelComponents.py
+#
+
+from wire import Wire
+
+class ChannelComponents:
+    def __init__(self, numWires, fetSide1, fetSide2, wireCtOffsets,
+                 wireCtFets, wireCtOthers, gndWireIndex, vccWireIndex,
+                 maxTableEdges = 8):
+        """ fetSide1 and fetSide2 are the side wires of each transistor,
+            -1 for transistors that don't exist.  wireCtOffsets,
+            wireCtFets and wireCtOthers are the WIRE_CT arrays of
+            getNetlistArrays(). """
+        self.numWires = numWires
+        self.wireCtOffsets = wireCtOffsets
+        self.wireCtFets = wireCtFets
+        self.wireCtOthers = wireCtOthers
+        self.gndWireIndex = gndWireIndex
+        self.vccWireIndex = vccWireIndex
+        self.maxTableEdges = maxTableEdges
+        numFets = len(fetSide1)
+
+        def isPower(wireIndex):
+            return wireIndex == gndWireIndex or wireIndex == vccWireIndex
+
+        # Union find over the channels that don't touch VSS or VCC
+        parent = range(numWires)
+        def find(wireIndex):
+            while parent[wireIndex] != wireIndex:
+                parent[wireIndex] = parent[parent[wireIndex]]
+                wireIndex = parent[wireIndex]
+            return wireIndex
+        for t in xrange(numFets):
+            side1 = fetSide1[t]
+            side2 = fetSide2[t]
+            if side1 < 0 or isPower(side1) or isPower(side2):
+                continue
+            root1 = find(side1)
+            root2 = find(side2)
+            if root1 != root2:
+                parent[root1] = root2
+
+        # Components numbered in order of their lowest wire
+        self.wireComponent = [-1] * numWires
+        self.wireLocalIndex = [-1] * numWires
+        self.componentWires = []
+        rootComponent = dict()
+        for wireIndex in xrange(numWires):
+            if isPower(wireIndex):
+                continue
+            root = find(wireIndex)
+            if not root in rootComponent:
+                rootComponent[root] = len(self.componentWires)
+                self.componentWires.append([])
+            component = rootComponent[root]
+            wires = self.componentWires[component]
+            self.wireComponent[wireIndex] = component
+            self.wireLocalIndex[wireIndex] = len(wires)
+            wires.append(wireIndex)
+
+        # fetEdge[t] is the edge of transistor t, -1 if it's between VSS
+        # and VCC, or its sides are one wire, or it doesn't exist
+        numComponents = len(self.componentWires)
+        self.fetEdge = [-1] * numFets
+        self.edgeComponent = []
+        self.edgeBit = []
+        self.edgeSides = []
+        self.componentEdges = [[] for c in xrange(numComponents)]
+        pairEdge = dict()
+        orderByFets = set()
+        for t in xrange(numFets):
+            side1 = fetSide1[t]
+            side2 = fetSide2[t]
+            if side1 < 0 or side1 == side2 or (isPower(side1) and isPower(side2)):
+                continue
+            key = (min(side1, side2), max(side1, side2))
+            if not key in pairEdge:
+                if isPower(side1):
+                    component = self.wireComponent[side2]
+                else:
+                    component = self.wireComponent[side1]
+                edges = self.componentEdges[component]
+                pairEdge[key] = len(self.edgeComponent)
+                self.edgeComponent.append(component)
+                self.edgeBit.append(1 << len(edges))
+                self.edgeSides.append(key)
+                edges.append(pairEdge[key])
+            elif not isPower(side1) and not isPower(side2):
+                orderByFets.add(self.wireComponent[side1])
+            self.fetEdge[t] = pairEdge[key]
+
+        self.componentTables = [None] * numComponents
+        for component in xrange(numComponents):
+            if len(self.componentEdges[component]) <= maxTableEdges and \
+               not component in orderByFets:
+                self.componentTables[component] = self.buildTable(component)
+
+    def buildTable(self, component):
+        wires = self.componentWires[component]
+        numWires = len(wires)
+        gndWireIndex = self.gndWireIndex
+        vccWireIndex = self.vccWireIndex
+        wireLocalIndex = self.wireLocalIndex
+        edgeIndex = dict((edge, i) for i, edge in
+                         enumerate(self.componentEdges[component]))
+        # The transistors of each wire in WIRE_CT order, as (local index
+        # of the other side, bit of the edge), VSS and VCC being numWires
+        # and numWires + 1
+        localIndex = {gndWireIndex: numWires, vccWireIndex: numWires + 1}
+        neighbors = []
+        for wireIndex in wires:
+            wireNeighbors = []
+            for pos in xrange(self.wireCtOffsets[wireIndex],
+                              self.wireCtOffsets[wireIndex + 1]):
+                edge = self.fetEdge[self.wireCtFets[pos]]
+                if edge < 0:
+                    continue
+                other = self.wireCtOthers[pos]
+                wireNeighbors.append((localIndex.get(other, wireLocalIndex[other]),
+                                      1 << edgeIndex[edge]))
+            neighbors.append(wireNeighbors)
+
+        table = []
+        for pattern in xrange(1 << len(edgeIndex)):
+            for local in xrange(numWires):
+                table.append(self.walkGroup(local, pattern, neighbors, wires))
+        return table
+
+    def walkGroup(self, start, pattern, neighbors, wires):
+        # The group of local wire start for an edge pattern, walked
+        # depth first without walking through VSS or VCC, as the
+        # simulators do
+        numWires = len(wires)
+        members = [start]
+        power = 0
+        groupLen = 1
+        found = set([start])
+        stack = [[start, 0]]
+        while len(stack) > 0:
+            top = stack[-1]
+            wireNeighbors = neighbors[top[0]]
+            pos = top[1]
+            while pos < len(wireNeighbors):
+                other, bit = wireNeighbors[pos]
+                pos += 1
+                if not pattern & bit or other in found:
+                    continue
+                found.add(other)
+                groupLen += 1
+                if other == numWires:
+                    power |= Wire.GROUNDED
+                elif other == numWires + 1:
+                    power |= Wire.HIGH
+                else:
+                    members.append(other)
+                    stack.append([other, 0])
+                break
+            else:
+                stack.pop()
+                continue
+            top[1] = pos
+        return (tuple([wires[local] for local in members]), power, groupLen)
+
+    def getSummary(self):
+        """ Returns (number of components, number with tables, wires in
+            components with tables, table entries) """
+        numTables = 0
+        numTableWires = 0
+        numEntries = 0
+        for component, table in enumerate(self.componentTables):
+            if table != None:
+                numTables += 1
+                numTableWires += len(self.componentWires[component])
+                numEntries += len(table)
+        return (len(self.componentWires), numTables, numTableWires, numEntries)
+
+
+if __name__ == '__main__':
+    import simBackends
+    from sim6502 import Sim6502
+    from simTIA import SimTIA
+    for chipClass in [Sim6502, SimTIA]:
+        chip = simBackends.makeChipClass(chipClass, 'arrays')()
+        components = ChannelComponents(chip.numWires, chip.fetSide1,
+                                       chip.fetSide2, chip.wireCtOffsets,
+                                       chip.wireCtFets, chip.wireCtOthers,
+                                       chip.gndWireIndex, chip.vccWireIndex)
+        numComponents, numTables, numTableWires, numEntries = components.getSummary()
+        print('%s: %d wires in %d components, %d with tables holding ' %
+              (chipClass.__name__, chip.numWires - 2, numComponents, numTables) +
+              '%d wires and %d entries' % (numTableWires, numEntries))
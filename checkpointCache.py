@@ -0,0 +1,174 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+#------------------------------------------------------------------------------
+#
+# checkpointCache.py
+# A directory of console snapshots (see Sim2600Console.getSnapshot) that
+# lets repeated runs of a ROM start from a saved state instead of from
+# reset.  Each checkpoint's file name holds its key:
+#    <ROM SHA-1>_<6502 netlist hash>_<TIA netlist hash>_<TIA half clock>.snap
+# so the cache needs no index file and can be shared by several
+# processes.  The hashes are truncated to 16 hex digits in file names.
+#
+# When the files in the directory add up to more than maxBytes, the least
+# recently used checkpoints are deleted.  A file's modification time is
+# its last use, and is updated whenever the checkpoint is loaded.
+#
+
+import os, time
+
+fileExtension = '.snap'
+hashDigits = 16
+
+class CheckpointCache:
+    def __init__(self, cacheDir, maxBytes):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.numHits = 0
+        self.numMisses = 0
+        self.numSaved = 0
+        self.numEvicted = 0
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+
+    def getKeyPrefix(self, key):
+        # key is a tuple of hex strings: (ROM hash, 6502 netlist hash,
+        # TIA netlist hash)
+        return '_'.join([hexStr[:hashDigits] for hexStr in key]) + '_'
+
+    def getFilePath(self, key, halfClkCount):
+        return os.path.join(self.cacheDir, '%s%012d%s'%
+                            (self.getKeyPrefix(key), halfClkCount, fileExtension))
+
+    def getHalfClkCounts(self):
+        """ Returns a dict of key prefix : list of the half clock counts
+            of the checkpoints stored for that key """
+        counts = dict()
+        for fileName in os.listdir(self.cacheDir):
+            if not fileName.endswith(fileExtension):
+                continue
+            prefix, sep, countStr = fileName[:-len(fileExtension)].rpartition('_')
+            if sep == '' or not countStr.isdigit():
+                continue
+            counts.setdefault(prefix + '_', []).append(int(countStr))
+        return counts
+
+    def contains(self, key, halfClkCount):
+        return os.path.exists(self.getFilePath(key, halfClkCount))
+
+    def findNearest(self, key, maxHalfClkCount=None, minHalfClkCount=0):
+        """ Returns the largest half clock count of a checkpoint for key
+            from minHalfClkCount up to maxHalfClkCount, or None if there
+            isn't one.  If maxHalfClkCount is None, there's no limit. """
+        best = None
+        counts = self.getHalfClkCounts().get(self.getKeyPrefix(key), [])
+        for count in counts:
+            if count < minHalfClkCount:
+                continue
+            if maxHalfClkCount != None and count > maxHalfClkCount:
+                continue
+            if best == None or count > best:
+                best = count
+        return best
+
+    def loadNearest(self, key, maxHalfClkCount=None, minHalfClkCount=0):
+        """ Returns (half clock count, snapshot string) of the checkpoint
+            found by findNearest(), or (None, None) if there isn't one """
+        halfClkCount = self.findNearest(key, maxHalfClkCount, minHalfClkCount)
+        if halfClkCount == None:
+            self.numMisses += 1
+            return None, None
+
+        filePath = self.getFilePath(key, halfClkCount)
+        try:
+            of = open(filePath, 'rb')
+            snapshot = of.read()
+            of.close()
+        except (IOError, OSError):
+            # Another process may have evicted it
+            self.numMisses += 1
+            return None, None
+        self.touch(filePath)
+        self.numHits += 1
+        return halfClkCount, snapshot
+
+    def save(self, key, halfClkCount, snapshot):
+        filePath = self.getFilePath(key, halfClkCount)
+        # Write to a temporary file and rename it, so other processes
+        # never see a partly written checkpoint.
+        tmpPath = '%s.%d.tmp'%(filePath, os.getpid())
+        of = open(tmpPath, 'wb')
+        of.write(snapshot)
+        of.close()
+        if os.path.exists(filePath):
+            os.remove(filePath)
+        os.rename(tmpPath, filePath)
+        self.numSaved += 1
+        self.evict()
+
+    def touch(self, filePath):
+        try:
+            now = time.time()
+            os.utime(filePath, (now, now))
+        except OSError:
+            pass
+
+    def getTotalBytes(self):
+        total = 0
+        for fileName, size, lastUsed in self.getFileInfo():
+            total += size
+        return total
+
+    def getFileInfo(self):
+        # list of (file name, size in bytes, last use time)
+        info = []
+        for fileName in os.listdir(self.cacheDir):
+            if not fileName.endswith(fileExtension):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cacheDir, fileName))
+            except OSError:
+                continue
+            info.append((fileName, st.st_size, st.st_mtime))
+        return info
+
+    def evict(self):
+        """ Deletes least recently used checkpoints until the cache holds
+            no more than maxBytes """
+        if self.maxBytes == None:
+            return
+        info = self.getFileInfo()
+        total = sum([size for fileName, size, lastUsed in info])
+        info.sort(key=lambda fileInfo: fileInfo[2])
+        for fileName, size, lastUsed in info:
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(os.path.join(self.cacheDir, fileName))
+            except OSError:
+                continue
+            total -= size
+            self.numEvicted += 1
+
+    def getStatsStr(self):
+        return 'checkpoints: %d hits, %d misses, %d saved, %d evicted'% \
+               (self.numHits, self.numMisses, self.numSaved, self.numEvicted)
@@ -18,8 +18,12 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import os, pickle, traceback
+import os, pickle, traceback, hashlib, struct, operator, random
 from array import array
+import netlistFile
+from wireBus import WireBus
+from recalcCache import RecalcCache
+from recalcStats import RecalcStats
 from nmosFet import NmosFet
 from wire import Wire
 
@@ -28,17 +32,56 @@ class CircuitSimulatorBase:
         self.name = ''
         self.wireList = None        # wireList[i] is a Wire.  wireList[i].index = i
         self.transistorList = None
+        # A derived class may keep its netlist only in arrays, leaving
+        # wireList and transistorList as None.  These are always set.
+        self.numWires = 0
+        self.numFets = 0
+        self.netlistHash = None     # see getNetlistHash()
         self.wireNames = dict()     # key is string wire names, value is integer wire index
         self.halfClkCount = 0       # the number of half clock cycles (low to high or high to low)
                                     # that the simulation has run
 
         self.recalcArray = None
 
+        # If True, loadCircuit() calls collapseStaticWires() to merge
+        # wires that are always connected.  staticWireRep[i] is then
+        # the index of the wire that stands in for wire i.
+        self.collapseStaticNetlist = False
+        self.staticWireRep = None
+
+        # Simulation is not allowed to try more than this many
+        # iterations of doRecalcIterations() to settle the circuit.
+        self.recalcStepLimit = 400
+
+        # If not None, a RecalcCache of recalc results.  See
+        # enableRecalcCache()
+        self.recalcCache = None
+        # While a recalc missed in the cache runs, lists of the indices
+        # of the wires and transistors whose states it changed, which
+        # may repeat.  Appended to where the state hash is updated.
+        self.changedWires = None
+        self.changedFets = None
+        # If not None, a RecalcStats counting the work done by each
+        # recalc.  See enableRecalcStats()
+        self.recalcStats = None
+
+        # Zobrist hash of the chip's wire, gate and pulled states, kept
+        # up to date as they change.  See initStateHash()
+        self.stateHash = 0
+        self.wireHashKeys = None
+        self.pulledHashKeys = None
+        self.fetHashKeys = None
+
         # Performance / diagnostic info as sim progresses
         self.numAddWireToGroup = 0
         self.numAddWireTransistor = 0
         # General sense of how much work it's doing
         self.numWiresRecalculated = 0
+        # Number of recalcs run, the iterations they took in total,
+        # and the most any one of them took
+        self.numRecalcs = 0
+        self.numRecalcSteps = 0
+        self.maxRecalcSteps = 0
         
         # If not None, call this to add a line to some log
         self.callback_addLogStr = None   # callback_addLogStr ('some text')
@@ -46,10 +89,17 @@ class CircuitSimulatorBase:
     def clearSimStats(self):
         self.numAddWireToGroup = 0
         self.numAddWireTransistor = 0
+        self.numRecalcs = 0
+        self.numRecalcSteps = 0
+        self.maxRecalcSteps = 0
 
     def getWireIndex(self, wireNameStr):
         return self.wireNames[wireNameStr]
 
+    def makeWireBus(self, wireNames):
+        # A WireBus of the named wires, least significant bit first
+        return WireBus(self, [self.getWireIndex(name) for name in wireNames])
+
     def recalcNamedWire(self, wireNameStr):
         self.recalcWireList([self.wireNames[wireNameStr]])
 
@@ -63,6 +113,9 @@ class CircuitSimulatorBase:
 
     def recalcAllWires(self):
         """ Not fast.  Meant only for setting initial conditions """
+        if self.wireList == None:
+            self.recalcWireList (range(self.numWires))
+            return
         wireInds = []
         for ind, wire in enumerate(self.wireList):
             if wire != None:
@@ -71,7 +124,7 @@ class CircuitSimulatorBase:
         
     def prepForRecalc(self):
         if self.recalcArray == None:
-            self.recalcCap = len(self.transistorList)
+            self.recalcCap = max(self.numFets, self.numWires)
             # Using lists [] for these is faster than using array('B'/'L', ...)
             self.recalcArray = [False] * self.recalcCap
             self.recalcOrder = [0] * self.recalcCap
@@ -82,6 +135,13 @@ class CircuitSimulatorBase:
         self.lastRecalcOrder = 0
         
     def recalcWireList(self, nwireList):
+        if self.recalcCache != None:
+            key = (self.stateHash, tuple(nwireList))
+            if self.replayRecalc(key):
+                return
+            self.changedWires = []
+            self.changedFets = []
+
         self.prepForRecalc()
 
         for wireIndex in nwireList:
@@ -95,7 +155,17 @@ class CircuitSimulatorBase:
             
         self.doRecalcIterations()
 
+        if self.recalcCache != None:
+            self.recordRecalc(key)
+
     def recalcWire(self, wireIndex):
+        if self.recalcCache != None:
+            key = (self.stateHash, wireIndex)
+            if self.replayRecalc(key):
+                return
+            self.changedWires = []
+            self.changedFets = []
+
         self.prepForRecalc()
 
         self.recalcOrder[self.lastRecalcOrder] = wireIndex
@@ -104,12 +174,124 @@ class CircuitSimulatorBase:
 
         self.doRecalcIterations()
 
+        if self.recalcCache != None:
+            self.recordRecalc(key)
+
+    # Memoized recalcs.  The result of recalculating a list of wires
+    # depends only on the wire, gate and pulled states before it and on
+    # the list, so the state hash and the list are the key.  Only the
+    # wires and transistors the recalc changed are stored under it, as
+    # lists of indices and new states, and a hit sets just those.  The
+    # simulators note each change where they update the state hash, so
+    # a miss costs little more than the recalc itself.
+    def enableRecalcCache(self, maxEntries):
+        """ Turns on memoized recalcs, remembering up to maxEntries
+            results.  maxEntries of 0 turns them off. """
+        self.recalcCache = None
+        if maxEntries > 0:
+            self.recalcCache = RecalcCache(maxEntries)
+
+    def replayRecalc(self, key):
+        # Returns True if the result of the recalc was in the cache
+        # and has been applied
+        result = self.recalcCache.get(key)
+        if result == None:
+            return False
+        wireIndices, wireStates, fetIndices, gateStates, stateHash = result
+        if len(wireIndices) > 0:
+            self.setWireStateList(wireIndices, wireStates)
+        if len(fetIndices) > 0:
+            self.setGateStateList(fetIndices, gateStates)
+        self.stateHash = stateHash
+        return True
+
+    def recordRecalc(self, key):
+        wireIndices, wireStates, fetIndices, gateStates = self.getRecalcChanges()
+        self.recalcCache.put(key, (wireIndices, wireStates, fetIndices, gateStates,
+                                   self.stateHash))
+
+    def getRecalcChanges(self):
+        # The indices and new states of the wires and transistors the
+        # recalc that just ran changed, from changedWires and changedFets
+        wireIndices = tuple(set(self.changedWires))
+        fetIndices = tuple(set(self.changedFets))
+        self.changedWires = None
+        self.changedFets = None
+        return (wireIndices, self.getWireStateList(wireIndices),
+                fetIndices, self.getGateStateList(fetIndices))
+
+    def enableRecalcStats(self, clockWireName='CLK0'):
+        """ Starts counting the recalcs of each wire, the toggles of each
+            transistor, group sizes and recalc iterations, split by the
+            state of the named clock wire.  Returns the RecalcStats. """
+        if self.recalcStats == None:
+            clockWireIndex = self.wireNames.get(clockWireName)
+            self.recalcStats = RecalcStats(self, clockWireIndex)
+        self.recalcStats.install()
+        return self.recalcStats
+
+    def disableRecalcStats(self):
+        """ Stops counting.  The counts so far are kept in
+            self.recalcStats. """
+        if self.recalcStats != None:
+            self.recalcStats.uninstall()
+
+    # The state hash is the XOR of a random 63 bit key for each wire's
+    # state, each wire's pulled state and each transistor whose gate is
+    # high.  When one of those changes, the hash is updated by XORing
+    # out the old key and XORing in the new one, so keeping it current
+    # costs a couple of operations per change instead of a pass over
+    # the whole chip.  Keys are 63 bits so the hash stays a plain int.
+    # The keys are seeded with the netlist hash, so a chip in a given
+    # state has the same state hash in every run and every simulator.
+    def initStateHash(self):
+        """ Makes the hash keys and computes the state hash.  Called by
+            the simulators once their netlist and state are loaded. """
+        rand = random.Random(int(self.getNetlistHash(), 16))
+        zeros = [0] * self.numWires
+        def makeKeys(states):
+            keys = [None] * (Wire.FLOATING_LOW + 1)
+            # A wire that isn't pulled, or a wire that's None
+            keys[0] = zeros
+            for state in states:
+                keys[state] = [rand.getrandbits(63) for i in xrange(self.numWires)]
+            return keys
+        self.wireHashKeys = makeKeys([Wire.PULLED_HIGH, Wire.PULLED_LOW,
+                                      Wire.GROUNDED, Wire.HIGH,
+                                      Wire.FLOATING_HIGH, Wire.FLOATING_LOW])
+        self.pulledHashKeys = makeKeys([Wire.PULLED_HIGH, Wire.PULLED_LOW])
+        self.fetHashKeys = [rand.getrandbits(63) for i in xrange(self.numFets)]
+        self.resetStateHash()
+
+    def computeStateHash(self):
+        """ Computes the state hash from scratch """
+        h = 0
+        wireKeys = self.wireHashKeys
+        pulledKeys = self.pulledHashKeys
+        wireStates = self.getWireStates()
+        pulledStates = self.getPulledStates()
+        for i in xrange(self.numWires):
+            h ^= wireKeys[wireStates[i]][i] ^ pulledKeys[pulledStates[i]][i]
+        fetKeys = self.fetHashKeys
+        for i, gateState in enumerate(self.getGateStates()):
+            if gateState == NmosFet.GATE_HIGH:
+                h ^= fetKeys[i]
+        return h
+
+    def resetStateHash(self):
+        """ Recomputes the state hash after states were changed without
+            updating it, as setWireStates() and friends do """
+        self.stateHash = self.computeStateHash()
+
+    def getStateHash(self):
+        return self.stateHash
+
     def doRecalcIterations(self):
         # Simulation is not allowed to try more than 'stepLimit' 
         # iterations.  If it doesn't converge by then, raise an 
         # exception.
         step = 0
-        stepLimit = 400
+        stepLimit = self.recalcStepLimit
         
         while step < stepLimit:
             #print('Iter %d, num to recalc %d, %s'%(step, self.lastRecalcOrder,
@@ -140,25 +322,15 @@ class CircuitSimulatorBase:
 
             step += 1
 
-        # The first attempt to compute the state of a chip's circuit
-        # may not converge, but it's enough to settle the chip into
-        # a reasonable state so that when input and clock pulses are
-        # applied, the simulation will converge.
-        if step >= stepLimit:
-            msg = 'ERROR: Sim "%s" did not converge after %d iterations'% \
-                  (self.name, stepLimit)
-            if self.callback_addLogStr:
-                self.callback_addLogStr(msg)
-            # Don't raise an exception if this is the first attempt
-            # to compute the state of a chip, but raise an exception if
-            # the simulation doesn't converge any time other than that.
-            if self.halfClkCount > 0:
-                traceback.print_stack()
-                raise RuntimeError(msg)
+        self.countRecalcSteps(step)
+        self.checkConvergence(step)
+        self.checkRecalcArray(step)
 
+    def checkRecalcArray(self, step):
         # Check that we've properly reset the recalcArray.  All entries
         # should be zero in preparation for the next half clock cycle.
         # Only do this sanity check for the first clock cycles.
+        stepLimit = self.recalcStepLimit
         if self.halfClkCount < 20:
             needNewArray = False
             for recalc in self.recalcArray:
@@ -172,7 +344,31 @@ class CircuitSimulatorBase:
                         print(msg)
                         break
             if needNewArray:
-                self.recalcArray = [False] * len(self.recalcArray)
+                self.recalcArray[:] = [False] * len(self.recalcArray)
+
+    def countRecalcSteps(self, step):
+        self.numRecalcs += 1
+        self.numRecalcSteps += step
+        if step > self.maxRecalcSteps:
+            self.maxRecalcSteps = step
+
+    def checkConvergence(self, step):
+        # The first attempt to compute the state of a chip's circuit
+        # may not converge, but it's enough to settle the chip into
+        # a reasonable state so that when input and clock pulses are
+        # applied, the simulation will converge.
+        stepLimit = self.recalcStepLimit
+        if step >= stepLimit:
+            msg = 'ERROR: Sim "%s" did not converge after %d iterations'% \
+                  (self.name, stepLimit)
+            if self.callback_addLogStr:
+                self.callback_addLogStr(msg)
+            # Don't raise an exception if this is the first attempt
+            # to compute the state of a chip, but raise an exception if
+            # the simulation doesn't converge any time other than that.
+            if self.halfClkCount > 0:
+                traceback.print_stack()
+                raise RuntimeError(msg)
 
     def doWireRecalc(self, wireIndex):
         raise RuntimeError('This method should be overridden by a derived class')
@@ -185,60 +381,84 @@ class CircuitSimulatorBase:
 
     def floatWire(self, n):
         wire = self.wireList[n]
+        state = wire.state
 
         if wire.pulled == Wire.PULLED_HIGH:
             wire.state = Wire.PULLED_HIGH
         elif wire.pulled == Wire.PULLED_LOW:
             wire.state = Wire.PULLED_LOW
         else:
-            state = wire.state
             if state == Wire.GROUNDED or state == Wire.PULLED_LOW:
                 wire.state = Wire.FLOATING_LOW
             if state == Wire.HIGH or state == Wire.PULLED_HIGH:
                 wire.state = Wire.FLOATING_HIGH
 
+        if wire.state != state:
+            keys = self.wireHashKeys
+            self.stateHash ^= keys[state][n] ^ keys[wire.state][n]
+            if self.changedWires != None:
+                self.changedWires.append(n)
+
     # setHighWN() and setLowWN() do not trigger an update
     # of the simulation.
     def setHighWN(self, n):
         if n in self.wireNames:
-            wireIndex = self.wireNames[n]
-            self.wireList[wireIndex].setHigh()
+            self.setPulled(self.wireNames[n], True)
             return
 
         assert type(n) == type(1), 'wire thing %s'%str(n)
-        wire = self.wireList[n]
-        if wire != None:
-            wire.setHigh()
+        if not self.isNoneWire(n):
+            self.setPulled(n, True)
         else:
             print 'ERROR - trying to set wire None high'
 
     def setLowWN(self, n):
         if n in self.wireNames:
-            wireIndex = self.wireNames[n]
-            self.wireList[wireIndex].setLow()
+            self.setPulled(self.wireNames[n], False)
             return
 
         assert type(n) == type(1), 'wire thing %s'%str(n)
-        wire = self.wireList[n]
-        if wire != None:
-            wire.setLow()
+        if not self.isNoneWire(n):
+            self.setPulled(n, False)
         else:
             print 'ERROR - trying to set wire None low'
 
+    # Derived classes that keep wire state somewhere other than
+    # the Wire objects of self.wireList only need to override
+    # setPulled(), isHigh(), isLow() and floatWire().
+    # These return True if the wire's pulled state or state changed.
+    # If neither did, the wire doesn't need to be recalculated.
     def setHigh(self, wireIndex):
-        self.wireList[wireIndex].setPulledHighOrLow(True)
+        return self.setPulled(wireIndex, True)
 
     def setLow(self, wireIndex):
-        self.wireList[wireIndex].setPulledHighOrLow(False)
+        return self.setPulled(wireIndex, False)
 
     def setPulled(self, wireIndex, boolHighOrLow):
-        self.wireList[wireIndex].setPulledHighOrLow(boolHighOrLow)
+        wire = self.wireList[wireIndex]
+        lastPulled = wire.pulled
+        lastState = wire.state
+        wire.setPulledHighOrLow(boolHighOrLow)
+        if wire.pulled == lastPulled and wire.state == lastState:
+            return False
+        self.stateHash ^= self.wireHashKeys[lastState][wireIndex] ^ \
+                          self.wireHashKeys[wire.state][wireIndex] ^ \
+                          self.pulledHashKeys[lastPulled][wireIndex] ^ \
+                          self.pulledHashKeys[wire.pulled][wireIndex]
+        return True
                 
     def setPulledHigh(self, wireIndex):
-        self.wireList[wireIndex].setPulledHighOrLow(True)
+        return self.setPulled(wireIndex, True)
 
     def setPulledLow(self, wireIndex):
-        self.wireList[wireIndex].setPulledHighOrLow(False)
+        return self.setPulled(wireIndex, False)
+
+    def setPulledList(self, wireIndices, highs, changedWires):
+        # setPulled() for each wire with the corresponding True or False
+        # in highs.  Wires that changed are appended to changedWires.
+        for wireIndex, high in zip(wireIndices, highs):
+            if self.setPulled(wireIndex, high):
+                changedWires.append(wireIndex)
         
     def isHigh(self, wireIndex):
         return self.wireList[wireIndex].isHigh()
@@ -248,23 +468,101 @@ class CircuitSimulatorBase:
 
     def isHighWN(self, n):
         if n in self.wireNames:
-            wireIndex = self.wireNames[n]
-            return self.wireList[wireIndex].isHigh()
+            return self.isHigh(self.wireNames[n])
 
         assert type(n) == type(1), 'ERROR: if arg to isHigh is not in ' + \
             'wireNames, it had better be an integer'
-        wire = self.wireList[n]
-        assert wire != None
-        return wire.isHigh()
+        assert not self.isNoneWire(n)
+        return self.isHigh(n)
         
     def isLowWN(self, n):
         if n in self.wireNames:
-            wireIndex = self.wireNames[n]
-            return self.wireList[wireIndex].isLow()
+            return self.isLow(self.wireNames[n])
+
+        assert not self.isNoneWire(n)
+        return self.isLow(n)
+
+    def isNoneWire(self, n):
+        return self.wireList != None and self.wireList[n] == None
+
+    # Copies of the state of every wire and every transistor gate,
+    # whichever way a derived class holds them.  Entries for wires or
+    # transistors that are None are 0.
+    def getWireStates(self):
+        return array('B', [wire.state if wire != None else 0
+                           for wire in self.wireList])
+
+    def getGateStates(self):
+        return array('B', [trans.gateState if trans != None else 0
+                           for trans in self.transistorList])
+
+    def getPulledStates(self):
+        return array('B', [wire.pulled if wire != None else 0
+                           for wire in self.wireList])
+
+    def getWireStateGetter(self, wireIndices):
+        """ Returns a function that takes no arguments and returns a
+            tuple of the current states of the wires in wireIndices.
+            For reading a few wires often, like the TIA's pixel color. """
+        wires = [self.wireList[i] for i in wireIndices]
+        getState = operator.attrgetter('state')
+        return lambda: tuple(map(getState, wires))
+
+    def getWireStateStringGetter(self, wireIndices):
+        """ Like getWireStateGetter(), but the function returns the
+            states as a string with one byte per wire, which is cheaper
+            to keep many of, like signalRecorder.py does. """
+        getStates = self.getWireStateGetter(wireIndices)
+        return lambda: str(bytearray(getStates()))
+
+    # The reverse of the above, for restoring a saved state.  Each
+    # takes a sequence of numWires or numFets values.  They don't
+    # update the state hash, see resetStateHash().
+    def setWireStates(self, states):
+        for wire in self.wireList:
+            if wire != None:
+                wire.state = states[wire.index]
 
-        wire = self.wireList[n]
-        assert wire != None
-        return wire.isLow()
+    def setGateStates(self, states):
+        for trans in self.transistorList:
+            if trans != None:
+                trans.gateState = states[trans.index]
+
+    def setPulledStates(self, states):
+        for wire in self.wireList:
+            if wire != None:
+                wire.pulled = states[wire.index]
+
+    # Get or set the states of only the wires or transistors in
+    # indices, for recording and replaying a recalc in the cache.  The
+    # setters, like the above, don't update the state hash.
+    def getWireStateList(self, wireIndices):
+        return tuple([self.wireList[i].state for i in wireIndices])
+
+    def getGateStateList(self, fetIndices):
+        return tuple([self.transistorList[i].gateState for i in fetIndices])
+
+    def setWireStateList(self, wireIndices, states):
+        for wireIndex, state in zip(wireIndices, states):
+            self.wireList[wireIndex].state = state
+
+    def setGateStateList(self, fetIndices, states):
+        for fetIndex, state in zip(fetIndices, states):
+            self.transistorList[fetIndex].gateState = state
+
+    # All of the chip's simulation state, for putting a chip back the
+    # way it was without loading its netlist again.
+    def getChipState(self):
+        return (self.halfClkCount, self.getWireStates(), self.getGateStates(),
+                self.getPulledStates())
+
+    def setChipState(self, chipState):
+        halfClkCount, wireStates, gateStates, pulledStates = chipState
+        self.halfClkCount = halfClkCount
+        self.setWireStates(wireStates)
+        self.setGateStates(gateStates)
+        self.setPulledStates(pulledStates)
+        self.resetStateHash()
 
     # TODO: rename to getNamedSignal (name, lowBitNum, highBitNum) ('DB',0,7) 
     # TODO: elim or use wire indices
@@ -283,7 +581,7 @@ class CircuitSimulatorBase:
         for i in xrange(size):
             bit = '%s%d'%(string,i)
             if (d & 1) == 1:
-                self.setHigh(bit)
+                self.setHighWN(bit)
             else:
                 self.setLowWN(bit)
             d = d / 2
@@ -294,15 +592,21 @@ class CircuitSimulatorBase:
             nameStr = j[0]
             for k in j[1:]:
                 name = '%s%d'%(nameStr,i)
-                self.wireList[k].name = name
+                if self.wireList != None:
+                    self.wireList[k].name = name
                 self.wireNames[name] = k
                 i += 1
 
     def loadCircuit (self, filePath):
+        """ Loads a chip's netlist from either a pickle file or a
+            binary netlist file written by netlistFile.py """
 
         if not os.path.exists(filePath):
             raise Exception('Could not find circuit file: %s  from cwd %s'%
                             (filePath, os.getcwd()))
+        if netlistFile.isNetlistFile(filePath):
+            return self.loadNetlistFile(filePath)
+
         print 'Loading %s' % filePath
         
         of = open (filePath, 'rb')
@@ -370,7 +674,12 @@ class CircuitSimulatorBase:
                 assert wireNames[i] == ''
                 self.wireList[i] = None
             else:
-                self.wireList[i] = Wire(i, wireNames[i], controlFets, gates, wirePulled[i])
+                # Keep the transistors in lists, in the iteration order
+                # of the sets.  That's the order in which simulators
+                # visit them, and lists keep it when written to and
+                # read back from a netlist file.
+                self.wireList[i] = Wire(i, wireNames[i], list(controlFets),
+                                        list(gates), wirePulled[i])
                 self.wireNames[wireNames[i]] = i
             i += 1
 
@@ -388,6 +697,52 @@ class CircuitSimulatorBase:
                 self.transistorList[i] = NmosFet(i, s1, s2, gate)
             i += 1
 
+        self.finishLoadCircuit()
+
+        return rootObj
+
+    def loadNetlistFile(self, filePath):
+        """ Builds wireList and transistorList from a binary netlist file.
+            Derived classes that don't need Wire and NmosFet objects can
+            override this to use the file's arrays directly. """
+        print 'Loading %s' % filePath
+        netlist = netlistFile.NetlistFile(filePath)
+        numWires = netlist.numWires
+        numFets = netlist.numFets
+        wirePulled = netlist.getPyArray('WIRE_PULLED')
+        ctOffsets = netlist.getPyArray('WIRE_CT_OFFSETS')
+        ctFets = netlist.getPyArray('WIRE_CT_FETS')
+        gateOffsets = netlist.getPyArray('WIRE_GATE_OFFSETS')
+        gateFets = netlist.getPyArray('WIRE_GATE_FETS')
+        wireNames = netlist.getWireNames()
+
+        self.wireList = [None] * numWires
+        for i in xrange(numWires):
+            controlFets = ctFets[ctOffsets[i]:ctOffsets[i+1]].tolist()
+            gates = gateFets[gateOffsets[i]:gateOffsets[i+1]].tolist()
+            self.wireList[i] = Wire(i, wireNames[i], controlFets, gates, wirePulled[i])
+            self.wireNames[wireNames[i]] = i
+
+        fetSide1 = netlist.getPyArray('FET_SIDE1')
+        fetSide2 = netlist.getPyArray('FET_SIDE2')
+        fetGate = netlist.getPyArray('FET_GATE')
+        self.transistorList = [None] * numFets
+        for i in xrange(numFets):
+            if fetSide1[i] != -1:
+                self.transistorList[i] = NmosFet(i, fetSide1[i], fetSide2[i], fetGate[i])
+
+        if netlist.staticCollapsed:
+            self.staticWireRep = list(netlist.getPyArray('WIRE_STATIC_REP'))
+
+        self.finishLoadCircuit()
+        return netlist
+
+    def finishLoadCircuit(self):
+        """ Sets up power wires and per-wire bookkeeping after
+            wireList and transistorList are loaded """
+        self.numWires = len(self.wireList)
+        self.numFets = len(self.transistorList)
+
         assert 'VCC' in self.wireNames
         assert 'VSS' in self.wireNames
         self.vccWireIndex = self.wireNames['VCC']
@@ -397,11 +752,174 @@ class CircuitSimulatorBase:
         for transInd in self.wireList[self.vccWireIndex].gateInds:
             self.transistorList[transInd].gateState = NmosFet.GATE_HIGH
 
-        self.lastWireGroupState = [-1] * numWires
+        self.lastWireGroupState = [-1] * self.numWires
+
+        # A netlist file may have been written after collapsing
+        if self.collapseStaticNetlist and self.staticWireRep == None:
+            self.collapseStaticWires()
+
+    def collapseStaticWires(self):
+        """ Load-time analysis of transistors whose gates never change.
+            A transistor whose gate is VCC is always on, so the wires on
+            either side of it are always in the same group.  Each set of
+            such wires is merged into one wire, the one with the lowest
+            index, which takes over the members' transistors and names.
+            Wires always connected to VCC or VSS are left alone, since
+            VCC and VSS end the walk over a group.
+            Transistors whose gate is VSS are never on and are only
+            counted.  They stay in ctInds because countWireSizes() uses
+            the number of transistors touching a wire to estimate its
+            charge.
+            Every simulator then runs on the smaller netlist.  Returns a
+            dict of statistics. """
+        numWires = len(self.wireList)
+        vcc = self.vccWireIndex
+        gnd = self.gndWireIndex
+
+        rep = range(numWires)
+        def findRep(i):
+            while rep[i] != i:
+                rep[i] = rep[rep[i]]
+                i = rep[i]
+            return i
+
+        numNeverOn = 0
+        alwaysOn = []
+        for trans in self.transistorList:
+            if trans == None:
+                continue
+            if trans.gateWireIndex == gnd:
+                numNeverOn += 1
+            elif trans.gateWireIndex == vcc:
+                s1 = trans.side1WireIndex
+                s2 = trans.side2WireIndex
+                if s1 == vcc or s1 == gnd or s2 == vcc or s2 == gnd:
+                    continue
+                alwaysOn.append(trans)
+                r1 = findRep(s1)
+                r2 = findRep(s2)
+                # Lowest index represents the merged wire
+                if r1 < r2:
+                    rep[r2] = r1
+                elif r2 < r1:
+                    rep[r1] = r2
+
+        for i in xrange(numWires):
+            rep[i] = findRep(i)
+
+        numMerged = 0
+        for i, wire in enumerate(self.wireList):
+            r = rep[i]
+            if r == i or wire == None:
+                continue
+            numMerged += 1
+            repWire = self.wireList[r]
+            repWire.ctInds += [t for t in wire.ctInds if not t in repWire.ctInds]
+            repWire.gateInds += [t for t in wire.gateInds if not t in repWire.gateInds]
+            # Pulled low wins over pulled high when a group is resolved
+            pulled = repWire.pulled | wire.pulled
+            if pulled & Wire.PULLED_LOW:
+                pulled = Wire.PULLED_LOW
+            repWire.pulled = pulled
+            repWire.state = pulled
+            wire.ctInds = []
+            wire.gateInds = []
+            if wire.name != '':
+                self.wireNames[wire.name] = r
+
+        for trans in self.transistorList:
+            if trans == None:
+                continue
+            trans.side1WireIndex = rep[trans.side1WireIndex]
+            trans.side2WireIndex = rep[trans.side2WireIndex]
+            trans.gateWireIndex = rep[trans.gateWireIndex]
 
-        return rootObj
+        self.staticWireRep = rep
+
+        return {'numNeverOnFets': numNeverOn,
+                'numAlwaysOnFets': len(alwaysOn),
+                'numMergedWires': numMerged}
+
+    def getNetlistArrays(self):
+        """ Returns a dict of the arrays stored in a binary netlist file,
+            keyed by the section names in netlistFile.sectionTypes.
+            Channel and gate transistors are listed in the order of
+            each wire's ctInds and gateInds. """
+        numWires = len(self.wireList)
+        numFets = len(self.transistorList)
+
+        data = dict()
+        data['WIRE_PULLED'] = array('B', [0] * numWires)
+        for name in ['WIRE_CT_OFFSETS', 'WIRE_CT_FETS', 'WIRE_CT_OTHERS',
+                     'WIRE_GATE_OFFSETS', 'WIRE_GATE_FETS']:
+            data[name] = array('i')
+        wireNames = []
+        ctFets = data['WIRE_CT_FETS']
+        ctOthers = data['WIRE_CT_OTHERS']
+        gateFets = data['WIRE_GATE_FETS']
+
+        for i, wire in enumerate(self.wireList):
+            data['WIRE_CT_OFFSETS'].append(len(ctFets))
+            data['WIRE_GATE_OFFSETS'].append(len(gateFets))
+            if wire == None:
+                wireNames.append('')
+                continue
+            wireNames.append(wire.name)
+            data['WIRE_PULLED'][i] = wire.pulled
+            for transIndex in wire.ctInds:
+                trans = self.transistorList[transIndex]
+                other = -1
+                if trans.side1WireIndex == i:
+                    other = trans.side2WireIndex
+                elif trans.side2WireIndex == i:
+                    other = trans.side1WireIndex
+                ctFets.append(transIndex)
+                ctOthers.append(other)
+            for transIndex in wire.gateInds:
+                gateFets.append(transIndex)
+        data['WIRE_CT_OFFSETS'].append(len(ctFets))
+        data['WIRE_GATE_OFFSETS'].append(len(gateFets))
+
+        for name in ['FET_SIDE1', 'FET_SIDE2', 'FET_GATE']:
+            data[name] = array('i', [-1] * numFets)
+        for i, trans in enumerate(self.transistorList):
+            if trans == None:
+                continue
+            data['FET_SIDE1'][i] = trans.side1WireIndex
+            data['FET_SIDE2'][i] = trans.side2WireIndex
+            data['FET_GATE'][i] = trans.gateWireIndex
+
+        if self.staticWireRep != None:
+            data['WIRE_STATIC_REP'] = array('i', self.staticWireRep)
+        else:
+            data['WIRE_STATIC_REP'] = array('i', range(numWires))
+        data['WIRE_NAMES'] = wireNames
+        return data
+
+    def getNetlistHash(self):
+        """ Returns a SHA-1 hex string identifying the chip's netlist: its
+            transistors, their connections, and the wire names.  It's the
+            same whichever file format or simulator the netlist was loaded
+            with.  Pulled states aren't included since pads' pulled states
+            change as the simulation runs. """
+        if self.netlistHash == None:
+            data = self.getNetlistArrays()
+            h = hashlib.sha1()
+            h.update(struct.pack('<4i', self.numWires, self.numFets,
+                                 self.vccWireIndex, self.gndWireIndex))
+            for name, typecode in netlistFile.sectionTypes:
+                if typecode == 'i' and name != 'WIRE_STATIC_REP':
+                    h.update(netlistFile.toLittleEndian(data[name]).tostring())
+            h.update('\0'.join(data['WIRE_NAMES']))
+            self.netlistHash = h.hexdigest()
+        return self.netlistHash
 
     def writeCktFile(self, filePath):
+        """ Writes a pickle file like the ones in chips/, or a binary
+            netlist file if filePath ends with netlistFile.fileExtension """
+        if filePath.endswith(netlistFile.fileExtension):
+            netlistFile.writeNetlistFile(filePath, self)
+            return
  
         rootObj = dict()
         
@@ -429,13 +947,13 @@ class CircuitSimulatorBase:
 
             wirePulled[i] = wire.pulled
 
-            wireControlFets.append(len(wire.ins))
-            for transInd in wire.ins:
+            wireControlFets.append(len(wire.ctInds))
+            for transInd in wire.ctInds:
                 wireControlFets.append(transInd)
             wireControlFets.append(nextCtrl)
 
-            wireGates.append(len(wire.outs))
-            for transInd in wire.outs:
+            wireGates.append(len(wire.gateInds))
+            for transInd in wire.gateInds:
                 wireGates.append(transInd)
             wireGates.append(nextCtrl)
 
@@ -450,9 +968,9 @@ class CircuitSimulatorBase:
         for i, trans in enumerate(self.transistorList):
             if trans == None:
                 continue
-            fetSide1WireInds[i] = trans.c1
-            fetSide2WireInds[i] = trans.c2
-            fetGateWireInds[i] = trans.gate
+            fetSide1WireInds[i] = trans.side1WireIndex
+            fetSide2WireInds[i] = trans.side2WireIndex
+            fetGateWireInds[i] = trans.gateWireIndex
 
         rootObj['NUM_WIRES'] = numWires
         rootObj['NEXT_CTRL'] = nextCtrl
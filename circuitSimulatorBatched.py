@@ -0,0 +1,635 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+#------------------------------------------------------------------------------
+#
+# circuitSimulatorBatched.py
+# Any number of copies of one chip, each a lane, with the states held
+# in numpy arrays of shape [lanes, numWires] and [lanes, numFets] and
+# every step of the recalc done for all of the lanes at once with
+# numpy operations over index arrays.
+#
+# FrontierRecalc runs CircuitSimulatorBase.doRecalcIterations() over
+# the wires of every lane side by side, as if the lanes were one chip
+# made of many unconnected copies.  Each step takes the wires waiting
+# to be recalculated, the frontier, and:
+#   walks out from all of them at once, a level of the walk at a time,
+#   labeling each wire reached with the position in the frontier of
+#   the first wire whose group it's in
+#   resolves every group's value from the pulled and floating states
+#   of its wires, as getWireValue() does
+#   sets the groups' wires and switches the transistors they gate,
+#   and the sides of those transistors are the next step's frontier
+# The other simulators set one group before finding the next, so a
+# group sees the transistors switched by the groups before it.  Setting
+# every group at once from the same starting transistors instead makes
+# latches whose sides both change swap back and forth forever.  So
+# a group is only set along with the ones before it when none of
+# them switches a transistor on the group's wires; the first group
+# that is touched, and those after it, are found again once the
+# groups before them are set.  The groups are set in the order of
+# the frontier, as setting them one at a time in that order would.
+# Within a group, the other simulators set each wire and switch the
+# transistors it gates in the order of a depth-first walk, so a wire
+# of the group floated by a transistor turned off by a wire before it
+# is set again, and one floated by a wire after it isn't.  Those few
+# groups are walked again to find that order; see findResetSides().
+# The next frontier is still in the order of the groups' labels rather
+# than of the walk, like the sets simulator.
+#
+# Only numpy is needed.  The work of each operation grows with the
+# number of lanes and the numpy overhead is paid once for all of them,
+# so it's meant for running hundreds of lanes; see batchedConsole.py.
+#
+
+from array import array
+import numpy
+from nmosFet import NmosFet
+from wire import Wire
+
+PULLED_HIGH   = Wire.PULLED_HIGH
+PULLED_LOW    = Wire.PULLED_LOW
+GROUNDED      = Wire.GROUNDED
+HIGH          = Wire.HIGH
+FLOATING_HIGH = Wire.FLOATING_HIGH
+FLOATING_LOW  = Wire.FLOATING_LOW
+
+def gatherRanges(starts, counts):
+    """ For ranges of an array, starts[i] to starts[i] + counts[i],
+        returns (owner, pos): the index of every element of every range
+        in pos and the range it's in in owner. """
+    owner = numpy.repeat(numpy.arange(len(counts)), counts)
+    rangeStarts = numpy.cumsum(counts) - counts
+    pos = numpy.arange(len(owner)) - rangeStarts[owner] + starts[owner]
+    return owner, pos
+
+def firstOccurrences(values):
+    # values without repeats, each where it first appears
+    if len(values) == 0:
+        return values
+    unique, first = numpy.unique(values, return_index=True)
+    return values[numpy.sort(first)]
+
+
+class FrontierRecalc:
+    def __init__(self, netlist, numWires, numFets, gndWireIndex, vccWireIndex,
+                 numLanes):
+        """ netlist is a dict from getNetlistArrays().  Wire w of lane l
+            is entry l * numWires + w of the flattened [lanes, numWires]
+            arrays given to recalc(), and transistor t is entry
+            l * numFets + t of the [lanes, numFets] gate array. """
+        self.numWires = numWires
+        self.numFets = numFets
+        self.numLanes = numLanes
+        self.gndWireIndex = gndWireIndex
+        self.vccWireIndex = vccWireIndex
+        for attr, name in [('wireCtOffsets', 'WIRE_CT_OFFSETS'),
+                           ('wireCtFets', 'WIRE_CT_FETS'),
+                           ('wireCtOthers', 'WIRE_CT_OTHERS'),
+                           ('wireGateOffsets', 'WIRE_GATE_OFFSETS'),
+                           ('wireGateFets', 'WIRE_GATE_FETS'),
+                           ('fetSide1', 'FET_SIDE1'),
+                           ('fetSide2', 'FET_SIDE2')]:
+            setattr(self, attr, numpy.array(netlist[name], dtype=numpy.int64))
+        self.wireCtCounts = numpy.diff(self.wireCtOffsets)
+        self.wireGateCounts = numpy.diff(self.wireGateOffsets)
+        # Transistors touching each wire, as counted by countWireSizes()
+        self.wireSize = self.wireCtCounts + self.wireGateCounts
+        # The value VSS and VCC give a group they're in
+        self.powerValue = numpy.zeros(numWires, dtype=numpy.uint8)
+        self.powerValue[gndWireIndex] = GROUNDED
+        self.powerValue[vccWireIndex] = HIGH
+
+        # label[i] is the group label of flattened wire i during a step,
+        # -1 when it's in no group
+        self.label = numpy.full(numWires * numLanes, -1, dtype=numpy.int64)
+
+        self.numWiresRecalculated = 0
+        self.numAddWireToGroup = 0
+        self.numGroupPasses = 0
+
+    def recalc(self, frontier, wireState, wirePulled, gateState, stepLimit):
+        """ Recalculates the flattened wires in frontier, an array in
+            the order they'd be given to recalcWireList() lane by lane.
+            wireState, wirePulled and gateState are flattened uint8
+            arrays, changed in place.  Returns the number of steps,
+            stepLimit if the circuit didn't settle. """
+        step = 0
+        while step < stepLimit:
+            if len(frontier) == 0:
+                break
+            frontier = self.recalcStep(frontier, wireState, wirePulled, gateState)
+            step += 1
+        return step
+
+    def recalcStep(self, frontier, wireState, wirePulled, gateState):
+        """ One step of recalc().  Returns the next step's frontier. """
+        numWires = self.numWires
+        self.numWiresRecalculated += len(frontier)
+        local = frontier % numWires
+        frontier = frontier[(local != self.gndWireIndex) &
+                            (local != self.vccWireIndex)]
+        nextFrontier = []
+        while len(frontier) > 0:
+            frontier = self.setGroups(frontier, wireState, wirePulled,
+                                      gateState, nextFrontier)
+            self.numGroupPasses += 1
+        if len(nextFrontier) > 0:
+            return firstOccurrences(numpy.concatenate(nextFrontier))
+        return numpy.zeros(0, dtype=numpy.int64)
+
+    def findGroups(self, frontier, gateState):
+        """ Labels the group of each wire in frontier.  Returns (members,
+            memberLabel, powerLabel, powerValue): the wires in the groups
+            and the label of each, and the label of each group joined
+            to VSS or VCC and which.  A group's label is the position in
+            frontier of its first wire.  self.label is left with the
+            labels of members, for the caller to clear. """
+        numWires = self.numWires
+        numFets = self.numFets
+        label = self.label
+        numFrontier = len(frontier)
+        positions = numpy.arange(numFrontier)
+        # Written last to first so a wire listed twice keeps its first
+        # position
+        label[frontier[::-1]] = positions[::-1]
+        level = frontier[label[frontier] == positions]
+        levels = [level]
+        joinA = []
+        joinB = []
+        powerLabels = []
+        powerValues = []
+        while len(level) > 0:
+            lane = level // numWires
+            local = level - lane * numWires
+            owner, pos = gatherRanges(self.wireCtOffsets[local],
+                                      self.wireCtCounts[local])
+            fets = self.wireCtFets[pos] + lane[owner] * numFets
+            on = gateState[fets] != NmosFet.GATE_LOW
+            owner = owner[on]
+            other = self.wireCtOthers[pos[on]]
+            srcLabel = label[level[owner]]
+            # Like the other simulators, don't walk through VCC or VSS
+            power = self.powerValue[other]
+            isPower = power != 0
+            if isPower.any():
+                powerLabels.append(srcLabel[isPower])
+                powerValues.append(power[isPower])
+                notPower = ~isPower
+                owner = owner[notPower]
+                other = other[notPower]
+                srcLabel = srcLabel[notPower]
+            other += lane[owner] * numWires
+            isNew = label[other] < 0
+            newWires = other[isNew]
+            label[newWires] = srcLabel[isNew]
+            # A wire reached from two groups joins them
+            otherLabel = label[other]
+            differ = otherLabel != srcLabel
+            if differ.any():
+                joinA.append(srcLabel[differ])
+                joinB.append(otherLabel[differ])
+            level = numpy.unique(newWires)
+            levels.append(level)
+
+        members = numpy.concatenate(levels)
+        groupLabel = numpy.arange(numFrontier)
+        if len(joinA) > 0:
+            groupLabel = self.joinLabels(groupLabel, numpy.concatenate(joinA),
+                                         numpy.concatenate(joinB))
+        memberLabel = groupLabel[label[members]]
+        label[members] = memberLabel
+        if len(powerLabels) > 0:
+            powerLabel = groupLabel[numpy.concatenate(powerLabels)]
+            powerValue = numpy.concatenate(powerValues)
+        else:
+            powerLabel = numpy.zeros(0, dtype=numpy.int64)
+            powerValue = numpy.zeros(0, dtype=numpy.uint8)
+        return members, memberLabel, powerLabel, powerValue
+
+    def joinLabels(self, groupLabel, a, b):
+        # Maps each label to the lowest label it's joined to through
+        # the pairs (a[i], b[i])
+        while True:
+            labelA = groupLabel[a]
+            labelB = groupLabel[b]
+            differ = labelA != labelB
+            if not differ.any():
+                return groupLabel
+            labelA = labelA[differ]
+            labelB = labelB[differ]
+            lowest = numpy.minimum(labelA, labelB)
+            numpy.minimum.at(groupLabel, labelA, lowest)
+            numpy.minimum.at(groupLabel, labelB, lowest)
+            while True:
+                jumped = groupLabel[groupLabel]
+                if (jumped == groupLabel).all():
+                    break
+                groupLabel = jumped
+
+    def setGroups(self, frontier, wireState, wirePulled, gateState, nextFrontier):
+        """ Finds and sets the groups of the wires in frontier, up to
+            the first group in each lane that's touched by a transistor
+            switched by a group before it.  The sides of the transistors
+            switched are appended to nextFrontier.  Returns the wires of
+            frontier left to do. """
+        numWires = self.numWires
+        numFets = self.numFets
+        numFrontier = len(frontier)
+        members, memberLabel, powerLabel, powerValue = \
+            self.findGroups(frontier, gateState)
+        self.numAddWireToGroup += len(members) + len(powerLabel)
+
+        # Each group's value, as getWireValue() resolves it.  Later
+        # assignments take priority.
+        states = wireState[members]
+        pulled = wirePulled[members]
+        def anyInGroup(isSet):
+            return numpy.bincount(memberLabel[isSet], minlength=numFrontier) > 0
+        floatLow = anyInGroup(states == FLOATING_LOW)
+        floatHigh = anyInGroup(states == FLOATING_HIGH)
+        # With nothing driving or charging the group, it keeps the
+        # state of its first wire
+        value = wireState[frontier]
+        value[floatHigh] = FLOATING_HIGH
+        value[floatLow] = FLOATING_LOW
+        both = floatLow & floatHigh
+        if both.any():
+            # The side with more transistors touching its wires wins,
+            # as in countWireSizes()
+            size = self.wireSize[members % numWires]
+            countFl = numpy.bincount(memberLabel, (states == FLOATING_LOW) * size,
+                                     minlength=numFrontier)
+            countFh = numpy.bincount(memberLabel, (states == FLOATING_HIGH) * size,
+                                     minlength=numFrontier)
+            value[both & (countFh < countFl)] = FLOATING_LOW
+            value[both & (countFh >= countFl)] = FLOATING_HIGH
+        value[anyInGroup(pulled == PULLED_HIGH)] = PULLED_HIGH
+        value[anyInGroup(pulled == PULLED_LOW)] = PULLED_LOW
+        value[powerLabel[powerValue == HIGH]] = HIGH
+        value[powerLabel[powerValue == GROUNDED]] = GROUNDED
+        isHigh = (value == HIGH) | (value == PULLED_HIGH) | (value == FLOATING_HIGH)
+
+        # The transistors each group switches
+        memberLane = members // numWires
+        local = members - memberLane * numWires
+        owner, pos = gatherRanges(self.wireGateOffsets[local],
+                                  self.wireGateCounts[local])
+        newGate = isHigh[memberLabel[owner]]
+        fets = self.wireGateFets[pos] + memberLane[owner] * numFets
+        switched = gateState[fets] != newGate
+        owner = owner[switched]
+        switchLabel = memberLabel[owner]
+        switchLane = memberLane[owner]
+        localFets = self.wireGateFets[pos[switched]]
+        fets = fets[switched]
+        newGate = newGate[switched]
+        sides1 = self.fetSide1[localFets] + switchLane * numWires
+        sides2 = self.fetSide2[localFets] + switchLane * numWires
+
+        # The other simulators recalculate each wire of the frontier
+        # in turn, finding its group again even if an earlier wire's
+        # group held it.  That gives the same result, unless a group
+        # set since then switched a transistor on the group's wires.
+        # So the frontier is done up to the first wire whose group is
+        # touched by a group set before it in the frontier, and the
+        # rest wait until the groups before them are set.
+        label = self.label
+        positions = numpy.arange(numFrontier)
+        frontierLabel = label[frontier]
+        frontierLane = frontier // numWires
+        sideLabels1 = label[sides1]
+        sideLabels2 = label[sides2]
+        switchers = numpy.concatenate((switchLabel, switchLabel))
+        touched = numpy.concatenate((sideLabels1, sideLabels2))
+        label[members] = -1
+        isTouched = touched >= 0
+        firstWaiting = numpy.full(self.numLanes, numFrontier, dtype=numpy.int64)
+        if isTouched.any():
+            switchers = switchers[isTouched]
+            touched = touched[isTouched]
+            # The first wire of each touched group after the group
+            # that touched it
+            keys = numpy.sort(frontierLabel * numFrontier + positions)
+            found = numpy.searchsorted(keys, touched * numFrontier + switchers + 1)
+            found = keys[numpy.minimum(found, numFrontier - 1)]
+            isAfter = found // numFrontier == touched
+            waitFrom = found[isAfter] % numFrontier
+            numpy.minimum.at(firstWaiting, frontierLane[waitFrom], waitFrom)
+        # A group's label is the position of its first wire
+        isSet = positions < firstWaiting[frontierLane]
+        waiting = frontier[~isSet]
+
+        memberIsSet = isSet[memberLabel]
+        wireState[members[memberIsSet]] = value[memberLabel[memberIsSet]]
+        switchIsSet = isSet[switchLabel]
+        order = numpy.argsort(switchLabel[switchIsSet], kind='mergesort')
+        fets = fets[switchIsSet][order]
+        newGate = newGate[switchIsSet][order]
+        sides1 = sides1[switchIsSet][order]
+        sides2 = sides2[switchIsSet][order]
+        # Float both sides of the transistors turned off
+        turnedOff = ~newGate
+        if turnedOff.any():
+            offSides = numpy.concatenate((sides1[turnedOff], sides2[turnedOff]))
+            offLabels = numpy.concatenate((sideLabels1[switchIsSet][order][turnedOff],
+                                           sideLabels2[switchIsSet][order][turnedOff]))
+            switchWires = members[owner[switchIsSet][order][turnedOff]]
+            switchWires = numpy.concatenate((switchWires, switchWires))
+            switchLabels = switchLabel[switchIsSet][order][turnedOff]
+            switchLabels = numpy.concatenate((switchLabels, switchLabels))
+            resetSides, resetLabels = self.findResetSides(
+                frontier, offSides, offLabels, switchWires, switchLabels, gateState)
+            self.floatWires(offSides, wireState, wirePulled)
+            wireState[resetSides] = value[resetLabels]
+        gateState[fets] = newGate
+        nextFrontier.append(numpy.column_stack((sides1, sides2)).ravel())
+
+        return waiting
+
+    def findResetSides(self, frontier, sides, sideLabels, switchWires,
+                       switchLabels, gateState):
+        """ The other simulators set a group's wires and switch the
+            transistors each gates one wire at a time, in the order of
+            the depth-first walk from the group's first wire.  A side
+            of a transistor turned off inside its own group is floated
+            and then set again if it comes after the wire gating the
+            transistor in the walk.  Returns the wires of sides that
+            end up set again and the labels of their groups.  sides are
+            the sides of the transistors turned off, sideLabels the
+            labels of their groups from before they were cleared, and
+            switchWires and switchLabels the wire gating each and its
+            group.  gateState is from before the transistors are
+            switched. """
+        inGroup = sideLabels == switchLabels
+        if not inGroup.any():
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+        # A side floated by another group's transistor stays floating
+        floatedElsewhere = set(sides[~inGroup].tolist())
+        # The position in the walk of the last wire floating each side
+        lastFloat = {}
+        sideLabel = {}
+        walks = {}
+        for side, groupLabel, switchWire in zip(sides[inGroup].tolist(),
+                                                sideLabels[inGroup].tolist(),
+                                                switchWires[inGroup].tolist()):
+            if groupLabel not in walks:
+                walks[groupLabel] = self.getWalkOrder(frontier[groupLabel], gateState)
+            walk = walks[groupLabel]
+            lastFloat[side] = max(lastFloat.get(side, -1), walk[switchWire])
+            sideLabel[side] = groupLabel
+        resetSides = [side for side in sorted(lastFloat)
+                      if side not in floatedElsewhere and
+                         walks[sideLabel[side]][side] > lastFloat[side]]
+        resetLabels = [sideLabel[side] for side in resetSides]
+        return numpy.array(resetSides, dtype=numpy.int64), \
+               numpy.array(resetLabels, dtype=numpy.int64)
+
+    def getWalkOrder(self, start, gateState):
+        # Maps each flattened wire of start's group to its position in
+        # the depth-first walk of CircuitSimulatorBase.doWireRecalc(),
+        # through the transistors that are on in gateState.  Only done
+        # for the few groups that need it.
+        numWires = self.numWires
+        lane = start // numWires
+        wireBase = lane * numWires
+        fetBase = lane * self.numFets
+        wireCtOffsets = self.wireCtOffsets
+        wireCtOthers = self.wireCtOthers
+        wireCtFets = self.wireCtFets
+        local = start - wireBase
+        order = {local: 0}
+        stack = [[local, wireCtOffsets[local]]]
+        while len(stack) > 0:
+            top = stack[-1]
+            pos = top[1]
+            end = wireCtOffsets[top[0] + 1]
+            while pos < end:
+                other = int(wireCtOthers[pos])
+                if gateState[fetBase + wireCtFets[pos]] == NmosFet.GATE_LOW or \
+                   other in order:
+                    pos += 1
+                    continue
+                top[1] = pos + 1
+                order[other] = len(order)
+                if other != self.gndWireIndex and other != self.vccWireIndex:
+                    stack.append([other, wireCtOffsets[other]])
+                break
+            else:
+                stack.pop()
+        return dict((wire + wireBase, position) for wire, position in order.iteritems())
+
+    def floatWires(self, wires, wireState, wirePulled):
+        # CircuitSimulatorBase.floatWire() for each of wires.  Floating
+        # a wire twice is the same as once.
+        states = wireState[wires]
+        pulled = wirePulled[wires]
+        newStates = states.copy()
+        newStates[(states == GROUNDED) | (states == PULLED_LOW)] = FLOATING_LOW
+        newStates[(states == HIGH) | (states == PULLED_HIGH)] = FLOATING_HIGH
+        newStates[pulled == PULLED_HIGH] = PULLED_HIGH
+        newStates[pulled == PULLED_LOW] = PULLED_LOW
+        wireState[wires] = newStates
+
+
+class BatchedCircuitSimulator:
+    def __init__(self, chip, numLanes):
+        """ Makes numLanes copies of chip, a loaded Sim6502 or SimTIA on
+            any backend, each in chip's current state.  chip's netlist
+            and state hash keys are used, and chip isn't changed. """
+        if numLanes < 1:
+            raise RuntimeError('ERROR: numLanes must be at least 1')
+        self.name = chip.__class__.__name__
+        self.numLanes = numLanes
+        self.numWires = chip.numWires
+        self.numFets = chip.numFets
+        self.gndWireIndex = chip.gndWireIndex
+        self.vccWireIndex = chip.vccWireIndex
+        self.wireNames = dict(chip.wireNames)
+        self.halfClkCount = chip.halfClkCount
+        self.recalcStepLimit = chip.recalcStepLimit
+        self.callback_addLogStr = chip.callback_addLogStr
+        self.netlistHash = chip.getNetlistHash()
+
+        self.frontierRecalc = FrontierRecalc(chip.getNetlistArrays(),
+                                             self.numWires, self.numFets,
+                                             self.gndWireIndex, self.vccWireIndex,
+                                             numLanes)
+
+        # Keys for computeLaneStateHash(), with a row of zeros for each
+        # value that isn't a state, as circuitSimulatorCompiled keeps them
+        zeros = [0] * self.numWires
+        self.wireHashKeys = numpy.array(
+            [keys if keys != None else zeros for keys in chip.wireHashKeys],
+            dtype=numpy.int64)
+        self.pulledHashKeys = numpy.array(
+            [keys if keys != None else zeros for keys in chip.pulledHashKeys],
+            dtype=numpy.int64)
+        self.fetHashKeys = numpy.array(chip.fetHashKeys, dtype=numpy.int64)
+
+        self.wireState = numpy.zeros((numLanes, self.numWires), dtype=numpy.uint8)
+        self.wirePulled = numpy.zeros((numLanes, self.numWires), dtype=numpy.uint8)
+        self.gateState = numpy.zeros((numLanes, self.numFets), dtype=numpy.uint8)
+        # Flattened views, for FrontierRecalc
+        self.flatWireState = self.wireState.reshape(-1)
+        self.flatWirePulled = self.wirePulled.reshape(-1)
+        self.flatGateState = self.gateState.reshape(-1)
+        self.laneWireOffsets = numpy.arange(numLanes, dtype=numpy.int64) * self.numWires
+
+        self.numRecalcs = 0
+        self.numRecalcSteps = 0
+        self.maxRecalcSteps = 0
+
+        chipState = chip.getChipState()
+        for lane in xrange(numLanes):
+            self.setLaneChipState(lane, chipState)
+
+    # Lanes are chosen with boolean arrays of numLanes entries.  None
+    # is every lane.
+    def getLanes(self, lanes):
+        if lanes is None:
+            return numpy.ones(self.numLanes, dtype=bool)
+        return lanes
+
+    def setLaneChipState(self, lane, chipState):
+        """ Sets one lane to a state from getChipState() of a chip with
+            the same netlist.  The half clock count is shared by the
+            lanes, so it's taken from chipState. """
+        halfClkCount, wireStates, gateStates, pulledStates = chipState
+        self.halfClkCount = halfClkCount
+        self.wireState[lane] = numpy.frombuffer(array('B', wireStates), dtype=numpy.uint8)
+        self.gateState[lane] = numpy.frombuffer(array('B', gateStates), dtype=numpy.uint8)
+        self.wirePulled[lane] = numpy.frombuffer(array('B', pulledStates), dtype=numpy.uint8)
+
+    def getLaneChipState(self, lane):
+        """ The lane's state as getChipState() returns it, to be set on a
+            chip with setChipState() """
+        return (self.halfClkCount, array('B', self.wireState[lane].tostring()),
+                array('B', self.gateState[lane].tostring()),
+                array('B', self.wirePulled[lane].tostring()))
+
+    def computeLaneStateHash(self, lane):
+        """ The state hash a lone chip in the lane's state would have """
+        wires = numpy.arange(self.numWires)
+        h = numpy.bitwise_xor.reduce(self.wireHashKeys[self.wireState[lane], wires])
+        h ^= numpy.bitwise_xor.reduce(self.pulledHashKeys[self.wirePulled[lane], wires])
+        h ^= numpy.bitwise_xor.reduce(self.fetHashKeys[self.gateState[lane] ==
+                                                       NmosFet.GATE_HIGH])
+        return int(h)
+
+    def getWireIndex(self, wireName):
+        return self.wireNames[wireName]
+
+    def isHigh(self, wireIndex):
+        """ Boolean array, True in the lanes in which the wire is high """
+        states = self.wireState[:, wireIndex]
+        return (states == HIGH) | (states == PULLED_HIGH) | (states == FLOATING_HIGH)
+
+    def isLow(self, wireIndex):
+        states = self.wireState[:, wireIndex]
+        return (states == GROUNDED) | (states == PULLED_LOW) | (states == FLOATING_LOW)
+
+    def getValues(self, wireIndices):
+        """ Reads wires as the bits of an integer, least significant
+            first, as WireBus does.  Returns an array of each lane's
+            value. """
+        states = self.wireState[:, wireIndices]
+        highs = (states == HIGH) | (states == PULLED_HIGH) | (states == FLOATING_HIGH)
+        weights = numpy.left_shift(1, numpy.arange(len(wireIndices), dtype=numpy.int64))
+        return highs.dot(weights)
+
+    def setPulled(self, wireIndex, highs, lanes=None):
+        """ Sets the wire pulled high in the lanes where highs is True
+            and pulled low in the others, of lanes.  Returns a boolean
+            array of the lanes in which the wire's pulled state or state
+            changed, which need the wire recalculated. """
+        lanes = self.getLanes(lanes)
+        pulled = numpy.where(highs, PULLED_HIGH, PULLED_LOW).astype(numpy.uint8)
+        changed = lanes & ((self.wirePulled[:, wireIndex] != pulled) |
+                           (self.wireState[:, wireIndex] != pulled))
+        self.wirePulled[changed, wireIndex] = pulled[changed]
+        self.wireState[changed, wireIndex] = pulled[changed]
+        return changed
+
+    def setPulledList(self, wireIndices, highsList, changedWires, lanes=None):
+        """ setPulled() for each wire with the corresponding array in
+            highsList.  (wire, changed lanes) is appended to changedWires
+            for each wire that changed in any lane. """
+        for wireIndex, highs in zip(wireIndices, highsList):
+            changed = self.setPulled(wireIndex, highs, lanes)
+            if changed.any():
+                changedWires.append((wireIndex, changed))
+
+    def setValues(self, wireIndices, values, changedWires, lanes=None):
+        # setPulledList() of each lane's value, bit 0 to the first wire
+        self.setPulledList(wireIndices,
+                           [(values >> bit) & 1 != 0 for bit in xrange(len(wireIndices))],
+                           changedWires, lanes)
+
+    def recalcWireList(self, wireLanes):
+        """ Recalculates a list of (wire, lanes) pairs.  Each lane's
+            wires are recalculated in the order of the list. """
+        parts = []
+        lanes = []
+        for wireIndex, wireLanes in wireLanes:
+            laneIndices = numpy.flatnonzero(wireLanes)
+            parts.append(laneIndices * self.numWires + wireIndex)
+            lanes.append(laneIndices)
+        if len(parts) == 0:
+            return
+        frontier = numpy.concatenate(parts)
+        # Lane by lane, keeping the list's order within each lane
+        order = numpy.argsort(numpy.concatenate(lanes), kind='mergesort')
+        self.doRecalcIterations(frontier[order])
+
+    def recalcWire(self, wireIndex, lanes=None):
+        self.recalcWireList([(wireIndex, self.getLanes(lanes))])
+
+    def doRecalcIterations(self, frontier):
+        step = self.frontierRecalc.recalc(frontier, self.flatWireState,
+                                          self.flatWirePulled, self.flatGateState,
+                                          self.recalcStepLimit)
+        self.numRecalcs += 1
+        self.numRecalcSteps += step
+        if step > self.maxRecalcSteps:
+            self.maxRecalcSteps = step
+        self.checkConvergence(step)
+
+    def checkConvergence(self, step):
+        # As CircuitSimulatorBase.checkConvergence(): the first recalc
+        # of the chip, while it settles, may not converge in some lane,
+        # but any later one that doesn't raises
+        stepLimit = self.recalcStepLimit
+        if step >= stepLimit:
+            msg = 'ERROR: Sim "%s" did not converge after %d iterations'% \
+                  (self.name, stepLimit)
+            if self.callback_addLogStr:
+                self.callback_addLogStr(msg)
+            if self.halfClkCount > 0:
+                raise RuntimeError(msg)
+
+    def getStats(self):
+        recalc = self.frontierRecalc
+        return {'numWiresRecalculated': recalc.numWiresRecalculated,
+                'numAddWireToGroup': recalc.numAddWireToGroup,
+                'numGroupPasses': recalc.numGroupPasses,
+                'numRecalcs': self.numRecalcs,
+                'numRecalcSteps': self.numRecalcSteps,
+                'maxRecalcSteps': self.maxRecalcSteps}
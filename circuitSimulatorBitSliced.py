@@ -0,0 +1,591 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+#------------------------------------------------------------------------------
+#
+# circuitSimulatorBitSliced.py
+# Up to 64 copies of one chip simulated together.  Each copy is a lane,
+# and every wire and transistor keeps one bit per lane in a uint64:
+#   a plane for each of the six wire states, with the lane's bit set
+#   in the plane of the state the wire is in
+#   a plane for pulled high and one for pulled low
+#   a gate plane for the transistors, set where the gate is high
+# Lane masks, Python ints or uint64s with a bit set for each lane, say
+# which lanes an operation applies to.
+#
+# The recalc is the same as the other simulators', run on lane masks.
+# The walk over a wire's group follows the transistors that are on
+# in each lane, so it finds each lane's group at once, and the group's
+# value is resolved with bitwise operations across the lanes.  The
+# rare group of floating wires charged both high and low is resolved
+# one lane at a time, like countWireSizes() does.
+#
+# The list of wires to recalculate holds (wire, lanes) entries, and
+# the walk over a group keeps the lanes that reached each wire, so
+# each lane's wires are recalculated, grouped and set in the same
+# order as a lone chip's, and lanes in the same state share entries.
+# The recalc counts are of entries, so they're the counts of a lone
+# chip when all the lanes are in step.
+# The state hash isn't kept up to date as the lanes run; see
+# computeLaneStateHash().
+#
+# numpy is needed, and numba if it can be imported, to compile the
+# recalc kernel.  Without numba the kernel runs as Python, which is
+# correct but very slow.
+#
+
+from array import array
+import numpy
+from nmosFet import NmosFet
+from wire import Wire
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+maxLanes = 64
+
+# The wire state of each plane, in the order of the kernel's arguments
+planeStates = [Wire.PULLED_HIGH, Wire.PULLED_LOW, Wire.GROUNDED, Wire.HIGH,
+               Wire.FLOATING_HIGH, Wire.FLOATING_LOW]
+PLANE_PULLED_HIGH   = 0
+PLANE_PULLED_LOW    = 1
+PLANE_GROUNDED      = 2
+PLANE_HIGH          = 3
+PLANE_FLOATING_HIGH = 4
+PLANE_FLOATING_LOW  = 5
+
+def recalcLaneIterations(recalcWires, recalcLanes, lastRecalcOrder, recalcFlags,
+                newRecalcWires, newRecalcLanes, newRecalcFlags, stepLimit,
+                sPH, sPL, sGND, sHI, sFH, sFL, pullHi, pullLo, fetGate,
+                wireCtOffsets, wireCtFets, wireCtOthers,
+                wireGateOffsets, wireGateFets, fetSide1, fetSide2,
+                member, groupWires, groupLanes,
+                stackWires, stackPos, stackLanes,
+                gndWireIndex, vccWireIndex, one, counters):
+    """ CircuitSimulatorBase.doRecalcIterations() over lane masks.
+        The wires to recalculate are entries of recalcWires[i] with the
+        lanes recalcLanes[i] to recalculate it in.  recalcFlags[w] has
+        the lanes in which wire w is in the list, as recalcArray does.
+        sPH ... sFL are the state planes, pullHi and pullLo the pulled
+        planes and fetGate the gate plane.  member and the flags must
+        be all zeros except for the entries given, and are left that
+        way.  counters[0] += entries recalculated, counters[1] +=
+        entries added to groups.  Returns the number of steps.
+        Every mask operation is between uint64s, so numba doesn't turn
+        any into floats. """
+    zero = one ^ one
+    numRecalculated = 0
+    numAddWireToGroup = 0
+    newLastRecalcOrder = 0
+    step = 0
+    while step < stepLimit:
+        if lastRecalcOrder == 0:
+            break
+
+        i = 0
+        while i < lastRecalcOrder:
+            wireIndex = recalcWires[i]
+            lanes = recalcLanes[i]
+            i += 1
+            newRecalcFlags[wireIndex] &= ~lanes
+            recalcFlags[wireIndex] &= ~lanes
+            numRecalculated += 1
+            if wireIndex == gndWireIndex or wireIndex == vccWireIndex:
+                continue
+
+            # Depth-first walk over the group in every lane at once.
+            # Each frame on the stack and each entry in the group list
+            # has the lanes that reached its wire there, so a lane's
+            # entries are in the order a walk of that lane alone adds
+            # its wires.  member[w] has the lanes w is in the group in.
+            member[wireIndex] = lanes
+            groupWires[0] = wireIndex
+            groupLanes[0] = lanes
+            groupLen = 1
+            stackWires[0] = wireIndex
+            stackPos[0] = wireCtOffsets[wireIndex]
+            stackLanes[0] = lanes
+            stackLen = 1
+            while stackLen > 0:
+                top = stackLen - 1
+                w = stackWires[top]
+                frameLanes = stackLanes[top]
+                pos = stackPos[top]
+                end = wireCtOffsets[w + 1]
+                pushed = False
+                while pos < end:
+                    other = wireCtOthers[pos]
+                    add = frameLanes & fetGate[wireCtFets[pos]] & ~member[other]
+                    pos += 1
+                    if add == zero:
+                        continue
+                    member[other] |= add
+                    groupWires[groupLen] = other
+                    groupLanes[groupLen] = add
+                    groupLen += 1
+                    # Like the other simulators, don't walk through
+                    # VCC or VSS
+                    if other != gndWireIndex and other != vccWireIndex:
+                        stackPos[top] = pos
+                        stackWires[stackLen] = other
+                        stackPos[stackLen] = wireCtOffsets[other]
+                        stackLanes[stackLen] = add
+                        stackLen += 1
+                        pushed = True
+                        break
+                if not pushed:
+                    stackLen -= 1
+            numAddWireToGroup += groupLen
+
+            # The group's value in each lane
+            grounded = zero
+            high = zero
+            pulledLow = zero
+            pulledHigh = zero
+            floatLow = zero
+            floatHigh = zero
+            g = 0
+            while g < groupLen:
+                w = groupWires[g]
+                m = groupLanes[g]
+                g += 1
+                if w == gndWireIndex:
+                    grounded |= m
+                elif w == vccWireIndex:
+                    high |= m
+                else:
+                    pulledLow |= m & pullLo[w]
+                    pulledHigh |= m & pullHi[w]
+                    floatLow |= m & sFL[w]
+                    floatHigh |= m & sFH[w]
+
+            rest = lanes
+            nGND = rest & grounded
+            rest &= ~grounded
+            nHI = rest & high
+            rest &= ~high
+            nPL = rest & pulledLow
+            rest &= ~pulledLow
+            nPH = rest & pulledHigh
+            rest &= ~pulledHigh
+            nFL = rest & floatLow & ~floatHigh
+            nFH = rest & floatHigh & ~floatLow
+            # With nothing driving or charging the group, it keeps the
+            # state of the wire being recalculated
+            keep = rest & ~(floatLow | floatHigh)
+            nPH |= keep & sPH[wireIndex]
+            nPL |= keep & sPL[wireIndex]
+            nGND |= keep & sGND[wireIndex]
+            nHI |= keep & sHI[wireIndex]
+            nFH |= keep & sFH[wireIndex]
+            nFL |= keep & sFL[wireIndex]
+            # Floating wires charged both ways.  The side with more
+            # transistors touching its wires wins, as in countWireSizes()
+            conflict = rest & floatLow & floatHigh
+            while conflict != zero:
+                bit = conflict & (~conflict + one)
+                conflict &= ~bit
+                countFl = 0
+                countFh = 0
+                g = 0
+                while g < groupLen:
+                    w = groupWires[g]
+                    m = groupLanes[g]
+                    g += 1
+                    if (m & bit) == zero:
+                        continue
+                    num = wireCtOffsets[w + 1] - wireCtOffsets[w] + \
+                          wireGateOffsets[w + 1] - wireGateOffsets[w]
+                    if (sFL[w] & bit) != zero:
+                        countFl += num
+                    if (sFH[w] & bit) != zero:
+                        countFh += num
+                if countFh < countFl:
+                    nFL |= bit
+                else:
+                    nFH |= bit
+            newHigh = nHI | nPH | nFH
+
+            # Set the group's wires and switch the transistors they
+            # gate, in each lane's own order
+            g = 0
+            while g < groupLen:
+                w = groupWires[g]
+                m = groupLanes[g]
+                g += 1
+                member[w] = zero
+                if w == gndWireIndex or w == vccWireIndex:
+                    continue
+                notM = ~m
+                sPH[w] = (sPH[w] & notM) | (nPH & m)
+                sPL[w] = (sPL[w] & notM) | (nPL & m)
+                sGND[w] = (sGND[w] & notM) | (nGND & m)
+                sHI[w] = (sHI[w] & notM) | (nHI & m)
+                sFH[w] = (sFH[w] & notM) | (nFH & m)
+                sFL[w] = (sFL[w] & notM) | (nFL & m)
+                highs = m & newHigh
+                lows = m & ~newHigh
+
+                pos = wireGateOffsets[w]
+                end = wireGateOffsets[w + 1]
+                while pos < end:
+                    t = wireGateFets[pos]
+                    pos += 1
+                    gate = fetGate[t]
+                    turnOn = highs & ~gate
+                    turnOff = lows & gate
+                    changed = turnOn | turnOff
+                    if changed == zero:
+                        continue
+                    fetGate[t] = (gate | turnOn) & ~turnOff
+                    if turnOff != zero:
+                        # Float both sides of the transistor
+                        for side in (fetSide1[t], fetSide2[t]):
+                            toPH = turnOff & pullHi[side]
+                            toPL = turnOff & pullLo[side]
+                            free = turnOff & ~(pullHi[side] | pullLo[side])
+                            toFL = free & (sGND[side] | sPL[side])
+                            toFH = free & (sHI[side] | sPH[side])
+                            setLanes = toPH | toPL | toFL | toFH
+                            if setLanes == zero:
+                                continue
+                            clear = ~setLanes
+                            sPH[side] = (sPH[side] & clear) | toPH
+                            sPL[side] = (sPL[side] & clear) | toPL
+                            sGND[side] &= clear
+                            sHI[side] &= clear
+                            sFH[side] = (sFH[side] & clear) | toFH
+                            sFL[side] = (sFL[side] & clear) | toFL
+                    # Add each side to the next list in the lanes it
+                    # isn't already waiting in
+                    for side in (fetSide1[t], fetSide2[t]):
+                        add = changed & ~newRecalcFlags[side]
+                        if add != zero:
+                            newRecalcFlags[side] |= add
+                            newRecalcWires[newLastRecalcOrder] = side
+                            newRecalcLanes[newLastRecalcOrder] = add
+                            newLastRecalcOrder += 1
+
+        tmpFlags = recalcFlags
+        recalcFlags = newRecalcFlags
+        newRecalcFlags = tmpFlags
+        tmpWires = recalcWires
+        recalcWires = newRecalcWires
+        newRecalcWires = tmpWires
+        tmpLanes = recalcLanes
+        recalcLanes = newRecalcLanes
+        newRecalcLanes = tmpLanes
+        lastRecalcOrder = newLastRecalcOrder
+        newLastRecalcOrder = 0
+        step += 1
+
+    # If the circuit didn't settle, drop the wires still waiting
+    # to be recalculated so the next update starts clean
+    i = 0
+    while i < lastRecalcOrder:
+        recalcFlags[recalcWires[i]] = zero
+        i += 1
+
+    counters[0] += numRecalculated
+    counters[1] += numAddWireToGroup
+    return step
+
+if numba != None:
+    recalcLaneIterations = numba.njit(cache=True)(recalcLaneIterations)
+
+
+class BitSlicedCircuitSimulator:
+    def __init__(self, chip, numLanes=maxLanes):
+        """ Makes numLanes copies of chip, a loaded Sim6502 or SimTIA on
+            any backend, each in chip's current state.  chip's netlist
+            and state hash keys are used, and chip isn't changed. """
+        if numLanes < 1 or numLanes > maxLanes:
+            raise RuntimeError('ERROR: numLanes must be from 1 to %d'%(maxLanes))
+        self.name = chip.__class__.__name__
+        self.numLanes = numLanes
+        self.allLanes = (1 << numLanes) - 1
+        self.numWires = chip.numWires
+        self.numFets = chip.numFets
+        self.gndWireIndex = chip.gndWireIndex
+        self.vccWireIndex = chip.vccWireIndex
+        self.wireNames = dict(chip.wireNames)
+        self.halfClkCount = chip.halfClkCount
+        self.recalcStepLimit = chip.recalcStepLimit
+        self.callback_addLogStr = chip.callback_addLogStr
+        self.netlistHash = chip.getNetlistHash()
+
+        netlist = chip.getNetlistArrays()
+        for attr, name in [('wireCtOffsets', 'WIRE_CT_OFFSETS'),
+                           ('wireCtFets', 'WIRE_CT_FETS'),
+                           ('wireCtOthers', 'WIRE_CT_OTHERS'),
+                           ('wireGateOffsets', 'WIRE_GATE_OFFSETS'),
+                           ('wireGateFets', 'WIRE_GATE_FETS'),
+                           ('fetSide1', 'FET_SIDE1'),
+                           ('fetSide2', 'FET_SIDE2')]:
+            setattr(self, attr, numpy.array(netlist[name], dtype=numpy.int32))
+
+        # Keys for computeLaneStateHash()
+        self.wireHashKeys = chip.wireHashKeys
+        self.pulledHashKeys = chip.pulledHashKeys
+        self.fetHashKeys = chip.fetHashKeys
+
+        numWires = self.numWires
+        self.statePlanes = numpy.zeros((len(planeStates), numWires), dtype=numpy.uint64)
+        self.pulledPlanes = numpy.zeros((2, numWires), dtype=numpy.uint64)
+        self.fetGate = numpy.zeros(self.numFets, dtype=numpy.uint64)
+        # Rows of the planes, for the kernel
+        self.planeRows = [self.statePlanes[i] for i in xrange(len(planeStates))]
+        self.pullHi = self.pulledPlanes[0]
+        self.pullLo = self.pulledPlanes[1]
+
+        # A wire can wait in the recalc lists and the group walk once
+        # for each lane, with separate entries where the lanes differ
+        cap = max(numWires, self.numFets) * numLanes
+        self.recalcWires = numpy.zeros(cap, dtype=numpy.int32)
+        self.recalcLanes = numpy.zeros(cap, dtype=numpy.uint64)
+        self.newRecalcWires = numpy.zeros(cap, dtype=numpy.int32)
+        self.newRecalcLanes = numpy.zeros(cap, dtype=numpy.uint64)
+        self.recalcFlags = numpy.zeros(numWires, dtype=numpy.uint64)
+        self.newRecalcFlags = numpy.zeros(numWires, dtype=numpy.uint64)
+        self.member = numpy.zeros(numWires, dtype=numpy.uint64)
+        self.groupWires = numpy.zeros(cap, dtype=numpy.int32)
+        self.groupLanes = numpy.zeros(cap, dtype=numpy.uint64)
+        self.stackWires = numpy.zeros(cap, dtype=numpy.int32)
+        self.stackPos = numpy.zeros(cap, dtype=numpy.int32)
+        self.stackLanes = numpy.zeros(cap, dtype=numpy.uint64)
+        self.counters = numpy.zeros(2, dtype=numpy.int64)
+        self.one = numpy.uint64(1)
+        self.laneBits = numpy.left_shift(numpy.uint64(1),
+                                         numpy.arange(numLanes, dtype=numpy.uint64))
+
+        self.numWiresRecalculated = 0
+        self.numAddWireToGroup = 0
+        self.numRecalcs = 0
+        self.numRecalcSteps = 0
+        self.maxRecalcSteps = 0
+
+        chipState = chip.getChipState()
+        for lane in xrange(numLanes):
+            self.setLaneChipState(lane, chipState)
+
+    # Lane masks are Python ints on this side, uint64 in the arrays
+    def toMask(self, lanes):
+        return numpy.uint64(lanes & self.allLanes)
+
+    def getLaneMask(self, lanes):
+        # A mask of the lanes in a list of lane numbers
+        mask = 0
+        for lane in lanes:
+            mask |= 1 << lane
+        return mask
+
+    def setLaneChipState(self, lane, chipState):
+        """ Sets one lane to a state from getChipState() of a chip with
+            the same netlist.  The half clock count is shared by the
+            lanes, so it's taken from chipState. """
+        halfClkCount, wireStates, gateStates, pulledStates = chipState
+        self.halfClkCount = halfClkCount
+        bit = numpy.uint64(1 << lane)
+        notBit = ~bit
+        wireStates = numpy.frombuffer(array('B', wireStates), dtype=numpy.uint8)
+        pulledStates = numpy.frombuffer(array('B', pulledStates), dtype=numpy.uint8)
+        gateStates = numpy.frombuffer(array('B', gateStates), dtype=numpy.uint8)
+        def setBits(plane, isSet):
+            plane &= notBit
+            plane |= isSet.astype(numpy.uint64) * bit
+        for plane, state in zip(self.planeRows, planeStates):
+            setBits(plane, wireStates == state)
+        setBits(self.pullHi, pulledStates == Wire.PULLED_HIGH)
+        setBits(self.pullLo, pulledStates == Wire.PULLED_LOW)
+        setBits(self.fetGate, gateStates == NmosFet.GATE_HIGH)
+
+    def getLaneBits(self, plane, lane):
+        return (plane >> numpy.uint64(lane)) & self.one
+
+    def getLaneWireStates(self, lane):
+        states = numpy.zeros(self.numWires, dtype=numpy.uint8)
+        for plane, state in zip(self.planeRows, planeStates):
+            states += (self.getLaneBits(plane, lane) * state).astype(numpy.uint8)
+        return array('B', states.tostring())
+
+    def getLaneGateStates(self, lane):
+        gates = self.getLaneBits(self.fetGate, lane).astype(numpy.uint8)
+        return array('B', gates.tostring())
+
+    def getLanePulledStates(self, lane):
+        pulled = self.getLaneBits(self.pullHi, lane) * Wire.PULLED_HIGH + \
+                 self.getLaneBits(self.pullLo, lane) * Wire.PULLED_LOW
+        return array('B', pulled.astype(numpy.uint8).tostring())
+
+    def getLaneChipState(self, lane):
+        """ The lane's state as getChipState() returns it, to be set on a
+            chip with setChipState() """
+        return (self.halfClkCount, self.getLaneWireStates(lane),
+                self.getLaneGateStates(lane), self.getLanePulledStates(lane))
+
+    def computeLaneStateHash(self, lane):
+        """ The state hash a lone chip in the lane's state would have """
+        h = 0
+        wireKeys = self.wireHashKeys
+        pulledKeys = self.pulledHashKeys
+        wireStates = self.getLaneWireStates(lane)
+        pulledStates = self.getLanePulledStates(lane)
+        for i in xrange(self.numWires):
+            h ^= wireKeys[wireStates[i]][i] ^ pulledKeys[pulledStates[i]][i]
+        fetKeys = self.fetHashKeys
+        for i, gateState in enumerate(self.getLaneGateStates(lane)):
+            if gateState == NmosFet.GATE_HIGH:
+                h ^= fetKeys[i]
+        return h
+
+    def getWireIndex(self, wireName):
+        return self.wireNames[wireName]
+
+    def getHighLanes(self, wireIndex):
+        """ Mask of the lanes in which the wire is high """
+        rows = self.planeRows
+        return int(rows[PLANE_HIGH][wireIndex] | rows[PLANE_PULLED_HIGH][wireIndex] |
+                   rows[PLANE_FLOATING_HIGH][wireIndex])
+
+    def getLowLanes(self, wireIndex):
+        rows = self.planeRows
+        return int(rows[PLANE_GROUNDED][wireIndex] | rows[PLANE_PULLED_LOW][wireIndex] |
+                   rows[PLANE_FLOATING_LOW][wireIndex])
+
+    def setPulled(self, wireIndex, highLanes, lanes=None):
+        """ Sets the wire pulled high in highLanes and pulled low in the
+            rest of lanes, all lanes if None.  Returns the mask of lanes
+            in which the wire's pulled state or state changed, which need
+            the wire recalculated. """
+        if lanes == None:
+            lanes = self.allLanes
+        rows = self.planeRows
+        pullHi = int(self.pullHi[wireIndex])
+        pullLo = int(self.pullLo[wireIndex])
+        highs = lanes & highLanes
+        lows = lanes & ~highLanes
+        same = (highs & pullHi & int(rows[PLANE_PULLED_HIGH][wireIndex])) | \
+               (lows & pullLo & int(rows[PLANE_PULLED_LOW][wireIndex]))
+        changed = lanes & ~same
+        if changed == 0:
+            return 0
+        keep = ~changed & self.allLanes
+        self.pullHi[wireIndex] = self.toMask((pullHi & keep) | highs)
+        self.pullLo[wireIndex] = self.toMask((pullLo & keep) | lows)
+        for plane in rows:
+            plane[wireIndex] &= numpy.uint64(keep)
+        rows[PLANE_PULLED_HIGH][wireIndex] |= self.toMask(changed & highs)
+        rows[PLANE_PULLED_LOW][wireIndex] |= self.toMask(changed & lows)
+        return changed
+
+    def setPulledList(self, wireIndices, highLanesList, changedWires, lanes=None):
+        """ setPulled() for each wire with the corresponding mask in
+            highLanesList.  (wire, changed lanes) is appended to
+            changedWires for each wire that changed. """
+        for wireIndex, highLanes in zip(wireIndices, highLanesList):
+            changed = self.setPulled(wireIndex, highLanes, lanes)
+            if changed != 0:
+                changedWires.append((wireIndex, changed))
+
+    def getLaneValues(self, wireIndices):
+        """ Reads wires as the bits of an integer, least significant
+            first, as WireBus does.  Returns a list of each lane's value. """
+        rows = self.planeRows
+        indices = numpy.array(wireIndices, dtype=numpy.int32)
+        highs = rows[PLANE_HIGH][indices] | rows[PLANE_PULLED_HIGH][indices] | \
+                rows[PLANE_FLOATING_HIGH][indices]
+        # [bit, lane] array of 0 and 1
+        bits = (highs[:, None] >> numpy.arange(self.numLanes, dtype=numpy.uint64)) & self.one
+        weights = numpy.left_shift(1, numpy.arange(len(wireIndices), dtype=numpy.int64))
+        return (bits.astype(numpy.int64) * weights[:, None]).sum(axis=0).tolist()
+
+    def getValueLanes(self, values, numBits, lanes=None):
+        """ The reverse of getLaneValues(): from a list of each lane's
+            value, returns a list of the mask of lanes with each bit set.
+            Only lanes in lanes, all if None, are included. """
+        if lanes == None:
+            lanes = self.allLanes
+        values = numpy.array(values, dtype=numpy.int64)
+        masks = []
+        for bit in xrange(numBits):
+            isSet = ((values >> bit) & 1).astype(numpy.uint64)
+            masks.append(int(numpy.bitwise_or.reduce(isSet * self.laneBits)) & lanes)
+        return masks
+
+    def recalcWireList(self, wireLanes):
+        """ Recalculates a list of (wire, lane mask) pairs """
+        numEntries = 0
+        for wireIndex, lanes in wireLanes:
+            lanes &= self.allLanes
+            if lanes == 0:
+                continue
+            mask = numpy.uint64(lanes)
+            self.recalcWires[numEntries] = wireIndex
+            self.recalcLanes[numEntries] = mask
+            self.recalcFlags[wireIndex] |= mask
+            numEntries += 1
+        if numEntries == 0:
+            return
+        self.doRecalcIterations(numEntries)
+
+    def recalcWire(self, wireIndex, lanes=None):
+        if lanes == None:
+            lanes = self.allLanes
+        self.recalcWireList([(wireIndex, lanes)])
+
+    def doRecalcIterations(self, lastRecalcOrder):
+        self.counters[:] = 0
+        rows = self.planeRows
+        step = recalcLaneIterations(
+            self.recalcWires, self.recalcLanes, lastRecalcOrder, self.recalcFlags,
+            self.newRecalcWires, self.newRecalcLanes, self.newRecalcFlags,
+            self.recalcStepLimit,
+            rows[PLANE_PULLED_HIGH], rows[PLANE_PULLED_LOW], rows[PLANE_GROUNDED],
+            rows[PLANE_HIGH], rows[PLANE_FLOATING_HIGH], rows[PLANE_FLOATING_LOW],
+            self.pullHi, self.pullLo, self.fetGate,
+            self.wireCtOffsets, self.wireCtFets, self.wireCtOthers,
+            self.wireGateOffsets, self.wireGateFets, self.fetSide1, self.fetSide2,
+            self.member, self.groupWires, self.groupLanes,
+            self.stackWires, self.stackPos, self.stackLanes,
+            self.gndWireIndex, self.vccWireIndex, self.one, self.counters)
+        # The kernel leaves the flags and member arrays all zeros, ready
+        # for the next recalc
+        self.numWiresRecalculated += int(self.counters[0])
+        self.numAddWireToGroup += int(self.counters[1])
+        self.numRecalcs += 1
+        self.numRecalcSteps += step
+        if step > self.maxRecalcSteps:
+            self.maxRecalcSteps = step
+        self.checkConvergence(step)
+
+    def checkConvergence(self, step):
+        # As CircuitSimulatorBase.checkConvergence(): the first recalc
+        # of the chip, while it settles, may not converge in some lane,
+        # but any later one that doesn't raises
+        stepLimit = self.recalcStepLimit
+        if step >= stepLimit:
+            msg = 'ERROR: Sim "%s" did not converge after %d iterations'% \
+                  (self.name, stepLimit)
+            if self.callback_addLogStr:
+                self.callback_addLogStr(msg)
+            if self.halfClkCount > 0:
+                raise RuntimeError(msg)
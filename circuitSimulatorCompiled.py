@@ -0,0 +1,416 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+#------------------------------------------------------------------------------
+#
+# circuitSimulatorCompiled.py
+# The arrays circuit simulator with doRecalcIterations() and the group
+# flood fill of doWireRecalc() run as one numba JIT-compiled kernel
+# over the simulator's integer arrays.
+#
+# numba and numpy are optional.  If they can't be imported, this
+# simulator runs the Python code of circuitSimulatorUsingArrays,
+# which gives identical results, only slower.
+#   pip install numba
+#
+# The kernel follows the Python code step by step, including the
+# order in which wires are added to groups and transistors are
+# switched, so every wire and transistor ends up in the same state
+# as with the Lists simulator after every half clock.
+#
+
+from array import array
+from circuitSimulatorUsingArrays import CircuitSimulator as ArraysCircuitSimulator
+
+try:
+    import numpy
+    import numba
+except ImportError:
+    numpy = None
+    numba = None
+    print('Could not import numba.  The compiled circuit simulator ' +
+          'will run the arrays simulator Python code instead')
+
+# Wire and NmosFet values, repeated here as plain module constants
+# so the compiled kernel can use them
+PULLED_HIGH   = 1 << 0
+PULLED_LOW    = 1 << 1
+GROUNDED      = 1 << 2
+HIGH          = 1 << 3
+FLOATING_HIGH = 1 << 4
+FLOATING_LOW  = 1 << 5
+GATE_LOW  = 0
+GATE_HIGH = 1
+
+def recalcIterations(recalcOrder, recalcArray, newRecalcOrder, newRecalcArray,
+                     lastRecalcOrder, stepLimit,
+                     wireState, wirePulled,
+                     wireCtOffsets, wireCtFets, wireCtOthers,
+                     wireGateOffsets, wireGateFets,
+                     fetSide1, fetSide2, fetGateState,
+                     lastWireGroupState, groupState, groupList, stackWires, stackPos,
+                     gndWireIndex, vccWireIndex, wireHashKeys, fetHashKeys,
+                     counters, recordChanges, wireChanged, fetChanged):
+    """ Same as CircuitSimulatorBase.doRecalcIterations() with the
+        arrays simulator's doWireRecalc(), turnTransistorOn() and
+        turnTransistorOff() written inline.
+        counters[0] += wires recalculated, counters[1] += wires added
+        to groups.  counters[2] is the state hash, which is updated with
+        wireHashKeys[state, wireIndex] and fetHashKeys[fetIndex].
+        If recordChanges, wireChanged and fetChanged are set to 1 for
+        each wire and transistor whose state changes.
+        Returns (number of steps, last group state). """
+    stateHash = counters[2]
+    numRecalculated = 0
+    numAddWireToGroup = 0
+    newLastRecalcOrder = 0
+    step = 0
+    while step < stepLimit:
+        if lastRecalcOrder == 0:
+            break
+
+        i = 0
+        while i < lastRecalcOrder:
+            wireIndex = recalcOrder[i]
+            newRecalcArray[wireIndex] = 0
+            i += 1
+            numRecalculated += 1
+            if wireIndex == gndWireIndex or wireIndex == vccWireIndex:
+                recalcArray[wireIndex] = 0
+                continue
+
+            # Flood fill the group of connected wires
+            groupState += 1
+            lastWireGroupState[wireIndex] = groupState
+            groupList[0] = wireIndex
+            groupLen = 1
+            state = wireState[wireIndex]
+            groupValue = wirePulled[wireIndex]
+            if state == FLOATING_LOW or state == FLOATING_HIGH:
+                groupValue |= state
+            stackWires[0] = wireIndex
+            stackPos[0] = wireCtOffsets[wireIndex]
+            stackLen = 1
+            while stackLen > 0:
+                top = stackLen - 1
+                pos = stackPos[top]
+                end = wireCtOffsets[stackWires[top] + 1]
+                pushed = False
+                while pos < end:
+                    other = wireCtOthers[pos]
+                    if fetGateState[wireCtFets[pos]] == GATE_LOW or \
+                       lastWireGroupState[other] == groupState:
+                        pos += 1
+                        continue
+                    stackPos[top] = pos + 1
+                    lastWireGroupState[other] = groupState
+                    groupList[groupLen] = other
+                    groupLen += 1
+                    if other == gndWireIndex:
+                        groupValue |= GROUNDED
+                    elif other == vccWireIndex:
+                        groupValue |= HIGH
+                    else:
+                        groupValue |= wirePulled[other]
+                        state = wireState[other]
+                        if state == FLOATING_LOW or state == FLOATING_HIGH:
+                            groupValue |= state
+                        stackWires[stackLen] = other
+                        stackPos[stackLen] = wireCtOffsets[other]
+                        stackLen += 1
+                    pushed = True
+                    break
+                if not pushed:
+                    stackLen -= 1
+            numAddWireToGroup += groupLen
+
+            # Resolve the group's value
+            newValue = wireState[wireIndex]
+            if groupValue & GROUNDED != 0:
+                newValue = GROUNDED
+            elif groupValue & HIGH != 0:
+                newValue = HIGH
+            elif groupValue & PULLED_LOW != 0:
+                newValue = PULLED_LOW
+            elif groupValue & PULLED_HIGH != 0:
+                newValue = PULLED_HIGH
+            elif groupValue & FLOATING_LOW != 0 and \
+                 groupValue & FLOATING_HIGH != 0:
+                countFl = 0
+                countFh = 0
+                g = 0
+                while g < groupLen:
+                    w = groupList[g]
+                    g += 1
+                    num = wireCtOffsets[w + 1] - wireCtOffsets[w] + \
+                          wireGateOffsets[w + 1] - wireGateOffsets[w]
+                    if wireState[w] == FLOATING_LOW:
+                        countFl += num
+                    if wireState[w] == FLOATING_HIGH:
+                        countFh += num
+                if countFh < countFl:
+                    newValue = FLOATING_LOW
+                else:
+                    newValue = FLOATING_HIGH
+            elif groupValue & FLOATING_LOW != 0:
+                newValue = FLOATING_LOW
+            elif groupValue & FLOATING_HIGH != 0:
+                newValue = FLOATING_HIGH
+
+            newHigh = newValue == HIGH or newValue == PULLED_HIGH or \
+                      newValue == FLOATING_HIGH
+
+            # Set the group's wires and switch the transistors they gate
+            g = 0
+            while g < groupLen:
+                w = groupList[g]
+                g += 1
+                if w == gndWireIndex or w == vccWireIndex:
+                    continue
+                if wireState[w] != newValue:
+                    stateHash ^= wireHashKeys[wireState[w], w] ^ \
+                                 wireHashKeys[newValue, w]
+                    if recordChanges:
+                        wireChanged[w] = 1
+                wireState[w] = newValue
+                pos = wireGateOffsets[w]
+                end = wireGateOffsets[w + 1]
+                while pos < end:
+                    t = wireGateFets[pos]
+                    pos += 1
+                    if newHigh:
+                        if fetGateState[t] != GATE_LOW:
+                            continue
+                        fetGateState[t] = GATE_HIGH
+                        stateHash ^= fetHashKeys[t]
+                        if recordChanges:
+                            fetChanged[t] = 1
+                    else:
+                        if fetGateState[t] != GATE_HIGH:
+                            continue
+                        fetGateState[t] = GATE_LOW
+                        stateHash ^= fetHashKeys[t]
+                        if recordChanges:
+                            fetChanged[t] = 1
+                        # Float both sides of the transistor
+                        for side in (fetSide1[t], fetSide2[t]):
+                            pulled = wirePulled[side]
+                            sideState = wireState[side]
+                            newSideState = sideState
+                            if pulled == PULLED_HIGH:
+                                newSideState = PULLED_HIGH
+                            elif pulled == PULLED_LOW:
+                                newSideState = PULLED_LOW
+                            elif sideState == GROUNDED or sideState == PULLED_LOW:
+                                newSideState = FLOATING_LOW
+                            elif sideState == HIGH or sideState == PULLED_HIGH:
+                                newSideState = FLOATING_HIGH
+                            if newSideState != sideState:
+                                stateHash ^= wireHashKeys[sideState, side] ^ \
+                                             wireHashKeys[newSideState, side]
+                                wireState[side] = newSideState
+                                if recordChanges:
+                                    wireChanged[side] = 1
+                    for side in (fetSide1[t], fetSide2[t]):
+                        if newRecalcArray[side] == 0:
+                            newRecalcArray[side] = 1
+                            newRecalcOrder[newLastRecalcOrder] = side
+                            newLastRecalcOrder += 1
+
+            recalcArray[wireIndex] = 0
+
+        tmpArray = recalcArray
+        recalcArray = newRecalcArray
+        newRecalcArray = tmpArray
+        tmpOrder = recalcOrder
+        recalcOrder = newRecalcOrder
+        newRecalcOrder = tmpOrder
+
+        lastRecalcOrder = newLastRecalcOrder
+        newLastRecalcOrder = 0
+        step += 1
+
+    # If the circuit didn't settle, drop the wires still waiting
+    # to be recalculated so the next update starts clean
+    if step >= stepLimit:
+        recalcArray[:] = 0
+        newRecalcArray[:] = 0
+
+    counters[0] += numRecalculated
+    counters[1] += numAddWireToGroup
+    counters[2] = stateHash
+    return step, groupState
+
+if numba != None:
+    recalcIterations = numba.njit(cache=True)(recalcIterations)
+
+
+class CircuitSimulator(ArraysCircuitSimulator):
+    def __init__(self):
+        ArraysCircuitSimulator.__init__(self)
+        self.counters = None
+
+    def initScratchArrays(self):
+        ArraysCircuitSimulator.initScratchArrays(self)
+        if numba == None:
+            return
+
+        # Replace the array.array objects with numpy arrays the
+        # compiled kernel can use.
+        for name in ['wireState', 'wirePulled', 'fetGateState',
+                     'wireCtOffsets', 'wireCtFets', 'wireCtOthers',
+                     'wireGateOffsets', 'wireGateFets', 'fetSide1', 'fetSide2',
+                     'fetGate', 'groupList', 'stackWires', 'stackPos']:
+            setattr(self, name, numpy.array(getattr(self, name), dtype=numpy.int32))
+        self.lastWireGroupState = numpy.array(self.lastWireGroupState, dtype=numpy.int64)
+        self.counters = numpy.zeros(3, dtype=numpy.int64)
+        # The kernel's record of the states it changed while a recalc
+        # is recorded for the cache, see getRecalcChanges()
+        self.wireChanged = numpy.zeros(self.numWires, dtype=numpy.uint8)
+        self.fetChanged = numpy.zeros(self.numFets, dtype=numpy.uint8)
+
+    def initStateHash(self):
+        ArraysCircuitSimulator.initStateHash(self)
+        if numba == None:
+            return
+
+        # The same keys as numpy arrays for the kernel, with a row of
+        # zeros for each value that isn't a wire state
+        zeros = [0] * self.numWires
+        self.wireHashKeyArray = numpy.array(
+            [keys if keys != None else zeros for keys in self.wireHashKeys],
+            dtype=numpy.int64)
+        self.fetHashKeyArray = numpy.array(self.fetHashKeys, dtype=numpy.int64)
+
+    def prepForRecalc(self):
+        if numba == None:
+            ArraysCircuitSimulator.prepForRecalc(self)
+            return
+
+        if self.recalcArray is None:
+            self.recalcCap = max(self.numFets, self.numWires)
+            self.recalcArray = numpy.zeros(self.recalcCap, dtype=numpy.uint8)
+            self.recalcOrder = numpy.zeros(self.recalcCap, dtype=numpy.int32)
+            self.newRecalcOrder = numpy.zeros(self.recalcCap, dtype=numpy.int32)
+            self.newRecalcArray = numpy.zeros(self.recalcCap, dtype=numpy.uint8)
+
+        self.newLastRecalcOrder = 0
+        self.lastRecalcOrder = 0
+
+    def doRecalcIterations(self):
+        if numba == None:
+            ArraysCircuitSimulator.doRecalcIterations(self)
+            return
+
+        self.counters[:] = 0
+        self.counters[2] = self.stateHash
+        recordChanges = self.changedWires != None
+        step, self.lastChipGroupState = recalcIterations(
+            self.recalcOrder, self.recalcArray,
+            self.newRecalcOrder, self.newRecalcArray,
+            self.lastRecalcOrder, self.recalcStepLimit,
+            self.wireState, self.wirePulled,
+            self.wireCtOffsets, self.wireCtFets, self.wireCtOthers,
+            self.wireGateOffsets, self.wireGateFets,
+            self.fetSide1, self.fetSide2, self.fetGateState,
+            self.lastWireGroupState, self.lastChipGroupState,
+            self.groupList, self.stackWires, self.stackPos,
+            self.gndWireIndex, self.vccWireIndex,
+            self.wireHashKeyArray, self.fetHashKeyArray, self.counters,
+            recordChanges, self.wireChanged, self.fetChanged)
+        self.numWiresRecalculated += int(self.counters[0])
+        self.numAddWireToGroup += int(self.counters[1])
+        self.stateHash = int(self.counters[2])
+        self.lastRecalcOrder = 0
+
+        self.countRecalcSteps(step)
+        self.checkConvergence(step)
+
+    def getWireStates(self):
+        if numba == None:
+            return ArraysCircuitSimulator.getWireStates(self)
+        return array('B', self.wireState.astype(numpy.uint8).tostring())
+
+    def getWireStateGetter(self, wireIndices):
+        if numba == None:
+            return ArraysCircuitSimulator.getWireStateGetter(self, wireIndices)
+        # One take() reads all of the states, and tolist() returns them
+        # as ints rather than slower numpy scalars
+        indices = numpy.array(wireIndices, dtype=numpy.int32)
+        return lambda: tuple(self.wireState.take(indices).tolist())
+
+    def getWireStateStringGetter(self, wireIndices):
+        if numba == None:
+            return ArraysCircuitSimulator.getWireStateStringGetter(self, wireIndices)
+        indices = numpy.array(wireIndices, dtype=numpy.int32)
+        return lambda: self.wireState.take(indices).astype(numpy.uint8).tostring()
+
+    def getRecalcChanges(self):
+        if numba == None:
+            return ArraysCircuitSimulator.getRecalcChanges(self)
+        # The indices stay numpy arrays, for setWireStateList() and
+        # setGateStateList() to use as they are
+        wires = numpy.flatnonzero(self.wireChanged)
+        fets = numpy.flatnonzero(self.fetChanged)
+        self.wireChanged[wires] = 0
+        self.fetChanged[fets] = 0
+        self.changedWires = None
+        self.changedFets = None
+        return (wires, self.wireState[wires], fets, self.fetGateState[fets])
+
+    def setWireStateList(self, wireIndices, states):
+        if numba == None:
+            ArraysCircuitSimulator.setWireStateList(self, wireIndices, states)
+            return
+        self.wireState[numpy.asarray(wireIndices)] = states
+
+    def setGateStateList(self, fetIndices, states):
+        if numba == None:
+            ArraysCircuitSimulator.setGateStateList(self, fetIndices, states)
+            return
+        self.fetGateState[numpy.asarray(fetIndices)] = states
+
+    def getGateStates(self):
+        if numba == None:
+            return ArraysCircuitSimulator.getGateStates(self)
+        return array('B', self.fetGateState.astype(numpy.uint8).tostring())
+
+    def getPulledStates(self):
+        if numba == None:
+            return ArraysCircuitSimulator.getPulledStates(self)
+        return array('B', self.wirePulled.astype(numpy.uint8).tostring())
+
+    def setWireStates(self, states):
+        if numba == None:
+            ArraysCircuitSimulator.setWireStates(self, states)
+            return
+        self.wireState[:] = numpy.frombuffer(array('B', states), dtype=numpy.uint8)
+
+    def setGateStates(self, states):
+        if numba == None:
+            ArraysCircuitSimulator.setGateStates(self, states)
+            return
+        self.fetGateState[:] = numpy.frombuffer(array('B', states), dtype=numpy.uint8)
+
+    def setPulledStates(self, states):
+        if numba == None:
+            ArraysCircuitSimulator.setPulledStates(self, states)
+            return
+        self.wirePulled[:] = numpy.frombuffer(array('B', states), dtype=numpy.uint8)
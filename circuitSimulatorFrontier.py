@@ -0,0 +1,172 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+#------------------------------------------------------------------------------
+#
+# circuitSimulatorFrontier.py
+# The arrays circuit simulator, with the recalc steps that have many
+# wires to recalculate done by the FrontierRecalc of
+# circuitSimulatorBatched.py.  Instead of flood filling one wire's group
+# at a time, it finds the groups of every wire in the step at once with
+# numpy operations over the transistors that are on, resolves each
+# group's value from the OR of its wires' states, and takes the next
+# step's wires from the transistors that switched.
+#
+# Each of its steps costs a few hundred microseconds of numpy overhead
+# however few wires it has, and most steps have only a handful, so
+# steps with fewer than frontierMinWires wires run the arrays
+# simulator's Python code.  Either way the step limit, the check for
+# convergence and the results are the same as the other simulators'.
+#
+# Needs numpy.  The states stay in the arrays simulator's array.array
+# objects, and the FrontierRecalc works on numpy views of them.
+#
+
+import numpy
+from circuitSimulatorUsingArrays import CircuitSimulator as ArraysCircuitSimulator
+from circuitSimulatorBatched import FrontierRecalc
+
+class CircuitSimulator(ArraysCircuitSimulator):
+    # Steps with at least this many wires are done by the FrontierRecalc
+    frontierMinWires = 128
+
+    def __init__(self):
+        ArraysCircuitSimulator.__init__(self)
+        self.frontierRecalc = None
+        self.numFrontierSteps = 0
+
+    def initScratchArrays(self):
+        ArraysCircuitSimulator.initScratchArrays(self)
+        self.frontierRecalc = FrontierRecalc(self.getNetlistArrays(),
+                                             self.numWires, self.numFets,
+                                             self.gndWireIndex,
+                                             self.vccWireIndex, 1)
+
+    def initStateHash(self):
+        ArraysCircuitSimulator.initStateHash(self)
+        # The same keys as numpy arrays, with a row of zeros for each
+        # value that isn't a wire state
+        zeros = [0] * self.numWires
+        self.wireHashKeyArray = numpy.array(
+            [keys if keys != None else zeros for keys in self.wireHashKeys],
+            dtype=numpy.int64)
+        self.fetHashKeyArray = numpy.array(self.fetHashKeys, dtype=numpy.int64)
+
+    def recalcAllWires(self):
+        # The first settle of a chip may stop at the step limit without
+        # converging, as the TIA's does, and where it stops depends on
+        # the order the wires were recalculated in.  Settling one wire
+        # at a time starts the chip in the same state as the other
+        # simulators.
+        frontierMinWires = self.frontierMinWires
+        self.frontierMinWires = self.numWires + 1
+        try:
+            ArraysCircuitSimulator.recalcAllWires(self)
+        finally:
+            self.frontierMinWires = frontierMinWires
+
+    def doRecalcIterations(self):
+        step = 0
+        stepLimit = self.recalcStepLimit
+
+        while step < stepLimit:
+            if self.lastRecalcOrder == 0:
+                break
+
+            if self.lastRecalcOrder >= self.frontierMinWires:
+                self.doFrontierStep()
+                step += 1
+                continue
+
+            i = 0
+            while i < self.lastRecalcOrder:
+                wireIndex = self.recalcOrder[i]
+                self.newRecalcArray[wireIndex] = 0
+
+                self.doWireRecalc(wireIndex)
+
+                self.recalcArray[wireIndex] = False
+                self.numWiresRecalculated += 1
+                i += 1
+
+            tmp = self.recalcArray
+            self.recalcArray = self.newRecalcArray
+            self.newRecalcArray = tmp
+            tmp = self.recalcOrder
+            self.recalcOrder = self.newRecalcOrder
+            self.newRecalcOrder = tmp
+
+            self.lastRecalcOrder = int(self.newLastRecalcOrder)
+            self.newLastRecalcOrder = 0
+
+            step += 1
+
+        self.countRecalcSteps(step)
+        self.checkConvergence(step)
+        self.checkRecalcArray(step)
+
+    def doFrontierStep(self):
+        # One step of doRecalcIterations() by the FrontierRecalc, which
+        # leaves the next step's wires in recalcOrder as the Python code
+        # would
+        wires = self.recalcOrder[:self.lastRecalcOrder]
+        recalcArray = self.recalcArray
+        for wireIndex in wires:
+            recalcArray[wireIndex] = False
+
+        # Views of the arrays are made each time, in case an array was
+        # replaced since the last step
+        wireState = numpy.frombuffer(self.wireState, dtype=numpy.uint8)
+        gateState = numpy.frombuffer(self.fetGateState, dtype=numpy.uint8)
+        wirePulled = numpy.frombuffer(self.wirePulled, dtype=numpy.uint8)
+        lastWireState = wireState.copy()
+        lastGateState = gateState.copy()
+
+        recalc = self.frontierRecalc
+        numAddWireToGroup = recalc.numAddWireToGroup
+        nextWires = recalc.recalcStep(numpy.array(wires, dtype=numpy.int64),
+                                      wireState, wirePulled, gateState)
+        self.numWiresRecalculated += len(wires)
+        self.numAddWireToGroup += recalc.numAddWireToGroup - numAddWireToGroup
+        self.numFrontierSteps += 1
+        self.updateStateHash(lastWireState, wireState, lastGateState, gateState)
+
+        nextWires = nextWires.tolist()
+        self.lastRecalcOrder = len(nextWires)
+        self.recalcOrder[:self.lastRecalcOrder] = nextWires
+        for wireIndex in nextWires:
+            recalcArray[wireIndex] = True
+
+    def updateStateHash(self, lastWireState, wireState, lastGateState, gateState):
+        # XOR out the keys of the states that changed and XOR in the new
+        # ones.  Recalculating doesn't change the pulled states.
+        wires = numpy.flatnonzero(lastWireState != wireState)
+        fets = numpy.flatnonzero(lastGateState != gateState)
+        if len(wires) == 0 and len(fets) == 0:
+            return
+        if self.changedWires != None:
+            self.changedWires.extend(wires.tolist())
+            self.changedFets.extend(fets.tolist())
+        keys = self.wireHashKeyArray
+        change = numpy.bitwise_xor.reduce(
+            keys[lastWireState[wires], wires] ^ keys[wireState[wires], wires])
+        change ^= numpy.bitwise_xor.reduce(self.fetHashKeyArray[fets])
+        self.stateHash ^= int(change)
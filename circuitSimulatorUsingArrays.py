@@ -0,0 +1,487 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+#------------------------------------------------------------------------------
+#
+# circuitSimulatorUsingArrays.py
+# A circuit simulator that keeps all of the circuit's state and
+# connectivity in flat arrays indexed by wire or transistor index,
+# rather than in the attributes of Wire and NmosFet objects.
+#
+# The connections from each wire to its transistors are stored in
+# compressed sparse row (CSR) form.  The transistors whose source or
+# drain connect to wire w are:
+#    wireCtFets[wireCtOffsets[w] : wireCtOffsets[w+1]]
+# and wireCtOthers holds, for each of those entries, the wire on
+# the other side of the transistor.  The transistors whose gates
+# are driven by wire w are:
+#    wireGateFets[wireGateOffsets[w] : wireGateOffsets[w+1]]
+#
+# When loaded from a pickle file, the Wire and NmosFet objects in
+# wireList and transistorList are kept for their names and connectivity,
+# but their .state, .pulled and .gateState are not updated as the
+# simulation runs.  When loaded from a binary netlist file (see
+# netlistFile.py), no Wire or NmosFet objects are made and wireList and
+# transistorList are None.
+#
+# The arrays are array.array objects, so they can be handed to numpy
+# (numpy.frombuffer) or to compiled code without copying.
+#
+
+import operator
+from array import array
+import netlistFile
+from circuitSimulatorBase import CircuitSimulatorBase
+from nmosFet import NmosFet
+from wire import Wire
+
+class CircuitSimulator(CircuitSimulatorBase):
+    def __init__(self):
+        CircuitSimulatorBase.__init__(self)
+
+        # Per-wire state, indexed by wire index
+        self.wireState = None        # array('B') of Wire.state values
+        self.wirePulled = None       # array('B') of Wire.pulled values
+        self.wireNameList = None     # list of each wire's name string
+
+        # CSR adjacency, see above
+        self.wireCtOffsets = None    # array('i') of numWires + 1 entries
+        self.wireCtFets = None       # array('i')
+        self.wireCtOthers = None     # array('i')
+        self.wireGateOffsets = None  # array('i') of numWires + 1 entries
+        self.wireGateFets = None     # array('i')
+
+        # Per-transistor state, indexed by transistor index
+        self.fetSide1 = None         # array('i') wire index
+        self.fetSide2 = None         # array('i') wire index
+        self.fetGate = None          # array('i') wire index
+        self.fetGateState = None     # array('B') of NmosFet.GATE_LOW or GATE_HIGH
+
+        self.lastChipGroupState = 0
+        self.groupList = []
+        self.groupListLastIndex = 0
+        self.groupValue = 0
+
+        # Explicit stack used in place of recursion when adding
+        # wires to a group
+        self.stackWires = []
+        self.stackPos = []
+
+    def loadCircuit(self, filePath):
+        data = CircuitSimulatorBase.loadCircuit(self, filePath)
+        if self.wireList != None:
+            self.buildArrays()
+        self.initScratchArrays()
+        self.initStateHash()
+        return data
+
+    def loadNetlistFile(self, filePath):
+        """ Takes the arrays straight from a binary netlist file without
+            building any Wire or NmosFet objects.  wireList and
+            transistorList are left as None. """
+        netlist = netlistFile.NetlistFile(filePath)
+        if self.collapseStaticNetlist and not netlist.staticCollapsed:
+            # collapseStaticWires() works on Wire and NmosFet objects
+            return CircuitSimulatorBase.loadNetlistFile(self, filePath)
+
+        print 'Loading %s' % filePath
+        self.wireList = None
+        self.transistorList = None
+        self.numWires = netlist.numWires
+        self.numFets = netlist.numFets
+        self.setNetlistArrays(netlist.getPyArray)
+
+        self.wireNameList = netlist.getWireNames()
+        self.wireNames.update(zip(self.wireNameList, xrange(self.numWires)))
+        assert self.wireNames['VCC'] == netlist.vccWireIndex
+        assert self.wireNames['VSS'] == netlist.gndWireIndex
+        self.vccWireIndex = netlist.vccWireIndex
+        self.gndWireIndex = netlist.gndWireIndex
+        if netlist.staticCollapsed:
+            self.staticWireRep = list(netlist.getPyArray('WIRE_STATIC_REP'))
+
+        self.wireState = array('B', self.wirePulled)
+        self.wireState[self.vccWireIndex] = Wire.HIGH
+        self.wireState[self.gndWireIndex] = Wire.GROUNDED
+        self.fetGateState = array('B', [NmosFet.GATE_LOW]) * self.numFets
+        for pos in xrange(self.wireGateOffsets[self.vccWireIndex],
+                          self.wireGateOffsets[self.vccWireIndex + 1]):
+            self.fetGateState[self.wireGateFets[pos]] = NmosFet.GATE_HIGH
+
+        self.lastWireGroupState = [-1] * self.numWires
+        return netlist
+
+    def setNetlistArrays(self, getArray):
+        """ getArray(sectionName) returns an array.array of one of the
+            sections listed in netlistFile.sectionTypes """
+        self.wirePulled = getArray('WIRE_PULLED')
+        self.wireCtOffsets = getArray('WIRE_CT_OFFSETS')
+        self.wireCtFets = getArray('WIRE_CT_FETS')
+        self.wireCtOthers = getArray('WIRE_CT_OTHERS')
+        self.wireGateOffsets = getArray('WIRE_GATE_OFFSETS')
+        self.wireGateFets = getArray('WIRE_GATE_FETS')
+        self.fetSide1 = getArray('FET_SIDE1')
+        self.fetSide2 = getArray('FET_SIDE2')
+        self.fetGate = getArray('FET_GATE')
+
+    def buildArrays(self):
+        """ Copy state and connectivity from wireList and transistorList """
+        data = CircuitSimulatorBase.getNetlistArrays(self)
+        self.setNetlistArrays(data.get)
+        self.wireNameList = data['WIRE_NAMES']
+
+        self.wireState = array('B', [0] * self.numWires)
+        for i, wire in enumerate(self.wireList):
+            if wire != None:
+                self.wireState[i] = wire.state
+        self.fetGateState = array('B', [NmosFet.GATE_LOW] * self.numFets)
+        for i, trans in enumerate(self.transistorList):
+            if trans != None:
+                self.fetGateState[i] = trans.gateState
+
+    def initScratchArrays(self):
+        self.groupList = [0] * self.numWires
+        self.stackWires = [0] * self.numWires
+        self.stackPos = [0] * self.numWires
+
+    def getNetlistArrays(self):
+        if self.wireList != None:
+            return CircuitSimulatorBase.getNetlistArrays(self)
+        data = dict()
+        data['WIRE_PULLED'] = array('B', self.wirePulled)
+        for name, arr in [('WIRE_CT_OFFSETS', self.wireCtOffsets),
+                          ('WIRE_CT_FETS', self.wireCtFets),
+                          ('WIRE_CT_OTHERS', self.wireCtOthers),
+                          ('WIRE_GATE_OFFSETS', self.wireGateOffsets),
+                          ('WIRE_GATE_FETS', self.wireGateFets),
+                          ('FET_SIDE1', self.fetSide1),
+                          ('FET_SIDE2', self.fetSide2),
+                          ('FET_GATE', self.fetGate)]:
+            data[name] = array('i', arr)
+        if self.staticWireRep != None:
+            data['WIRE_STATIC_REP'] = array('i', self.staticWireRep)
+        else:
+            data['WIRE_STATIC_REP'] = array('i', range(self.numWires))
+        data['WIRE_NAMES'] = list(self.wireNameList)
+        return data
+
+    def doWireRecalc(self, wireIndex):
+        gndWireIndex = self.gndWireIndex
+        vccWireIndex = self.vccWireIndex
+        if wireIndex == gndWireIndex or wireIndex == vccWireIndex:
+            return
+
+        wireState = self.wireState
+        wirePulled = self.wirePulled
+        wireCtOffsets = self.wireCtOffsets
+        wireCtOthers = self.wireCtOthers
+        wireCtFets = self.wireCtFets
+        fetGateState = self.fetGateState
+        lastWireGroupState = self.lastWireGroupState
+        groupList = self.groupList
+        stackWires = self.stackWires
+        stackPos = self.stackPos
+
+        self.lastChipGroupState += 1
+        groupState = self.lastChipGroupState
+
+        # Depth-first walk over the wires connected to wireIndex through
+        # transistors that are on.  Wires are added to groupList in the
+        # same order that the recursive walk of the Lists simulator
+        # adds them.
+        lastWireGroupState[wireIndex] = groupState
+        groupList[0] = wireIndex
+        groupLen = 1
+        state = wireState[wireIndex]
+        groupValue = wirePulled[wireIndex]
+        if state == Wire.FLOATING_LOW or state == Wire.FLOATING_HIGH:
+            groupValue |= state
+        stackWires[0] = wireIndex
+        stackPos[0] = wireCtOffsets[wireIndex]
+        stackLen = 1
+
+        while stackLen > 0:
+            top = stackLen - 1
+            pos = stackPos[top]
+            end = wireCtOffsets[stackWires[top] + 1]
+            while pos < end:
+                other = wireCtOthers[pos]
+                if fetGateState[wireCtFets[pos]] == NmosFet.GATE_LOW or \
+                   lastWireGroupState[other] == groupState:
+                    pos += 1
+                    continue
+                stackPos[top] = pos + 1
+
+                lastWireGroupState[other] = groupState
+                groupList[groupLen] = other
+                groupLen += 1
+                if other == gndWireIndex:
+                    groupValue |= Wire.GROUNDED
+                elif other == vccWireIndex:
+                    groupValue |= Wire.HIGH
+                else:
+                    groupValue |= wirePulled[other]
+                    state = wireState[other]
+                    if state == Wire.FLOATING_LOW or state == Wire.FLOATING_HIGH:
+                        groupValue |= state
+                    stackWires[stackLen] = other
+                    stackPos[stackLen] = wireCtOffsets[other]
+                    stackLen += 1
+                break
+            else:
+                stackLen -= 1
+
+        self.numAddWireToGroup += groupLen
+        self.groupListLastIndex = groupLen
+        self.groupValue = groupValue
+
+        newValue = wireState[wireIndex]
+        if groupValue & Wire.GROUNDED != 0:
+            newValue = Wire.GROUNDED
+        elif groupValue & Wire.HIGH != 0:
+            newValue = Wire.HIGH
+        elif groupValue & Wire.PULLED_LOW:
+            newValue = Wire.PULLED_LOW
+        elif groupValue & Wire.PULLED_HIGH:
+            newValue = Wire.PULLED_HIGH
+        elif groupValue & Wire.FLOATING_LOW != 0 and \
+             groupValue & Wire.FLOATING_HIGH != 0:
+            newValue = self.countWireSizes()
+        elif groupValue & Wire.FLOATING_LOW != 0:
+            newValue = Wire.FLOATING_LOW
+        elif groupValue & Wire.FLOATING_HIGH != 0:
+            newValue = Wire.FLOATING_HIGH
+
+        newHigh = newValue == Wire.HIGH or newValue == Wire.PULLED_HIGH or \
+                  newValue == Wire.FLOATING_HIGH
+
+        wireGateOffsets = self.wireGateOffsets
+        wireGateFets = self.wireGateFets
+        hashKeys = self.wireHashKeys
+        newKeys = hashKeys[newValue]
+        changedWires = self.changedWires
+        i = 0
+        while i < groupLen:
+            wireIndex = groupList[i]
+            i += 1
+            if wireIndex == gndWireIndex or wireIndex == vccWireIndex:
+                continue
+
+            state = wireState[wireIndex]
+            if state != newValue:
+                self.stateHash ^= hashKeys[state][wireIndex] ^ newKeys[wireIndex]
+                if changedWires != None:
+                    changedWires.append(wireIndex)
+            wireState[wireIndex] = newValue
+
+            # Turn on or off the transistor gates controlled by this wire
+            pos = wireGateOffsets[wireIndex]
+            end = wireGateOffsets[wireIndex + 1]
+            if newHigh:
+                while pos < end:
+                    transIndex = wireGateFets[pos]
+                    if fetGateState[transIndex] == NmosFet.GATE_LOW:
+                        self.turnTransistorOn(transIndex)
+                    pos += 1
+            else:
+                while pos < end:
+                    transIndex = wireGateFets[pos]
+                    if fetGateState[transIndex] == NmosFet.GATE_HIGH:
+                        self.turnTransistorOff(transIndex)
+                    pos += 1
+
+    def turnTransistorOn(self, t):
+        self.fetGateState[t] = NmosFet.GATE_HIGH
+        self.stateHash ^= self.fetHashKeys[t]
+        if self.changedFets != None:
+            self.changedFets.append(t)
+
+        wireInd = self.fetSide1[t]
+        if self.newRecalcArray[wireInd] == 0:
+            self.newRecalcArray[wireInd] = 1
+            self.newRecalcOrder[self.newLastRecalcOrder] = wireInd
+            self.newLastRecalcOrder += 1
+
+        wireInd = self.fetSide2[t]
+        if self.newRecalcArray[wireInd] == 0:
+            self.newRecalcArray[wireInd] = 1
+            self.newRecalcOrder[self.newLastRecalcOrder] = wireInd
+            self.newLastRecalcOrder += 1
+
+    def turnTransistorOff(self, t):
+        self.fetGateState[t] = NmosFet.GATE_LOW
+        self.stateHash ^= self.fetHashKeys[t]
+        if self.changedFets != None:
+            self.changedFets.append(t)
+
+        c1Wire = self.fetSide1[t]
+        c2Wire = self.fetSide2[t]
+        self.floatWire(c1Wire)
+        self.floatWire(c2Wire)
+
+        wireInd = c1Wire
+        if self.newRecalcArray[wireInd] == 0:
+            self.newRecalcArray[wireInd] = 1
+            self.newRecalcOrder[self.newLastRecalcOrder] = wireInd
+            self.newLastRecalcOrder += 1
+
+        wireInd = c2Wire
+        if self.newRecalcArray[wireInd] == 0:
+            self.newRecalcArray[wireInd] = 1
+            self.newRecalcOrder[self.newLastRecalcOrder] = wireInd
+            self.newLastRecalcOrder += 1
+
+    def countWireSizes(self):
+        countFl = 0
+        countFh = 0
+        i = 0
+        while i < self.groupListLastIndex:
+            wireIndex = self.groupList[i]
+            i += 1
+            state = self.wireState[wireIndex]
+            # Number of transistors touching the wire
+            num = self.wireCtOffsets[wireIndex + 1] - self.wireCtOffsets[wireIndex] + \
+                  self.wireGateOffsets[wireIndex + 1] - self.wireGateOffsets[wireIndex]
+            if state == Wire.FLOATING_LOW:
+                countFl += num
+            if state == Wire.FLOATING_HIGH:
+                countFh += num
+        if countFh < countFl:
+            return Wire.FLOATING_LOW
+        return Wire.FLOATING_HIGH
+
+    def floatWire(self, n):
+        pulled = self.wirePulled[n]
+        state = self.wireState[n]
+        newState = state
+        if pulled == Wire.PULLED_HIGH:
+            newState = Wire.PULLED_HIGH
+        elif pulled == Wire.PULLED_LOW:
+            newState = Wire.PULLED_LOW
+        elif state == Wire.GROUNDED or state == Wire.PULLED_LOW:
+            newState = Wire.FLOATING_LOW
+        elif state == Wire.HIGH or state == Wire.PULLED_HIGH:
+            newState = Wire.FLOATING_HIGH
+        if newState != state:
+            self.wireState[n] = newState
+            keys = self.wireHashKeys
+            self.stateHash ^= keys[state][n] ^ keys[newState][n]
+            if self.changedWires != None:
+                self.changedWires.append(n)
+
+    def setPulled(self, wireIndex, boolHighOrLow):
+        if boolHighOrLow == True:
+            pulled = Wire.PULLED_HIGH
+        elif boolHighOrLow == False:
+            pulled = Wire.PULLED_LOW
+        else:
+            raise Exception('Arg to setPulled is not True or False')
+        lastPulled = self.wirePulled[wireIndex]
+        lastState = self.wireState[wireIndex]
+        if lastPulled == pulled and lastState == pulled:
+            return False
+        self.wirePulled[wireIndex] = pulled
+        self.wireState[wireIndex] = pulled
+        self.stateHash ^= self.wireHashKeys[lastState][wireIndex] ^ \
+                          self.wireHashKeys[pulled][wireIndex] ^ \
+                          self.pulledHashKeys[lastPulled][wireIndex] ^ \
+                          self.pulledHashKeys[pulled][wireIndex]
+        return True
+
+    def setPulledList(self, wireIndices, highs, changedWires):
+        wirePulled = self.wirePulled
+        wireState = self.wireState
+        wireKeys = self.wireHashKeys
+        pulledKeys = self.pulledHashKeys
+        for wireIndex, high in zip(wireIndices, highs):
+            pulled = Wire.PULLED_LOW
+            if high:
+                pulled = Wire.PULLED_HIGH
+            lastPulled = wirePulled[wireIndex]
+            lastState = wireState[wireIndex]
+            if lastPulled != pulled or lastState != pulled:
+                wirePulled[wireIndex] = pulled
+                wireState[wireIndex] = pulled
+                self.stateHash ^= wireKeys[lastState][wireIndex] ^ \
+                                  wireKeys[pulled][wireIndex] ^ \
+                                  pulledKeys[lastPulled][wireIndex] ^ \
+                                  pulledKeys[pulled][wireIndex]
+                changedWires.append(wireIndex)
+
+    def isHigh(self, wireIndex):
+        state = self.wireState[wireIndex]
+        return state == Wire.FLOATING_HIGH or state == Wire.PULLED_HIGH or \
+               state == Wire.HIGH
+
+    def isLow(self, wireIndex):
+        state = self.wireState[wireIndex]
+        return state == Wire.FLOATING_LOW or state == Wire.PULLED_LOW or \
+               state == Wire.GROUNDED
+
+    # array('B', otherArray) copies item by item, so these copy
+    # through strings, which is hundreds of times faster.
+    def getWireStates(self):
+        return array('B', self.wireState.tostring())
+
+    def getGateStates(self):
+        return array('B', self.fetGateState.tostring())
+
+    def getPulledStates(self):
+        return array('B', self.wirePulled.tostring())
+
+    def getWireStateGetter(self, wireIndices):
+        # One itemgetter call reads all of the states
+        if len(wireIndices) == 1:
+            wireIndex = wireIndices[0]
+            return lambda: (self.wireState[wireIndex],)
+        getStates = operator.itemgetter(*wireIndices)
+        return lambda: getStates(self.wireState)
+
+    def setWireStates(self, states):
+        self.wireState[:] = self.toByteArray(states)
+
+    def setGateStates(self, states):
+        self.fetGateState[:] = self.toByteArray(states)
+
+    def setPulledStates(self, states):
+        self.wirePulled[:] = self.toByteArray(states)
+
+    def getWireStateList(self, wireIndices):
+        wireState = self.wireState
+        return tuple([wireState[i] for i in wireIndices])
+
+    def getGateStateList(self, fetIndices):
+        fetGateState = self.fetGateState
+        return tuple([fetGateState[i] for i in fetIndices])
+
+    def setWireStateList(self, wireIndices, states):
+        wireState = self.wireState
+        for wireIndex, state in zip(wireIndices, states):
+            wireState[wireIndex] = state
+
+    def setGateStateList(self, fetIndices, states):
+        fetGateState = self.fetGateState
+        for fetIndex, state in zip(fetIndices, states):
+            fetGateState[fetIndex] = state
+
+    def toByteArray(self, states):
+        if isinstance(states, array) and states.typecode == 'B':
+            return states
+        return array('B', states)
@@ -69,6 +69,12 @@ class CircuitSimulator(CircuitSimulatorBase):
                 continue
 
             simWire = self.wireList[wireIndex]
+            if simWire.state != newValue:
+                keys = self.wireHashKeys
+                self.stateHash ^= keys[simWire.state][wireIndex] ^ \
+                                  keys[newValue][wireIndex]
+                if self.changedWires != None:
+                    self.changedWires.append(wireIndex)
             simWire.state = newValue
 
             # Turn on or off the transistor gates controlled by this wire
@@ -85,6 +91,9 @@ class CircuitSimulator(CircuitSimulatorBase):
                 
     def turnTransistorOn(self, t):
         t.gateState = NmosFet.GATE_HIGH
+        self.stateHash ^= self.fetHashKeys[t.index]
+        if self.changedFets != None:
+            self.changedFets.append(t.index)
 
         wireInd = t.side1WireIndex
         if self.newRecalcArray[wireInd] == 0:
@@ -102,6 +111,9 @@ class CircuitSimulator(CircuitSimulatorBase):
 
     def turnTransistorOff(self, t):
         t.gateState = NmosFet.GATE_LOW
+        self.stateHash ^= self.fetHashKeys[t.index]
+        if self.changedFets != None:
+            self.changedFets.append(t.index)
 
         c1Wire = t.side1WireIndex
         c2Wire = t.side2WireIndex
@@ -123,52 +135,87 @@ class CircuitSimulator(CircuitSimulatorBase):
             self.lastChipGroupState += 1
 
     def addWireToGroupList(self, wireIndex):
-        # Do nothing if we've already added the wire to the group
-        if self.lastWireGroupState[wireIndex] == self.lastChipGroupState:
-            return
-
-        self.numAddWireToGroup += 1
-
-        self.groupList[self.groupListLastIndex] = wireIndex
-        self.groupListLastIndex += 1
-        self.lastWireGroupState[wireIndex] = self.lastChipGroupState
+        # Depth-first walk over the wires connected to wireIndex through
+        # transistors that are on, adding them to groupList.  Rather
+        # than recursing once per wire, the walk keeps its own stack of
+        # wires and iterators over their ctInds, so a wire costs a few
+        # list operations instead of a Python call, and a large group
+        # can't hit the recursion limit.  Wires are added in the same
+        # order as a recursive walk would add them.
+        groupState = self.lastChipGroupState
+        lastWireGroupState = self.lastWireGroupState
 
-        if wireIndex == self.gndWireIndex:
-            self.groupValue |= Wire.GROUNDED
-            return
-        elif wireIndex == self.vccWireIndex:
-            self.groupValue |= Wire.HIGH
+        # Do nothing if we've already added the wire to the group
+        if lastWireGroupState[wireIndex] == groupState:
             return
 
-        wire = self.wireList[wireIndex]
-
-        # wire.pulled is 0, 1, or 2
-        self.groupValue |= wire.pulled
-
-        if wire.state == Wire.FLOATING_LOW:
-            self.groupValue |= Wire.FLOATING_LOW
-        elif wire.state == Wire.FLOATING_HIGH:
-            self.groupValue |= Wire.FLOATING_HIGH
-
-        for transIndex in wire.ctInds:
-            # If the transistor at index 't' is on, add the
-            # wires of the circuit on the other side of the 
-            # transistor, since wireIndex is connected to them.
-
-            other = -1
-            trans = self.transistorList[transIndex]
-            if trans.gateState == NmosFet.GATE_LOW:
-                continue
-
-            if trans.side1WireIndex == wireIndex:
-                other = trans.side2WireIndex
-            elif trans.side2WireIndex == wireIndex:
-                other = trans.side1WireIndex
-
-            # No need to check if 'other' is already in the groupList:
-            #  self.groupList[0:self.groupListLastIndex]
-            # That's done in the first line of addWireToGroupList()
-            self.addWireToGroupList(other)
+        wireList = self.wireList
+        transistorList = self.transistorList
+        gndWireIndex = self.gndWireIndex
+        vccWireIndex = self.vccWireIndex
+        groupList = self.groupList
+        groupLen = self.groupListLastIndex
+        groupValue = self.groupValue
+        stackWires = self.stackWires
+        stackIters = self.stackIters
+        stackLen = 0
+        startLen = groupLen
+        GATE_LOW = NmosFet.GATE_LOW
+
+        while True:
+            groupList[groupLen] = wireIndex
+            groupLen += 1
+            lastWireGroupState[wireIndex] = groupState
+
+            if wireIndex == gndWireIndex:
+                groupValue |= Wire.GROUNDED
+            elif wireIndex == vccWireIndex:
+                groupValue |= Wire.HIGH
+            else:
+                wire = wireList[wireIndex]
+
+                # wire.pulled is 0, 1, or 2
+                groupValue |= wire.pulled
+
+                if wire.state == Wire.FLOATING_LOW:
+                    groupValue |= Wire.FLOATING_LOW
+                elif wire.state == Wire.FLOATING_HIGH:
+                    groupValue |= Wire.FLOATING_HIGH
+
+                stackWires[stackLen] = wireIndex
+                stackIters[stackLen] = iter(wire.ctInds)
+                stackLen += 1
+
+            # If a transistor of the wire on top of the stack is on,
+            # the wire on its other side is next, unless it's already
+            # in the group.  Pop wires with no transistors left, and
+            # stop when the stack is empty.
+            while stackLen > 0:
+                fromIndex = stackWires[stackLen - 1]
+                for transIndex in stackIters[stackLen - 1]:
+                    trans = transistorList[transIndex]
+                    if trans.gateState == GATE_LOW:
+                        continue
+
+                    other = -1
+                    if trans.side1WireIndex == fromIndex:
+                        other = trans.side2WireIndex
+                    elif trans.side2WireIndex == fromIndex:
+                        other = trans.side1WireIndex
+
+                    if lastWireGroupState[other] != groupState:
+                        break
+                else:
+                    stackLen -= 1
+                    continue
+                break
+            else:
+                break
+            wireIndex = other
+
+        self.numAddWireToGroup += groupLen - startLen
+        self.groupListLastIndex = groupLen
+        self.groupValue = groupValue
 
     def countWireSizes(self):
         countFl = 0
@@ -189,4 +236,8 @@ class CircuitSimulator(CircuitSimulatorBase):
     def loadCircuit (self, filePathIn = None):
         data = CircuitSimulatorBase.loadCircuit(self, filePathIn)
         self.groupList = [0] * len(self.wireList)
+        # Scratch stack for addWireToGroupList()
+        self.stackWires = [0] * len(self.wireList)
+        self.stackIters = [None] * len(self.wireList)
+        self.initStateHash()
         return data
@@ -26,6 +26,14 @@ class CircuitSimulator(CircuitSimulatorBase):
     def __init__(self):
         CircuitSimulatorBase.__init__(self)
 
+    def loadCircuit(self, filePath):
+        data = CircuitSimulatorBase.loadCircuit(self, filePath)
+        # Scratch stack for addWireToGroup()
+        self.stackWires = [0] * self.numWires
+        self.stackIters = [None] * self.numWires
+        self.initStateHash()
+        return data
+
     def doWireRecalc(self, wireIndex):
         if wireIndex == self.gndWireIndex or wireIndex == self.vccWireIndex:
             return
@@ -43,6 +51,12 @@ class CircuitSimulator(CircuitSimulatorBase):
                 # TODO: remove gnd and vcc from group?
                 continue
             simWire = self.wireList[groupWireIndex]
+            if simWire.state != newValue:
+                keys = self.wireHashKeys
+                self.stateHash ^= keys[simWire.state][groupWireIndex] ^ \
+                                  keys[newValue][groupWireIndex]
+                if self.changedWires != None:
+                    self.changedWires.append(groupWireIndex)
             simWire.state = newValue
             for transIndex in simWire.gateInds:
 
@@ -55,6 +69,9 @@ class CircuitSimulator(CircuitSimulatorBase):
 
     def turnTransistorOn(self, t):
         t.gateState = NmosFet.GATE_HIGH
+        self.stateHash ^= self.fetHashKeys[t.index]
+        if self.changedFets != None:
+            self.changedFets.append(t.index)
 
         wireInd = t.side1WireIndex
         if self.newRecalcArray[wireInd] == 0:
@@ -70,6 +87,9 @@ class CircuitSimulator(CircuitSimulatorBase):
 
     def turnTransistorOff(self, t):
         t.gateState = NmosFet.GATE_LOW
+        self.stateHash ^= self.fetHashKeys[t.index]
+        if self.changedFets != None:
+            self.changedFets.append(t.index)
 
         c1Wire = t.side1WireIndex
         c2Wire = t.side2WireIndex
@@ -133,31 +153,58 @@ class CircuitSimulator(CircuitSimulatorBase):
         return value
 
     def addWireToGroup(self, wireIndex, group):
-        self.numAddWireToGroup += 1
-        group.add(wireIndex)
-        wire = self.wireList[wireIndex]
-        if wireIndex == self.gndWireIndex or wireIndex == self.vccWireIndex:
-            return
-        for t in wire.ctInds:
-            self.addWireTransistor (wireIndex, t, group)
-
-    def addWireTransistor(self, wireIndex, t, group):
-        self.numAddWireTransistor += 1
-        other = -1
-        trans = self.transistorList[t]
-        if trans.gateState == NmosFet.GATE_LOW:
-            return
-        if trans.side1WireIndex == wireIndex:
-            other = trans.side2WireIndex
-        if trans.side2WireIndex == wireIndex:
-            other = trans.side1WireIndex
-        if other == self.vccWireIndex or other == self.gndWireIndex:
-            group.add(other)
-            return
-        if other in group:
-            return
-        self.addWireToGroup(other, group)
-
+        # Adds wireIndex and the wires connected to it through
+        # transistors that are on to the set group.  A depth-first walk
+        # with its own stack of wires and iterators over their ctInds,
+        # in the same order as recursing once per wire would go, but
+        # without a Python call per wire or the recursion limit.
+        transistorList = self.transistorList
+        gndWireIndex = self.gndWireIndex
+        vccWireIndex = self.vccWireIndex
+        stackWires = self.stackWires
+        stackIters = self.stackIters
+        stackLen = 0
+        numAddWireToGroup = 0
+        numAddWireTransistor = 0
+
+        while True:
+            numAddWireToGroup += 1
+            group.add(wireIndex)
+            if wireIndex != gndWireIndex and wireIndex != vccWireIndex:
+                stackWires[stackLen] = wireIndex
+                stackIters[stackLen] = iter(self.wireList[wireIndex].ctInds)
+                stackLen += 1
+
+            found = False
+            while stackLen > 0:
+                fromIndex = stackWires[stackLen - 1]
+                for t in stackIters[stackLen - 1]:
+                    numAddWireTransistor += 1
+                    trans = transistorList[t]
+                    if trans.gateState == NmosFet.GATE_LOW:
+                        continue
+                    other = -1
+                    if trans.side1WireIndex == fromIndex:
+                        other = trans.side2WireIndex
+                    if trans.side2WireIndex == fromIndex:
+                        other = trans.side1WireIndex
+                    if other == vccWireIndex or other == gndWireIndex:
+                        group.add(other)
+                        continue
+                    if other in group:
+                        continue
+                    found = True
+                    break
+                if found:
+                    break
+                stackLen -= 1
+
+            if not found:
+                break
+            wireIndex = other
+
+        self.numAddWireToGroup += numAddWireToGroup
+        self.numAddWireTransistor += numAddWireTransistor
 
     def countWireSizes(self, group):
         countFl = 0
@@ -0,0 +1,257 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+#------------------------------------------------------------------------------
+#
+# circuitSimulatorUsingTables.py
+# The arrays circuit simulator with the groups of wires looked up in
+# tables instead of found by a flood fill.  channelComponents.py splits
+# the wires into channel-connected components and, for each component
+# with few enough transistor edges, makes a table of the group of each
+# of its wires for every pattern of its edges being on or off, in the
+# order the arrays simulator's depth-first walk finds them.  The
+# simulator keeps each component's current pattern up to date as
+# transistors switch, so finding a wire's group is one lookup.  The
+# group's value still comes from the pulled and floating states of its
+# wires, which change as the chip runs.
+#
+# Wires in components too big for a table, like the data buses, are
+# flood filled by the arrays simulator's doWireRecalc().
+#
+
+from channelComponents import ChannelComponents
+from circuitSimulatorUsingArrays import CircuitSimulator as ArraysCircuitSimulator
+from nmosFet import NmosFet
+from wire import Wire
+
+class CircuitSimulator(ArraysCircuitSimulator):
+    # Components with more edges than this are flood filled.  The
+    # tables grow as 2 to the number of edges.
+    maxTableEdges = 8
+
+    def __init__(self):
+        ArraysCircuitSimulator.__init__(self)
+        self.components = None
+
+    def initScratchArrays(self):
+        ArraysCircuitSimulator.initScratchArrays(self)
+        components = ChannelComponents(self.numWires, self.fetSide1,
+                                       self.fetSide2, self.wireCtOffsets,
+                                       self.wireCtFets, self.wireCtOthers,
+                                       self.gndWireIndex, self.vccWireIndex,
+                                       self.maxTableEdges)
+        self.components = components
+        # Each wire's table, or None, and its offset within each
+        # pattern's rows of the table
+        self.wireTable = [None] * self.numWires
+        self.wireTableOffset = [0] * self.numWires
+        self.wireComponent = components.wireComponent
+        for wireIndex, component in enumerate(components.wireComponent):
+            if component >= 0:
+                self.wireTable[wireIndex] = components.componentTables[component]
+                self.wireTableOffset[wireIndex] = components.wireLocalIndex[wireIndex]
+        self.componentNumWires = [len(wires) for wires in components.componentWires]
+        self.fetEdge = components.fetEdge
+        self.edgeComponent = components.edgeComponent
+        self.edgeBit = components.edgeBit
+        self.initPatterns()
+
+    def initPatterns(self):
+        """ Sets edgeOnCount and componentPattern from fetGateState """
+        components = self.components
+        self.edgeOnCount = [0] * len(components.edgeComponent)
+        self.componentPattern = [0] * len(components.componentWires)
+        for t in xrange(self.numFets):
+            edge = self.fetEdge[t]
+            if edge >= 0 and self.fetGateState[t] == NmosFet.GATE_HIGH:
+                self.edgeOnCount[edge] += 1
+                if self.edgeOnCount[edge] == 1:
+                    self.componentPattern[self.edgeComponent[edge]] |= self.edgeBit[edge]
+
+    def doWireRecalc(self, wireIndex):
+        table = self.wireTable[wireIndex]
+        if table == None:
+            # VSS, VCC or a wire in a component without a table
+            ArraysCircuitSimulator.doWireRecalc(self, wireIndex)
+            return
+
+        component = self.wireComponent[wireIndex]
+        group, power, groupLen = table[self.componentPattern[component] *
+                                       self.componentNumWires[component] +
+                                       self.wireTableOffset[wireIndex]]
+        self.numAddWireToGroup += groupLen
+
+        wireState = self.wireState
+        if power & Wire.GROUNDED:
+            newValue = Wire.GROUNDED
+        elif power:
+            newValue = Wire.HIGH
+        elif groupLen == 1:
+            newValue = self.wirePulled[wireIndex] or wireState[wireIndex]
+        else:
+            wirePulled = self.wirePulled
+            groupValue = 0
+            for i in group:
+                groupValue |= wirePulled[i]
+                state = wireState[i]
+                if state == Wire.FLOATING_LOW or state == Wire.FLOATING_HIGH:
+                    groupValue |= state
+            newValue = wireState[wireIndex]
+            if groupValue & Wire.PULLED_LOW:
+                newValue = Wire.PULLED_LOW
+            elif groupValue & Wire.PULLED_HIGH:
+                newValue = Wire.PULLED_HIGH
+            elif groupValue & Wire.FLOATING_LOW != 0 and \
+                 groupValue & Wire.FLOATING_HIGH != 0:
+                newValue = self.countGroupSizes(group)
+            elif groupValue & Wire.FLOATING_LOW != 0:
+                newValue = Wire.FLOATING_LOW
+            elif groupValue & Wire.FLOATING_HIGH != 0:
+                newValue = Wire.FLOATING_HIGH
+
+        newHigh = newValue == Wire.HIGH or newValue == Wire.PULLED_HIGH or \
+                  newValue == Wire.FLOATING_HIGH
+
+        # Set each of the group's wires and switch the transistors it
+        # gates in the order of the arrays simulator's walk, so a wire
+        # floated by a transistor turned off by a wire before it is set
+        # again
+        hashKeys = self.wireHashKeys
+        newKeys = hashKeys[newValue]
+        wireGateOffsets = self.wireGateOffsets
+        wireGateFets = self.wireGateFets
+        fetGateState = self.fetGateState
+        changedWires = self.changedWires
+        for i in group:
+            state = wireState[i]
+            if state != newValue:
+                self.stateHash ^= hashKeys[state][i] ^ newKeys[i]
+                wireState[i] = newValue
+                if changedWires != None:
+                    changedWires.append(i)
+
+            pos = wireGateOffsets[i]
+            end = wireGateOffsets[i + 1]
+            if newHigh:
+                while pos < end:
+                    transIndex = wireGateFets[pos]
+                    if fetGateState[transIndex] == NmosFet.GATE_LOW:
+                        self.turnTransistorOn(transIndex)
+                    pos += 1
+            else:
+                while pos < end:
+                    transIndex = wireGateFets[pos]
+                    if fetGateState[transIndex] == NmosFet.GATE_HIGH:
+                        self.turnTransistorOff(transIndex)
+                    pos += 1
+
+    def countGroupSizes(self, group):
+        # countWireSizes() for a group from a table
+        countFl = 0
+        countFh = 0
+        for wireIndex in group:
+            state = self.wireState[wireIndex]
+            num = self.wireCtOffsets[wireIndex + 1] - self.wireCtOffsets[wireIndex] + \
+                  self.wireGateOffsets[wireIndex + 1] - self.wireGateOffsets[wireIndex]
+            if state == Wire.FLOATING_LOW:
+                countFl += num
+            if state == Wire.FLOATING_HIGH:
+                countFh += num
+        if countFh < countFl:
+            return Wire.FLOATING_LOW
+        return Wire.FLOATING_HIGH
+
+    # The arrays simulator's turnTransistorOn() and turnTransistorOff(),
+    # also keeping the transistor's component's pattern
+    def turnTransistorOn(self, t):
+        self.fetGateState[t] = NmosFet.GATE_HIGH
+        self.stateHash ^= self.fetHashKeys[t]
+        if self.changedFets != None:
+            self.changedFets.append(t)
+
+        edge = self.fetEdge[t]
+        if edge >= 0:
+            self.edgeOnCount[edge] += 1
+            if self.edgeOnCount[edge] == 1:
+                self.componentPattern[self.edgeComponent[edge]] |= self.edgeBit[edge]
+
+        wireInd = self.fetSide1[t]
+        if self.newRecalcArray[wireInd] == 0:
+            self.newRecalcArray[wireInd] = 1
+            self.newRecalcOrder[self.newLastRecalcOrder] = wireInd
+            self.newLastRecalcOrder += 1
+
+        wireInd = self.fetSide2[t]
+        if self.newRecalcArray[wireInd] == 0:
+            self.newRecalcArray[wireInd] = 1
+            self.newRecalcOrder[self.newLastRecalcOrder] = wireInd
+            self.newLastRecalcOrder += 1
+
+    def turnTransistorOff(self, t):
+        self.fetGateState[t] = NmosFet.GATE_LOW
+        self.stateHash ^= self.fetHashKeys[t]
+        if self.changedFets != None:
+            self.changedFets.append(t)
+
+        edge = self.fetEdge[t]
+        if edge >= 0:
+            self.edgeOnCount[edge] -= 1
+            if self.edgeOnCount[edge] == 0:
+                self.componentPattern[self.edgeComponent[edge]] &= ~self.edgeBit[edge]
+
+        c1Wire = self.fetSide1[t]
+        c2Wire = self.fetSide2[t]
+        self.floatWire(c1Wire)
+        self.floatWire(c2Wire)
+
+        wireInd = c1Wire
+        if self.newRecalcArray[wireInd] == 0:
+            self.newRecalcArray[wireInd] = 1
+            self.newRecalcOrder[self.newLastRecalcOrder] = wireInd
+            self.newLastRecalcOrder += 1
+
+        wireInd = c2Wire
+        if self.newRecalcArray[wireInd] == 0:
+            self.newRecalcArray[wireInd] = 1
+            self.newRecalcOrder[self.newLastRecalcOrder] = wireInd
+            self.newLastRecalcOrder += 1
+
+    def setGateStates(self, states):
+        ArraysCircuitSimulator.setGateStates(self, states)
+        self.initPatterns()
+
+    def setGateStateList(self, fetIndices, states):
+        # Keep the patterns as turnTransistorOn() and turnTransistorOff() do
+        for t, state in zip(fetIndices, states):
+            if self.fetGateState[t] == state:
+                continue
+            self.fetGateState[t] = state
+            edge = self.fetEdge[t]
+            if edge < 0:
+                continue
+            if state == NmosFet.GATE_HIGH:
+                self.edgeOnCount[edge] += 1
+                if self.edgeOnCount[edge] == 1:
+                    self.componentPattern[self.edgeComponent[edge]] |= self.edgeBit[edge]
+            else:
+                self.edgeOnCount[edge] -= 1
+                if self.edgeOnCount[edge] == 0:
+                    self.componentPattern[self.edgeComponent[edge]] &= ~self.edgeBit[edge]
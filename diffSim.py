@@ -0,0 +1,449 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+#------------------------------------------------------------------------------
+#
+# diffSim.py
+# Checks that circuit simulators agree.  Every simulator keeps the same
+# state hash for the same chip state (see initStateHash()), so two
+# consoles running the same ROM on different simulators can be compared
+# every half clock by comparing hashes.
+#
+# Run two simulators in lockstep.  At the first half clock where they
+# differ, the wires, transistors and pulled states that differ are
+# reported, along with the group of wires connected to the first wire
+# that differs:
+#
+#   python diffSim.py roms/Pitfall.bin --backend compiled --reference lists \
+#                     --half-clocks 20000
+#
+# Or record the console's state hash at every half clock to a golden
+# trace, and check a simulator against it later:
+#
+#   python diffSim.py roms/Pitfall.bin --backend lists --half-clocks 20000 \
+#                     --record pitfall.trace
+#   python diffSim.py roms/Pitfall.bin --backend compiled --replay pitfall.trace
+#
+# A trace only holds hashes, so replaying one finds the half clock where
+# a simulator went wrong.  Running in lockstep with --start at that half
+# clock then shows which wires are wrong.
+#
+# Some differences settle out by the end of the half clock, like a wire
+# set in a different order within its group, which can leave it floating
+# until it's recalculated in the next step.  With --by-wire the lockstep
+# run compares the state hash after every doWireRecalc() instead, and
+# the order the wires are recalculated in:
+#
+#   python diffSim.py roms/Pitfall.bin --backend tables --reference arrays \
+#                     --half-clocks 200 --by-wire
+#
+# That runs the Python recalc loop for every simulator, so the compiled
+# simulator's kernel and the frontier simulator's numpy steps aren't
+# checked by it.
+#
+
+import argparse, json, os, struct, sys, time, zlib
+import params
+import simBackends
+from circuitSimulatorBase import CircuitSimulatorBase
+from nmosFet import NmosFet
+from sim2600Console import Sim2600Console
+
+# Most differing wires or transistors to list in a divergence report
+maxReportItems = 32
+
+class GoldenTrace:
+    """ The console's state hash after each TIA half clock of a run,
+        and what's needed to start the same run again. """
+    fileMagic = 'S2600TRC'
+    fileVersion = 1
+
+    def __init__(self, header=None):
+        # rom, romSHA1, backend, netlistHashes, startTIAHalfClock
+        # and startStateHash, see Sim2600Console.getStateHash()
+        self.header = header
+        if self.header == None:
+            self.header = dict()
+        self.hashes = []
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def append(self, stateHash):
+        self.hashes.append(stateHash)
+
+    def save(self, filePath):
+        header = dict(self.header)
+        header['numHalfClocks'] = len(self.hashes)
+        headerStr = json.dumps(header, sort_keys=True)
+        of = open(filePath, 'wb')
+        of.write(struct.pack('<8sII', self.fileMagic, self.fileVersion,
+                             len(headerStr)))
+        of.write(headerStr)
+        of.write(zlib.compress(struct.pack('<%dQ'%len(self.hashes), *self.hashes)))
+        of.close()
+
+    def load(self, filePath):
+        of = open(filePath, 'rb')
+        data = of.read()
+        of.close()
+        headerSize = struct.calcsize('<8sII')
+        magic, version, headerLen = struct.unpack_from('<8sII', data)
+        if magic != self.fileMagic:
+            raise RuntimeError('ERROR: %s is not a golden trace'%(filePath))
+        if version != self.fileVersion:
+            raise RuntimeError('ERROR: Golden trace is version %d, '%version +
+                               'expected version %d'%self.fileVersion)
+        self.header = json.loads(data[headerSize:headerSize + headerLen])
+        body = zlib.decompress(data[headerSize + headerLen:])
+        self.hashes = list(struct.unpack('<%dQ'%(len(body) // 8), body))
+        if len(self.hashes) != self.header['numHalfClocks']:
+            raise RuntimeError('ERROR: Golden trace %s is the wrong size'%(filePath))
+
+
+def makeConsole(romFilePath, backendName, startSnapshotFile=None,
+                startHalfClock=0):
+    # A console at the same starting point for every simulator
+    sim = Sim2600Console(romFilePath, backendName)
+    if startSnapshotFile != None:
+        sim.loadSnapshot(startSnapshotFile)
+    if startHalfClock > sim.simTIA.halfClkCount:
+        sim.advanceToHalfClock(startHalfClock)
+    return sim
+
+def getConsoleHeader(sim, romFilePath, backendName):
+    return {'rom': romFilePath,
+            'romSHA1': sim.getROMHash(),
+            'backend': backendName,
+            'netlistHashes': [sim.sim6507.getNetlistHash(),
+                              sim.simTIA.getNetlistHash()],
+            'startTIAHalfClock': sim.simTIA.halfClkCount,
+            'startCPUHalfClock': sim.sim6507.halfClkCount,
+            'startStateHash': '%016x'%(sim.getStateHash())}
+
+def getWireGroup(chip, wireIndex, netlist, gateStates):
+    """ Returns the wires connected to wireIndex through transistors
+        that are on, as doWireRecalc() would find them.  netlist is
+        from chip.getNetlistArrays(). """
+    ctOffsets = netlist['WIRE_CT_OFFSETS']
+    ctFets = netlist['WIRE_CT_FETS']
+    ctOthers = netlist['WIRE_CT_OTHERS']
+    group = [wireIndex]
+    inGroup = set(group)
+    i = 0
+    while i < len(group):
+        w = group[i]
+        i += 1
+        if w == chip.gndWireIndex or w == chip.vccWireIndex:
+            continue
+        for pos in xrange(ctOffsets[w], ctOffsets[w + 1]):
+            other = ctOthers[pos]
+            if other < 0 or other in inGroup or \
+               gateStates[ctFets[pos]] != NmosFet.GATE_HIGH:
+                continue
+            inGroup.add(other)
+            group.append(other)
+    return group
+
+def getWireNames(chip):
+    names = dict()
+    for name, wireIndex in chip.wireNames.iteritems():
+        names.setdefault(wireIndex, []).append(name)
+    return names
+
+def diffChips(chip, refChip):
+    """ Returns a dict describing how chip differs from refChip, which
+        is the same chip run by another simulator. """
+    report = dict()
+    report['chip'] = chip.__class__.__name__
+    report['halfClkCount'] = chip.halfClkCount
+    report['stateHash'] = '%016x'%(chip.getStateHash())
+    report['refStateHash'] = '%016x'%(refChip.getStateHash())
+
+    wireNames = getWireNames(refChip)
+    wireStates = chip.getWireStates()
+    refWireStates = refChip.getWireStates()
+    pulled = chip.getPulledStates()
+    refPulled = refChip.getPulledStates()
+    wires = [i for i in xrange(refChip.numWires) if
+             wireStates[i] != refWireStates[i] or pulled[i] != refPulled[i]]
+    report['numWiresDiffer'] = len(wires)
+    report['wires'] = [{'index': i, 'names': sorted(wireNames.get(i, [])),
+                        'state': wireStates[i], 'refState': refWireStates[i],
+                        'pulled': pulled[i], 'refPulled': refPulled[i]}
+                       for i in wires[:maxReportItems]]
+
+    gateStates = chip.getGateStates()
+    refGateStates = refChip.getGateStates()
+    fets = [i for i in xrange(refChip.numFets)
+            if gateStates[i] != refGateStates[i]]
+    report['numTransistorsDiffer'] = len(fets)
+    report['transistors'] = [{'index': i, 'gate': gateStates[i],
+                              'refGate': refGateStates[i]}
+                             for i in fets[:maxReportItems]]
+
+    if len(wires) > 0:
+        netlist = refChip.getNetlistArrays()
+        group = getWireGroup(refChip, wires[0], netlist, refGateStates)
+        report['group'] = [{'index': i, 'names': sorted(wireNames.get(i, [])),
+                            'refState': refWireStates[i],
+                            'refPulled': refPulled[i]}
+                           for i in group[:maxReportItems]]
+        report['groupSize'] = len(group)
+    elif len(fets) == 0:
+        # Same states, different hashes.  One of the simulators isn't
+        # keeping its state hash up to date.
+        report['note'] = 'States are the same, the state hashes are not'
+    return report
+
+def diffPIA(sim, refSim):
+    report = dict()
+    pia = sim.emuPIA
+    refPIA = refSim.emuPIA
+    report['ram'] = [i + 0x80 for i in xrange(len(refPIA.ram))
+                     if pia.ram[i] != refPIA.ram[i]]
+    report['iot'] = [i + 0x280 for i in xrange(len(refPIA.iot))
+                     if pia.iot[i] != refPIA.iot[i]]
+    for name in ['timerPeriod', 'timerValue', 'timerClockCount',
+                 'timerFinished']:
+        if getattr(pia, name) != getattr(refPIA, name):
+            report[name] = [getattr(pia, name), getattr(refPIA, name)]
+    if sim.bankSwitchROMOffset != refSim.bankSwitchROMOffset:
+        report['bankSwitchROMOffset'] = [sim.bankSwitchROMOffset,
+                                         refSim.bankSwitchROMOffset]
+    return report
+
+class WireRecalcLog:
+    """ Records the wire and the chip's state hash after each of a
+        chip's doWireRecalc() calls, by putting a recording version in
+        front of its class's method as recalcStats.py does.  The chip
+        runs CircuitSimulatorBase.doRecalcIterations() while it's
+        installed, so every simulator recalculates wire by wire. """
+    def __init__(self, chip):
+        self.chip = chip
+        self.entries = []
+        classDoWireRecalc = chip.__class__.doWireRecalc
+        entries = self.entries
+
+        def doRecalcIterations():
+            CircuitSimulatorBase.doRecalcIterations(chip)
+
+        def doWireRecalc(wireIndex):
+            classDoWireRecalc(chip, wireIndex)
+            entries.append((wireIndex, chip.getStateHash()))
+
+        chip.doRecalcIterations = doRecalcIterations
+        chip.doWireRecalc = doWireRecalc
+
+    def clear(self):
+        del self.entries[:]
+
+def diffWireRecalcs(log, refLog):
+    """ Returns None if the two logs match, or a dict describing the
+        first recalc where they differ """
+    names = getWireNames(log.chip)
+    for i, (entry, refEntry) in enumerate(zip(log.entries, refLog.entries)):
+        if entry == refEntry:
+            continue
+        wireIndex, stateHash = entry
+        refWireIndex, refStateHash = refEntry
+        return {'recalc': i,
+                'wire': wireIndex,
+                'wireNames': names.get(wireIndex, []),
+                'refWire': refWireIndex,
+                'refWireNames': names.get(refWireIndex, []),
+                'stateHash': '%016x'%(stateHash),
+                'refStateHash': '%016x'%(refStateHash)}
+    if len(log.entries) != len(refLog.entries):
+        return {'recalc': min(len(log.entries), len(refLog.entries)),
+                'numRecalcs': len(log.entries),
+                'refNumRecalcs': len(refLog.entries)}
+    return None
+
+def runLockstep(sim, refSim, numHalfClocks, byWire=False):
+    """ Advances both consoles a half clock at a time.  Returns None
+        if they agree for numHalfClocks, or a report of where they
+        first differ.  With byWire, they must also agree after every
+        wire recalculated. """
+    logs = []
+    if byWire:
+        logs = [(WireRecalcLog(chip), WireRecalcLog(refChip))
+                for chip, refChip in [(sim.sim6507, refSim.sim6507),
+                                      (sim.simTIA, refSim.simTIA)]]
+    for i in xrange(numHalfClocks):
+        for log, refLog in logs:
+            log.clear()
+            refLog.clear()
+        sim.advanceOneHalfClock()
+        refSim.advanceOneHalfClock()
+        recalcReports = dict()
+        for log, refLog in logs:
+            recalcReport = diffWireRecalcs(log, refLog)
+            if recalcReport != None:
+                recalcReports[log.chip.__class__.__name__] = recalcReport
+        if sim.getStateHash() == refSim.getStateHash() and \
+           len(recalcReports) == 0:
+            continue
+
+        report = {'tiaHalfClock': refSim.simTIA.halfClkCount,
+                  'cpuHalfClock': refSim.sim6507.halfClkCount,
+                  'halfClocksRun': i + 1}
+        if len(recalcReports) > 0:
+            report['firstWireRecalcDiffering'] = recalcReports
+        for chip, refChip in [(sim.sim6507, refSim.sim6507),
+                              (sim.simTIA, refSim.simTIA)]:
+            if chip.getStateHash() != refChip.getStateHash():
+                report[chip.__class__.__name__] = diffChips(chip, refChip)
+        report['PIA'] = diffPIA(sim, refSim)
+        return report
+    return None
+
+def runReplay(sim, trace, numHalfClocks=None):
+    """ Advances the console and checks its state hash against a golden
+        trace.  Returns None if they agree for numHalfClocks, or all of
+        the trace if None, or a report of where they first differ. """
+    header = trace.header
+    startHash = '%016x'%(sim.getStateHash())
+    if sim.simTIA.halfClkCount != header['startTIAHalfClock'] or \
+       startHash != header['startStateHash']:
+        return {'tiaHalfClock': sim.simTIA.halfClkCount, 'halfClocksRun': 0,
+                'note': 'The console does not start where the trace does'}
+    if numHalfClocks == None or numHalfClocks > len(trace):
+        numHalfClocks = len(trace)
+    hashes = trace.hashes
+    for i in xrange(numHalfClocks):
+        sim.advanceOneHalfClock()
+        stateHash = sim.getStateHash()
+        if stateHash != hashes[i]:
+            return {'tiaHalfClock': sim.simTIA.halfClkCount,
+                    'cpuHalfClock': sim.sim6507.halfClkCount,
+                    'halfClocksRun': i + 1,
+                    'stateHash': '%016x'%(stateHash),
+                    'traceStateHash': '%016x'%(hashes[i])}
+    return None
+
+def recordTrace(sim, trace, numHalfClocks):
+    for i in xrange(numHalfClocks):
+        sim.advanceOneHalfClock()
+        trace.append(sim.getStateHash())
+
+def getArgParser():
+    parser = argparse.ArgumentParser(description='Check that circuit ' +
+                 'simulators agree, by running two in lockstep or by ' +
+                 'recording and replaying golden traces of state hashes.')
+    parser.add_argument('romFile', help='cartridge ROM file')
+    parser.add_argument('--backend', default=params.circuitSimulatorBackend,
+                        choices=simBackends.getBackendNames(),
+                        help='circuit simulator to check')
+    parser.add_argument('--reference', default='lists',
+                        choices=simBackends.getBackendNames(),
+                        help='circuit simulator to compare with in lockstep')
+    parser.add_argument('--half-clocks', type=int, default=None,
+                        dest='halfClocks',
+                        help='TIA half clocks to run.  Default is all of ' +
+                             'the trace with --replay')
+    parser.add_argument('--start', type=int, default=0,
+                        help='TIA half clock to start checking from')
+    parser.add_argument('--snapshot', default=None,
+                        help='console snapshot file to start from')
+    parser.add_argument('--record', default=None,
+                        help='record a golden trace of --backend to this file')
+    parser.add_argument('--replay', default=None,
+                        help='check --backend against this golden trace')
+    parser.add_argument('--report', default=None,
+                        help='write the divergence report to this JSON file')
+    parser.add_argument('--by-wire', action='store_true', dest='byWire',
+                        help='in lockstep, compare the state hash after ' +
+                             'every wire recalculated, not just every half clock')
+    parser.add_argument('--verbose', action='store_true',
+                        help="print the simulation's messages")
+    return parser
+
+def main(argv):
+    args = getArgParser().parse_args(argv)
+    if args.halfClocks == None and args.replay == None:
+        print('ERROR: Give --half-clocks, or --replay a trace')
+        return 2
+    if args.record != None and args.replay != None:
+        print('ERROR: Give only one of --record and --replay')
+        return 2
+    if args.byWire and (args.record != None or args.replay != None):
+        print('ERROR: --by-wire is only for running in lockstep')
+        return 2
+
+    trace = None
+    startHalfClock = args.start
+    if args.replay != None:
+        trace = GoldenTrace()
+        trace.load(args.replay)
+        startHalfClock = trace.header['startTIAHalfClock']
+
+    stdout = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, 'w')
+    startTime = time.time()
+    report = None
+    try:
+        sim = makeConsole(args.romFile, args.backend, args.snapshot,
+                          startHalfClock)
+        if args.record != None:
+            trace = GoldenTrace(getConsoleHeader(sim, args.romFile,
+                                                 args.backend))
+            recordTrace(sim, trace, args.halfClocks)
+            trace.save(args.record)
+        elif args.replay != None:
+            report = runReplay(sim, trace, args.halfClocks)
+        else:
+            refSim = makeConsole(args.romFile, args.reference, args.snapshot,
+                                 startHalfClock)
+            report = runLockstep(sim, refSim, args.halfClocks, args.byWire)
+    finally:
+        if not args.verbose:
+            sys.stdout.close()
+            sys.stdout = stdout
+    elapsedSec = time.time() - startTime
+
+    if args.record != None:
+        print('Recorded %d half clocks of %s from TIA half clock %d to %s in %.1f sec'%
+              (len(trace), args.backend, trace.header['startTIAHalfClock'],
+               args.record, elapsedSec))
+        return 0
+    if args.replay != None:
+        against = 'trace %s'%(args.replay)
+    else:
+        against = args.reference
+    if report == None:
+        print('%s matches %s from TIA half clock %d.  %.1f sec'%
+              (args.backend, against, startHalfClock, elapsedSec))
+        return 0
+
+    print('%s differs from %s at TIA half clock %d:'%
+          (args.backend, against, report['tiaHalfClock']))
+    print(json.dumps(report, indent=2, sort_keys=True))
+    if args.report != None:
+        of = open(args.report, 'w')
+        json.dump(report, of, indent=2, sort_keys=True)
+        of.write('\n')
+        of.close()
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,283 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+#------------------------------------------------------------------------------
+#
+# farmSim.py
+# Runs many batchSim.py jobs, one per ROM and circuit simulator, across
+# a pool of worker processes.  Each worker loads the chips' netlists once
+# per simulator and reuses them for every job it runs.  Finished frames
+# are reported as they happen, and when all jobs are done a farm summary
+# with each job's summary, the total throughput, and any failed jobs is
+# written to farmSummary.json.  For example:
+#
+#   python farmSim.py roms/*.bin --frames 1 --workers 4 --out outFarm
+#   python farmSim.py roms/Pitfall.bin --backend arrays --backend compiled \
+#                     --half-clocks 50000
+#
+# A JSON file holding a list of job dicts can be given with --jobs.  Keys
+# not given in a job come from the command line:
+#   [{"rom": "roms/Pitfall.bin", "backend": "compiled", "frames": 2},
+#    {"rom": "mycart.bin", "halfClocks": 100000, "snapshot": "my.snap"}]
+#
+
+import argparse, json, multiprocessing, os, Queue, sys, time, traceback
+import params
+import simBackends
+from batchSim import BatchSim, writeSummary
+from sim6502 import Sim6502
+from simTIA import SimTIA
+
+# Per worker process: backend name : [Sim6502, SimTIA, and the state of
+# each just after loading]
+workerChips = dict()
+workerQueue = None
+workerQuiet = True
+
+def initWorker(queue, quiet):
+    global workerQueue, workerQuiet
+    workerQueue = queue
+    workerQuiet = quiet
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+
+def getWorkerChips(backendName):
+    if not backendName in workerChips:
+        cpu = simBackends.makeChipClass(Sim6502, backendName)()
+        tia = simBackends.makeChipClass(SimTIA, backendName)()
+        workerChips[backendName] = [cpu, cpu.getChipState(),
+                                    tia, tia.getChipState()]
+    cpu, cpuState, tia, tiaState = workerChips[backendName]
+    cpu.setChipState(cpuState)
+    tia.setChipState(tiaState)
+    return cpu, tia
+
+def runJob(job):
+    """ Runs one job dict in a worker.  Returns the job's summary, with
+        'ok' False and the 'error' traceback if it failed. """
+    startTime = time.time()
+    jobId = job['id']
+    try:
+        backendName = job['backend']
+        chips = getWorkerChips(backendName)
+
+        def frameCallback(frameIndex, framePath, tiaHalfClkCount):
+            workerQueue.put(('frame', jobId, frameIndex, framePath,
+                             tiaHalfClkCount, time.time() - startTime))
+
+        batch = BatchSim(job['rom'], backendName, job['out'], job['format'],
+                         job['snapshot'], job['checkpointDir'], chips)
+        summary = batch.run(job['frames'], job['halfClocks'], job['seconds'],
+                            frameCallback, job['steadyState'])
+        summary['ok'] = True
+        writeSummary(summary, os.path.join(job['outDir'], 'summary.json'))
+    except Exception:
+        summary = dict()
+        summary['ok'] = False
+        summary['error'] = traceback.format_exc()
+    except KeyboardInterrupt:
+        summary = dict()
+        summary['ok'] = False
+        summary['error'] = 'interrupted'
+    summary['id'] = jobId
+    summary['job'] = job
+    summary['worker'] = os.getpid()
+    summary['jobSec'] = time.time() - startTime
+    return summary
+
+def makeJobs(args):
+    defaults = {'frames':args.frames, 'halfClocks':args.halfClocks,
+                'seconds':args.seconds, 'format':args.format,
+                'snapshot':None, 'checkpointDir':args.checkpointDir,
+                'steadyState':args.steadyState}
+    jobList = []
+    if args.jobs != None:
+        of = open(args.jobs, 'r')
+        jobList = json.load(of)
+        of.close()
+    backends = args.backend
+    if backends == None:
+        backends = [params.circuitSimulatorBackend]
+    for romFile in args.romFiles:
+        for backendName in backends:
+            jobList.append({'rom':romFile, 'backend':backendName})
+
+    jobs = []
+    for i, jobDict in enumerate(jobList):
+        job = dict(defaults)
+        job.update(jobDict)
+        job.setdefault('backend', params.circuitSimulatorBackend)
+        if not 'rom' in job:
+            raise RuntimeError('ERROR: job %d has no rom'%i)
+        if job['frames'] == None and job['halfClocks'] == None and \
+           job['seconds'] == None:
+            raise RuntimeError('ERROR: job %d for %s has no frame, '%(i, job['rom']) +
+                               'half clock or seconds limit')
+        romName = os.path.splitext(os.path.basename(job['rom']))[0]
+        job['id'] = i
+        job['outDir'] = os.path.join(args.out, '%3.3d_%s_%s'%
+                                     (i, romName, job['backend']))
+        job['out'] = job['outDir']
+        if job['format'] == 'none':
+            job['out'] = None
+        jobs.append(job)
+    return jobs
+
+def printEvent(event, jobs):
+    kind, jobId, frameIndex, framePath, tiaHalfClkCount, jobSec = event
+    job = jobs[jobId]
+    print('job %d %s %s: frame %d at TIA half clock %d, %.1f sec'%
+          (jobId, job['rom'], job['backend'], frameIndex, tiaHalfClkCount,
+           jobSec))
+
+def runFarm(jobs, numWorkers, quiet=True):
+    """ Runs the jobs in a pool of numWorkers processes.  Returns the
+        list of job summaries, in job order. """
+    queue = multiprocessing.Queue()
+    pool = multiprocessing.Pool(numWorkers, initWorker, (queue, quiet))
+    results = [None] * len(jobs)
+    pending = [pool.apply_async(runJob, (job,)) for job in jobs]
+    try:
+        numDone = 0
+        while numDone < len(jobs):
+            try:
+                printEvent(queue.get(True, 0.5), jobs)
+            except Queue.Empty:
+                pass
+            for i, asyncResult in enumerate(pending):
+                if asyncResult == None or not asyncResult.ready():
+                    continue
+                summary = asyncResult.get()
+                results[i] = summary
+                pending[i] = None
+                numDone += 1
+                if summary['ok']:
+                    print('job %d %s %s: done, %s, %d frames, %d half clocks, '
+                          '%.1f half clocks/sec'%
+                          (i, jobs[i]['rom'], jobs[i]['backend'],
+                           summary['stopReason'], summary['frames'],
+                           summary['halfClocksRun'], summary['halfClocksPerSec']))
+                else:
+                    print('job %d %s %s: FAILED'%(i, jobs[i]['rom'],
+                                                  jobs[i]['backend']))
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    pool.join()
+
+    # Frames reported after their job finished
+    while True:
+        try:
+            printEvent(queue.get(False), jobs)
+        except Queue.Empty:
+            break
+    return results
+
+def getFarmSummary(results, elapsedSec, numWorkers):
+    farm = dict()
+    farm['workers'] = numWorkers
+    farm['elapsedSec'] = elapsedSec
+    farm['jobs'] = results
+    okResults = [r for r in results if r['ok']]
+    farm['numJobs'] = len(results)
+    farm['numFailed'] = len(results) - len(okResults)
+    farm['failed'] = [{'id':r['id'], 'rom':r['job']['rom'],
+                       'backend':r['job']['backend'], 'error':r['error']}
+                      for r in results if not r['ok']]
+    farm['totalHalfClocks'] = sum([r['halfClocksRun'] for r in okResults])
+    farm['totalFrames'] = sum([r['frames'] for r in okResults])
+    # Throughput of the whole farm, and the sum of each job's own rate
+    farm['halfClocksPerSec'] = 0.0
+    if elapsedSec > 0:
+        farm['halfClocksPerSec'] = farm['totalHalfClocks'] / elapsedSec
+    farm['sumJobHalfClocksPerSec'] = sum([r['halfClocksPerSec'] for r in okResults])
+    return farm
+
+def getArgParser():
+    parser = argparse.ArgumentParser(description='Run many headless ' +
+                 'simulations of ROMs and circuit simulators in a pool of ' +
+                 'processes.')
+    parser.add_argument('romFiles', nargs='*', help='cartridge ROM files')
+    parser.add_argument('--jobs', default=None,
+                        help='JSON file with a list of job dicts')
+    parser.add_argument('--backend', action='append', default=None,
+                        choices=simBackends.getBackendNames(),
+                        help='circuit simulator; may be given more than once '
+                             'to run each ROM with each.  Default from params.py')
+    parser.add_argument('--workers', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='number of worker processes')
+    parser.add_argument('--frames', type=int, default=None,
+                        help='stop each job after this many frames')
+    parser.add_argument('--half-clocks', type=int, default=None,
+                        dest='halfClocks',
+                        help='stop each job after this many TIA half clocks')
+    parser.add_argument('--seconds', type=float, default=None,
+                        help='stop each job after this much wall clock time')
+    parser.add_argument('--out', default='outFarm',
+                        help='directory for each job\'s frames and summaries')
+    parser.add_argument('--format', default='ppm',
+                        choices=['ppm', 'png', 'rgba', 'npy', 'none'],
+                        help='frame image format, or none to not save frames')
+    parser.add_argument('--checkpoint-dir', default=params.checkpointCacheDir,
+                        dest='checkpointDir',
+                        help='checkpoint cache directory shared by the jobs')
+    parser.add_argument('--steady-state', default='run', dest='steadyState',
+                        choices=['run', 'stop', 'skip'],
+                        help='what each job does when its console repeats an '
+                             'earlier state: keep running, stop, or skip ahead')
+    parser.add_argument('--verbose', action='store_true',
+                        help="print the workers' simulation messages")
+    return parser
+
+def main(argv):
+    args = getArgParser().parse_args(argv)
+    jobs = makeJobs(args)
+    if len(jobs) == 0:
+        print('ERROR: No jobs.  Give ROM files or --jobs')
+        return 2
+    for job in jobs:
+        if not os.path.exists(job['outDir']):
+            os.makedirs(job['outDir'])
+
+    numWorkers = max(1, min(args.workers, len(jobs)))
+    print('Running %d jobs in %d worker processes'%(len(jobs), numWorkers))
+    startTime = time.time()
+    results = runFarm(jobs, numWorkers, not args.verbose)
+    farm = getFarmSummary(results, time.time() - startTime, numWorkers)
+
+    summaryPath = os.path.join(args.out, 'farmSummary.json')
+    writeSummary(farm, summaryPath)
+    print('%d jobs, %d failed, %d frames, %d half clocks in %.1f sec: '%
+          (farm['numJobs'], farm['numFailed'], farm['totalFrames'],
+           farm['totalHalfClocks'], farm['elapsedSec']) +
+          '%.1f half clocks/sec'%(farm['halfClocksPerSec']))
+    for failed in farm['failed']:
+        print('FAILED job %d %s %s:\n%s'%(failed['id'], failed['rom'],
+                                          failed['backend'], failed['error']))
+    print('Wrote %s'%(summaryPath))
+    if farm['numFailed'] > 0:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
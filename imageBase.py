@@ -19,8 +19,24 @@
 # THE SOFTWARE.
 #------------------------------------------------------------------------------
 
+import sys
+from array import array
 import params
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# ImageBase keeps the image in a frame buffer: an array of
+# imageWidth * imageHeight packed 0xRRGGBBAA ints, row by row.
+# setNextPixel() just stores an int in it.  Derived classes copy out
+# whole scanlines or frames when they need them, by overriding
+# flushScanline() or in their restartImage(), with getRGBABytes().
+# Writing ints into an array is several times cheaper than packing
+# each pixel's bytes into a bytearray; the byte order is fixed up once
+# per scanline or frame instead.
+
 class ImageBase():
     def __init__(self):
         self.imageWidth  = params.scanlineNumPixels
@@ -30,25 +46,76 @@ class ImageBase():
         self.lastPixelX  = 0
         self.lastPixelY  = 0
 
+        self.pixels = array('I', [0xFFFFFFFF]) * self.getNumPixels()
+        # Index in self.pixels of (lastPixelX, lastPixelY)
+        self.pixelIndex = 0
+
     def getNumPixels(self):
         return self.imageWidth * self.imageHeight
 
     def setPixel(self, x, y, rgbaInt):
-        pass
+        self.pixels[y * self.imageWidth + x] = rgbaInt
 
     def setNextPixel(self, rgba):
         #print('ImageBase setNextPixel(0x%8.8X) %d %d'%
         #      (rgba, self.lastPixelX, self.lastPixelY))
-        self.setPixel(self.lastPixelX, self.lastPixelY, rgba)
+        self.pixels[self.pixelIndex] = rgba
+        self.pixelIndex += 1
         self.lastPixelX += 1
         if self.lastPixelX >= self.imageWidth:
             self.startNextScanline()
 
     def startNextScanline(self):
+        self.flushScanline(self.lastPixelY)
         self.lastPixelX = 0
         self.lastPixelY += 1
         if self.lastPixelY >= self.imageHeight:
             self.lastPixelY = 0
+        self.pixelIndex = self.lastPixelY * self.imageWidth
+
+    def flushScanline(self, y):
+        # Called when scanline y is complete
+        pass
+
+    def restartImage(self):
+        self.lastPixelX = 0
+        self.lastPixelY = 0
+        self.pixelIndex = 0
+
+    def clearImage(self, rgbaInt):
+        self.pixels = array('I', [rgbaInt]) * self.getNumPixels()
+
+    def getRGBABytes(self, firstRow=0, numRows=None):
+        """ Returns a string of 4 bytes R, G, B, A per pixel for numRows
+            scanlines starting at firstRow, or the rest of the image if
+            numRows is None """
+        if numRows == None:
+            numRows = self.imageHeight - firstRow
+        start = firstRow * self.imageWidth
+        pixels = self.pixels[start : start + numRows * self.imageWidth]
+        if sys.byteorder == 'little':
+            pixels.byteswap()
+        return pixels.tostring()
+
+    def getFrameArray(self):
+        """ Returns the image as a numpy uint8 array of shape
+            (imageHeight, imageWidth, 4), or None if numpy isn't installed """
+        if numpy == None:
+            return None
+        return numpy.frombuffer(self.getRGBABytes(), dtype=numpy.uint8).reshape(
+                   (self.imageHeight, self.imageWidth, 4))
+
+    def saveRaw(self, filePath):
+        """ Saves the image as raw RGBA bytes, or as a numpy .npy file
+            if filePath ends with .npy """
+        if filePath.endswith('.npy'):
+            if numpy == None:
+                raise RuntimeError('ERROR: numpy is needed to save %s'%filePath)
+            numpy.save(filePath, self.getFrameArray())
+            return
+        of = open(filePath, 'wb')
+        of.write(self.getRGBABytes())
+        of.close()
         
     def rgbaIntToList(self, rgbaInt):
         return [(rgbaInt >> 24) & 0xFF,
@@ -174,8 +174,8 @@ class ImageOpenGL(ImageBase):
     def restartImage(self):
         if self.lastPixelY > params.frameHeightPixels * 0.7:
             self.renderToTopHalf = not self.renderToTopHalf
-        self.lastPixelX = 0
-        self.lastPixelY = 0
+        ImageBase.restartImage(self)
+        self.clearImage(0xFFFFFFFF)
         self.clearTexture(0xFFFFFFFF)
              
     def enterRenderLoop(self, funcCallbackPerRender):
@@ -185,28 +185,19 @@ class ImageOpenGL(ImageBase):
         # is closed or something causes the loop to end.
         glutMainLoop()
 
-    # TODO: group pixels into scanlines, and scanlines into rectangular
-    # regions to update with a single call to glTexSubImage, rather than 
-    # calling it for each pixel
-    #
-    def setPixel(self, x, y, rgbaInt):
-        #print('ImageOpenGL setPixel(%d, %d, 0x%8.8X)'%(x, y, rgbaInt))
-        # TODO: detect if wrapped around and switch region?
-        # TODO: update gl texture
-        if x == 0 and y == 0:
+    def flushScanline(self, y):
+        # Upload each scanline as it's finished
+        if y == 0:
             self.startedNewImage = True
 
-        a = array('B', self.rgbaIntToList(rgbaInt))  # 'B' for unsigned byte
-        astr = a.tostring()
-
         glBindTexture(GL_TEXTURE_2D, self.textureId)
         glTexSubImage2D(GL_TEXTURE_2D,    # target
                         0,                # mipmap level
-                        x, y,             # offset into texture
-                        1, 1,             # width, height of subimage
+                        0, y,             # offset into texture
+                        self.imageWidth, 1, # width, height of subimage
                         GL_RGBA,          # format
                         GL_UNSIGNED_BYTE, # type
-                        astr)
+                        self.getRGBABytes(y, 1))
 
 def getInterface():
     try:
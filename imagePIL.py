@@ -28,36 +28,26 @@ class ImagePIL(ImageBase):
     def __init__(self):
         print('Creating ImagePIL class to save frame images')
         ImageBase.__init__(self)
-        self.image = Image.new("RGBA", (params.scanlineNumPixels,
-                                        params.frameHeightPixels), "white")
         self.outputDir = params.imageOutputDir
         self.frameCount = 0
         self.dateTimeStr = time.strftime('%y_%m%d_%H%M%S')
 
 
-    def setPixel(self, x, y, rgba):
-        rgbaTuple = ((rgba >> 24) & 0xFF, (rgba >> 16) & 0xFF,
-                     (rgba >> 8) & 0xFF, rgba & 0xFF)
-
-        # For the other endianness:
-        #rgbaTuple = (rgba & 0xFF, (rgba >> 8) & 0xFF,
-        #             (rgba >> 16) & 0xFF, (rgba >> 24) & 0xFF)
-
-        #print('ImagePIL setPixel(%d, %d, 0x%8.8X) tup %s'%
-        #       (x, y, rgba, str(rgbaTuple)))
-
-        self.image.putpixel((x,y), rgbaTuple)
-
     def restartImage(self):
         # Save if we've got more than 80% of a frame
         if self.lastPixelY >= params.frameHeightPixels * 0.8:
             fileName = 'frame_%s_%4.4d.png'%(self.dateTimeStr, self.frameCount)
             filePath = self.outputDir + '/' + fileName
             print('Saving frame %d image to %s'%(self.frameCount, filePath))
-            self.image.save(filePath)
+            self.getImage().save(filePath)
             self.frameCount += 1
-        self.lastPixelX = 0
-        self.lastPixelY = 0
+        ImageBase.restartImage(self)
+
+    def getImage(self):
+        # The whole frame buffer in one copy, rather than a putpixel()
+        # for each pixel
+        return Image.frombuffer('RGBA', (self.imageWidth, self.imageHeight),
+                                self.getRGBABytes(), 'raw', 'RGBA', 0, 1)
 
 def getInterface():
     global Image
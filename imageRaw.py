@@ -0,0 +1,90 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+#------------------------------------------------------------------------------
+#
+# ImageRaw
+# Accumulates pixels in memory with no display and no image library,
+# and saves each completed frame as a binary .ppm file, as raw RGBA
+# bytes (.rgba) or a numpy array (.npy), or as a .png if the Python
+# Image Library (PIL) can be imported.
+#
+
+import os
+import params
+from imageBase import ImageBase, numpy
+
+class ImageRaw(ImageBase):
+    def __init__(self, outputDir=None, fileFormat='ppm', filePrefix='frame'):
+        ImageBase.__init__(self)
+
+        # If outputDir is None, frames are counted but not saved
+        self.outputDir = outputDir
+        self.fileFormat = fileFormat
+        self.filePrefix = filePrefix
+        self.frameCount = 0
+        self.framePaths = []
+
+        if fileFormat == 'png':
+            try:
+                from PIL import Image
+            except ImportError:
+                print('Could not import Python Image Library.  ' +
+                      'Saving .ppm images instead of .png')
+                self.fileFormat = 'ppm'
+        if fileFormat == 'npy' and numpy == None:
+            print('Could not import numpy.  Saving .rgba images instead of .npy')
+            self.fileFormat = 'rgba'
+        if outputDir != None and not os.path.exists(outputDir):
+            os.makedirs(outputDir)
+
+    def restartImage(self):
+        """ Starts a new image.  Returns True if the image so far was a
+            frame: more than 80% of the image height, as in ImagePIL. """
+        finishedFrame = False
+        if self.lastPixelY >= params.frameHeightPixels * 0.8:
+            if self.outputDir != None:
+                fileName = '%s_%4.4d.%s'%(self.filePrefix, self.frameCount,
+                                          self.fileFormat)
+                filePath = os.path.join(self.outputDir, fileName)
+                self.saveImage(filePath)
+                self.framePaths.append(filePath)
+            self.frameCount += 1
+            finishedFrame = True
+        ImageBase.restartImage(self)
+        return finishedFrame
+
+    def saveImage(self, filePath):
+        if self.fileFormat == 'png':
+            from PIL import Image
+            image = Image.frombuffer('RGBA', (self.imageWidth, self.imageHeight),
+                                     self.getRGBABytes(), 'raw', 'RGBA', 0, 1)
+            image.save(filePath)
+        elif self.fileFormat == 'ppm':
+            # Drop every 4th (alpha) byte
+            rgb = bytearray(self.getRGBABytes())
+            del rgb[3::4]
+            of = open(filePath, 'wb')
+            of.write('P6\n%d %d\n255\n'%(self.imageWidth, self.imageHeight))
+            of.write(rgb)
+            of.close()
+        else:
+            self.saveRaw(filePath)
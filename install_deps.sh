@@ -21,3 +21,6 @@ sudo pip install PyOpenGL
 #sudo pip install pil
 #sudo pip install Pillow
 
+# With numba and numpy, params.circuitSimulatorBackend = 'compiled'
+# runs the circuit simulation as compiled code, which is much faster
+#sudo pip install numpy numba
@@ -39,6 +39,11 @@ class MainSim:
         # a cartridge ROM file holding the program instructions.
         #
         self.sim = Sim2600Console(params.romFile)
+        if params.startSnapshotFile != None:
+            print('Starting from console snapshot %s'%(params.startSnapshotFile))
+            self.sim.loadSnapshot(params.startSnapshotFile)
+        else:
+            self.sim.resumeFromCheckpoint()
 
         # For measuring how fast the simulation is running
         self.lastUpdateTimeSec = None
@@ -0,0 +1,208 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+#------------------------------------------------------------------------------
+#
+# netlistFile.py
+# A binary file format for a chip's netlist that can be loaded without
+# unpickling or any per-wire Python work.  The file holds flat
+# little-endian arrays in the same compressed sparse row (CSR) layout
+# as circuitSimulatorUsingArrays, so the arrays and compiled simulators
+# can use them as they are.
+#
+# Layout:
+#   header       magic 'S2600NET', then uint32s: version, flags,
+#                numWires, numFets, vccWireIndex, gndWireIndex,
+#                numSections, crc32 of everything after the header
+#   sections     numSections entries of: 24-byte name, uint32 typecode
+#                ('B' for uint8, 'i' for int32, 'c' for bytes),
+#                uint32 byte offset from start of file, uint32 count
+#   data         each section's array, aligned to 8 bytes
+#
+# Transistors that don't exist (None in a simulator's transistorList)
+# have side and gate wire indices of -1.  WIRE_STATIC_REP holds
+# CircuitSimulatorBase.staticWireRep if the netlist was collapsed
+# before it was written.
+#
+# To convert the pickled netlists:
+#   python netlistFile.py chips/net_6502.pkl chips/net_6502.netbin
+#
+
+import mmap, struct, sys, zlib
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+fileMagic = 'S2600NET'
+fileVersion = 1
+fileExtension = '.netbin'
+
+# Header flags
+FLAG_STATIC_COLLAPSED = 1 << 0   # written after collapseStaticWires()
+
+headerFormat = '<8s8I'
+headerSize = struct.calcsize(headerFormat)
+sectionFormat = '<24s3I'
+sectionSize = struct.calcsize(sectionFormat)
+
+# Section names in the order they're written, with their typecode
+sectionTypes = [('WIRE_PULLED',       'B'),
+                ('WIRE_CT_OFFSETS',   'i'),
+                ('WIRE_CT_FETS',      'i'),
+                ('WIRE_CT_OTHERS',    'i'),
+                ('WIRE_GATE_OFFSETS', 'i'),
+                ('WIRE_GATE_FETS',    'i'),
+                ('FET_SIDE1',         'i'),
+                ('FET_SIDE2',         'i'),
+                ('FET_GATE',          'i'),
+                ('WIRE_STATIC_REP',   'i'),
+                ('WIRE_NAMES',        'c')]
+
+numpyTypes = {'B': '<u1', 'i': '<i4', 'c': 'S1'}
+
+def isNetlistFile(filePath):
+    of = open(filePath, 'rb')
+    magic = of.read(len(fileMagic))
+    of.close()
+    return magic == fileMagic
+
+def toLittleEndian(arr):
+    if sys.byteorder != 'little' and arr.itemsize > 1:
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr
+
+def writeNetlistFile(filePath, sim):
+    """ Write the netlist of a loaded simulator, as returned by its
+        getNetlistArrays() """
+    data = sim.getNetlistArrays()
+    # Names are separated by a 0 byte
+    data['WIRE_NAMES'] = '\0'.join(data['WIRE_NAMES'])
+
+    flags = 0
+    if sim.staticWireRep != None:
+        flags |= FLAG_STATIC_COLLAPSED
+
+    # Lay out the sections after the header and section table
+    offset = headerSize + sectionSize * len(sectionTypes)
+    sectionTable = ''
+    payload = ''
+    for name, typecode in sectionTypes:
+        pad = (8 - offset % 8) % 8
+        payload += '\0' * pad
+        offset += pad
+        if typecode == 'c':
+            sectionBytes = data[name]
+            count = len(sectionBytes)
+        else:
+            arr = toLittleEndian(data[name])
+            sectionBytes = arr.tostring()
+            count = len(arr)
+        sectionTable += struct.pack(sectionFormat, name, ord(typecode), offset, count)
+        payload += sectionBytes
+        offset += len(sectionBytes)
+
+    body = sectionTable + payload
+    crc = zlib.crc32(body) & 0xFFFFFFFF
+    header = struct.pack(headerFormat, fileMagic, fileVersion, flags,
+                         sim.numWires, sim.numFets, sim.vccWireIndex, sim.gndWireIndex,
+                         len(sectionTypes), crc)
+    of = open(filePath, 'wb')
+    of.write(header)
+    of.write(body)
+    of.close()
+
+
+class NetlistFile:
+    """ A memory-mapped netlist file.  getArray(name) returns a section
+        as a read-only numpy array viewing the file's memory, or as an
+        array.array copied in one block if numpy isn't installed. """
+
+    def __init__(self, filePath, verifyChecksum = True):
+        self.filePath = filePath
+        of = open(filePath, 'rb')
+        self.mmap = mmap.mmap(of.fileno(), 0, access=mmap.ACCESS_READ)
+        of.close()
+
+        if len(self.mmap) < headerSize:
+            raise RuntimeError('Netlist file %s is too short'%(filePath))
+        (magic, version, self.flags, self.numWires, self.numFets,
+         self.vccWireIndex, self.gndWireIndex, numSections, crc) = \
+            struct.unpack(headerFormat, self.mmap[:headerSize])
+        if magic != fileMagic:
+            raise RuntimeError('%s is not a netlist file'%(filePath))
+        if version != fileVersion:
+            raise RuntimeError('Netlist file %s is version %d.  Expected %d'%
+                               (filePath, version, fileVersion))
+        if verifyChecksum:
+            fileCrc = zlib.crc32(self.mmap[headerSize:]) & 0xFFFFFFFF
+            if fileCrc != crc:
+                raise RuntimeError('Netlist file %s failed its checksum'%(filePath))
+        self.crc = crc
+
+        self.sections = dict()
+        for i in xrange(numSections):
+            start = headerSize + i * sectionSize
+            name, typecode, offset, count = \
+                struct.unpack(sectionFormat, self.mmap[start:start + sectionSize])
+            self.sections[name.rstrip('\0')] = (chr(typecode), offset, count)
+
+        self.staticCollapsed = (self.flags & FLAG_STATIC_COLLAPSED) != 0
+
+    def getArray(self, name):
+        typecode, offset, count = self.sections[name]
+        if numpy != None:
+            return numpy.frombuffer(self.mmap, dtype=numpyTypes[typecode],
+                                    count=count, offset=offset)
+        return self.getPyArray(name)
+
+    def getPyArray(self, name):
+        """ Always returns an array.array copy of the section """
+        typecode, offset, count = self.sections[name]
+        arr = array(typecode)
+        arr.fromstring(self.mmap[offset:offset + count * arr.itemsize])
+        if sys.byteorder != 'little' and arr.itemsize > 1:
+            arr.byteswap()
+        return arr
+
+    def getWireNames(self):
+        typecode, offset, count = self.sections['WIRE_NAMES']
+        return self.mmap[offset:offset + count].split('\0')
+
+
+def convertPickleFile(pickleFilePath, netlistFilePath, collapseStaticNetlist = None):
+    import params
+    from circuitSimulatorUsingLists import CircuitSimulator
+    if collapseStaticNetlist == None:
+        collapseStaticNetlist = params.collapseStaticNetlist
+    sim = CircuitSimulator()
+    sim.collapseStaticNetlist = collapseStaticNetlist
+    sim.loadCircuit(pickleFilePath)
+    writeNetlistFile(netlistFilePath, sim)
+    print('Wrote %s'%(netlistFilePath))
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: python netlistFile.py in.pkl out%s'%(fileExtension))
+        sys.exit(1)
+    convertPickleFile(sys.argv[1], sys.argv[2])
@@ -17,11 +17,69 @@ imageOutputDir = 'outFrames'
 
 # Files describing each chip's network of transistors and wires.
 # Also contains names for various wires, some of which are the
-# chips input and output pads.
+# chips input and output pads.  The .netbin files are the binary
+# netlists written by netlistFile.py from the .pkl files, and load
+# much faster.  Either kind may be used.
 # 
-chip6502File = 'chips/net_6502.pkl'
-chipTIAFile  = 'chips/net_TIA.pkl'
+chip6502File = 'chips/net_6502.netbin'
+chipTIAFile  = 'chips/net_TIA.netbin'
+
+# Which circuit simulator the 6502 and TIA simulations use.  See
+# simBackends.py.  All of them produce the same results.
+#   'lists'  : Wire and NmosFet objects, groups of wires held in a list
+#   'sets'   : Wire and NmosFet objects, groups of wires held in a set
+#   'tables' : 'arrays' with groups of wires looked up in tables made
+#              for each channel-connected component when loading
+#   'arrays' : wire and transistor state held in flat arrays
+#   'compiled' : 'arrays' with the recalc loop compiled by numba, if
+#              numba is installed.  Falls back to 'arrays' if not.
+#   'frontier' : 'arrays' with the recalc steps that have many wires
+#              done with numpy operations.  Needs numpy.
+circuitSimulatorBackend = 'lists'
+
+# If True, each chip's netlist is simplified when it's loaded by
+# CircuitSimulatorBase.collapseStaticWires().  Wires that are always
+# connected are merged.  Neither the 6502 nor the TIA netlist has any
+# such wires, so this only costs load time.  staticCollapseCheck.py
+# checks the merge on a made up netlist.
+collapseStaticNetlist = False
+
+# If not None, a console state file written by
+# Sim2600Console.saveSnapshot().  The simulation starts from that state
+# rather than from reset, which skips the many thousands of half clocks
+# before visible pixels appear.  It must be saved from the same romFile.
+startSnapshotFile = None
+
+# If not None, a directory of console checkpoints, see checkpointCache.py.
+# A checkpoint is saved every checkpointInterval TIA half clocks, and
+# mainSim.py starts from the latest checkpoint saved for the ROM and
+# netlists.  When the checkpoints take more than checkpointCacheMaxBytes,
+# the least recently used ones are deleted.
+checkpointCacheDir = None
+checkpointInterval = 20000
+checkpointCacheMaxBytes = 256 * 1024 * 1024
  
+# If more than 0, each chip remembers the results of up to this many
+# wire recalcs and copies a result back when the chip is in the same
+# state and recalculates the same wires again, rather than simulating
+# it.  Each result holds the wires and transistors the recalc changed.
+# It only pays off when a chip's states repeat exactly.  Running a
+# ROM, the TIA's counters change its state every half clock and it
+# gets no hits, and the 6502 gets under 10%, so the console runs no
+# faster.  The 6502 alone in a loop (bench.py's 6502 workload) gets
+# 93% hits and runs about 13 times as fast with 'arrays' and 5 times
+# with 'compiled'.  See CircuitSimulatorBase.enableRecalcCache()
+recalcCacheMaxEntries = 0
+
+# If True, Sim2600Console watches for the console returning to a
+# state it was in at an earlier VSYNC, as when a ROM waits at a title
+# screen.  See Sim2600Console.useLoopDetection()
+detectStateLoops = False
+
+# Colors used for the TIA's pixels: 'NTSC', or 'SECAM' which uses
+# only the luminance.  See SimTIA.setPalette()
+tiaPalette = 'NTSC'
+
 # How many simulation clock changes to run between updates
 # of the OpenGL rendering.
 numTIAHalfClocksPerRender = 128
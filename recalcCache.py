@@ -0,0 +1,79 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+#------------------------------------------------------------------------------
+#
+# recalcCache.py
+# A bounded, least recently used cache of the results of recalculating
+# a chip's wires.  CircuitSimulatorBase uses it when enableRecalcCache()
+# has been called: a recalc is keyed by the chip's state hash and the
+# wires to recalculate, and on a hit the wire and gate states the recalc
+# changed are set again rather than running doRecalcIterations().
+# This pays off only when the chip goes through exactly the same states
+# over and over, as the 6502 does alone in a loop.  Running a ROM, the
+# TIA's counters keep its state from ever repeating, see params.py.
+#
+
+from collections import OrderedDict
+
+class RecalcCache:
+    def __init__(self, maxEntries):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.numHits = 0
+        self.numMisses = 0
+        self.numEvicted = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        value = self.entries.pop(key, None)
+        if value == None:
+            self.numMisses += 1
+            return None
+        # Put it back as the most recently used
+        self.entries[key] = value
+        self.numHits += 1
+        return value
+
+    def put(self, key, value):
+        if key in self.entries:
+            del self.entries[key]
+        elif len(self.entries) >= self.maxEntries:
+            self.entries.popitem(last=False)
+            self.numEvicted += 1
+        self.entries[key] = value
+
+    def clear(self):
+        self.entries.clear()
+
+    def getHitRate(self):
+        total = self.numHits + self.numMisses
+        if total == 0:
+            return 0.0
+        return float(self.numHits) / total
+
+    def getStatsStr(self):
+        return 'recalc cache: %d hits, %d misses (%.1f%% hits), %d entries, ' \
+               '%d evicted'%(self.numHits, self.numMisses,
+                             100.0 * self.getHitRate(), len(self.entries),
+                             self.numEvicted)
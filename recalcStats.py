@@ -0,0 +1,224 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+#------------------------------------------------------------------------------
+#
+# recalcStats.py
+# Detailed counts of the work a chip's circuit simulator does, for
+# finding the parts of the 6502 and TIA that take the most time.
+# CircuitSimulatorBase uses it when enableRecalcStats() has been called.
+# It counts:
+#   how many times each wire is recalculated
+#   how many times each transistor is turned on or off
+#   a histogram of the size of the groups of wires walked
+#   a histogram of the iterations each recalc took
+#   recalcs that didn't converge
+# each split by the phase of the chip's clock, low or high, when the
+# recalc started.
+#
+# The counts are taken by putting counting versions of doWireRecalc(),
+# turnTransistorOn(), turnTransistorOff() and doRecalcIterations() on
+# the chip object, in front of its class's methods, so the simulators
+# don't do any extra work when this is off.  While it's on, the
+# compiled simulator runs the arrays simulator's Python code, and
+# recalcs replayed by a RecalcCache aren't counted.
+#
+
+import csv, json
+import circuitSimulatorBase
+from nmosFet import NmosFet
+
+phaseNames = ['clkLow', 'clkHigh']
+
+# Most wires still waiting to be recalculated to record when a recalc
+# doesn't converge
+maxPendingWires = 64
+
+class RecalcStats:
+    def __init__(self, chip, clockWireIndex):
+        self.chip = chip
+        self.clockWireIndex = clockWireIndex
+        self.installed = False
+        self.clear()
+
+    def clear(self):
+        numWires = self.chip.numWires
+        numFets = self.chip.numFets
+        # Each is indexed by phase: 0 clock low, 1 clock high
+        self.phase = 0
+        self.wireRecalcs = [[0] * numWires, [0] * numWires]
+        self.fetToggles = [[0] * numFets, [0] * numFets]
+        self.groupSizes = [dict(), dict()]
+        self.recalcSteps = [dict(), dict()]
+        self.nonConvergence = []
+
+    def install(self):
+        if self.installed:
+            return
+        chip = self.chip
+        chipClass = chip.__class__
+        classDoWireRecalc = chipClass.doWireRecalc
+        classTurnOn = chipClass.turnTransistorOn
+        classTurnOff = chipClass.turnTransistorOff
+        classCountSteps = chipClass.countRecalcSteps
+        clockWireIndex = self.clockWireIndex
+        stats = self
+
+        def doRecalcIterations():
+            if clockWireIndex != None:
+                stats.phase = int(chip.isHigh(clockWireIndex))
+            # The Python recalc loop, even for the compiled simulator,
+            # so the counting methods below are called
+            circuitSimulatorBase.CircuitSimulatorBase.doRecalcIterations(chip)
+
+        def doWireRecalc(wireIndex):
+            startCount = chip.numAddWireToGroup
+            classDoWireRecalc(chip, wireIndex)
+            stats.wireRecalcs[stats.phase][wireIndex] += 1
+            groupSize = chip.numAddWireToGroup - startCount
+            if groupSize > 0:
+                hist = stats.groupSizes[stats.phase]
+                hist[groupSize] = hist.get(groupSize, 0) + 1
+
+        def turnTransistorOn(t):
+            classTurnOn(chip, t)
+            stats.countToggle(t)
+
+        def turnTransistorOff(t):
+            classTurnOff(chip, t)
+            stats.countToggle(t)
+
+        def countRecalcSteps(step):
+            classCountSteps(chip, step)
+            hist = stats.recalcSteps[stats.phase]
+            hist[step] = hist.get(step, 0) + 1
+            if step >= chip.recalcStepLimit:
+                stats.addNonConvergence(step)
+
+        chip.doRecalcIterations = doRecalcIterations
+        chip.doWireRecalc = doWireRecalc
+        chip.turnTransistorOn = turnTransistorOn
+        chip.turnTransistorOff = turnTransistorOff
+        chip.countRecalcSteps = countRecalcSteps
+        self.installed = True
+
+    def uninstall(self):
+        if not self.installed:
+            return
+        for name in ['doRecalcIterations', 'doWireRecalc', 'turnTransistorOn',
+                     'turnTransistorOff', 'countRecalcSteps']:
+            del self.chip.__dict__[name]
+        self.installed = False
+
+    def countToggle(self, t):
+        # The lists and sets simulators pass NmosFet objects, the
+        # arrays simulator passes transistor indices
+        if isinstance(t, NmosFet):
+            t = t.index
+        self.fetToggles[self.phase][t] += 1
+
+    def addNonConvergence(self, step):
+        chip = self.chip
+        pending = [int(chip.recalcOrder[i]) for i in
+                   xrange(min(chip.lastRecalcOrder, maxPendingWires))]
+        self.nonConvergence.append({'halfClkCount': chip.halfClkCount,
+                                    'phase': phaseNames[self.phase],
+                                    'steps': step,
+                                    'numPendingWires': int(chip.lastRecalcOrder),
+                                    'pendingWires': pending})
+
+    def getWireNames(self):
+        # All of the names of each wire, joined with '|'
+        names = [[] for i in xrange(self.chip.numWires)]
+        for name, wireIndex in self.chip.wireNames.iteritems():
+            names[wireIndex].append(name)
+        return ['|'.join(sorted(wireNames)) for wireNames in names]
+
+    def getReport(self):
+        """ Returns a dict of everything counted, for writing as JSON.
+            Histograms are dicts of {size or steps: count}, and each
+            count is a list of [clock low, clock high]. """
+        chip = self.chip
+        report = dict()
+        report['chip'] = chip.__class__.__name__
+        report['netlistHash'] = chip.getNetlistHash()
+        report['halfClkCount'] = chip.halfClkCount
+        report['phases'] = phaseNames
+        report['recalcs'] = [sum(hist.values()) for hist in self.recalcSteps]
+        report['wiresRecalculated'] = [sum(counts) for counts in self.wireRecalcs]
+        report['transistorToggles'] = [sum(counts) for counts in self.fetToggles]
+        report['groupSizeHistogram'] = self.getHistogram(self.groupSizes)
+        report['recalcStepHistogram'] = self.getHistogram(self.recalcSteps)
+        report['nonConvergence'] = self.nonConvergence
+        report['wireNames'] = self.getWireNames()
+        report['wireRecalcs'] = self.wireRecalcs
+        report['transistorToggleCounts'] = self.fetToggles
+        return report
+
+    def getHistogram(self, hists):
+        keys = sorted(set(hists[0].keys()) | set(hists[1].keys()))
+        return dict([(key, [hists[0].get(key, 0), hists[1].get(key, 0)])
+                     for key in keys])
+
+    def writeJSON(self, filePath):
+        of = open(filePath, 'w')
+        json.dump(self.getReport(), of, indent=1, sort_keys=True)
+        of.write('\n')
+        of.close()
+
+    def writeCSV(self, filePathPrefix):
+        """ Writes filePathPrefix + '_wires.csv' with each wire's recalc
+            counts, '_fets.csv' with each transistor's wires and toggle
+            counts, and '_hist.csv' with the histograms.  Returns the
+            file paths. """
+        arrays = self.chip.getNetlistArrays()
+        wireNames = self.getWireNames()
+        paths = [filePathPrefix + '_wires.csv', filePathPrefix + '_fets.csv',
+                 filePathPrefix + '_hist.csv']
+
+        of = open(paths[0], 'wb')
+        writer = csv.writer(of)
+        writer.writerow(['wire', 'names'] + ['recalcs_' + p for p in phaseNames])
+        for i in xrange(self.chip.numWires):
+            writer.writerow([i, wireNames[i], self.wireRecalcs[0][i],
+                             self.wireRecalcs[1][i]])
+        of.close()
+
+        of = open(paths[1], 'wb')
+        writer = csv.writer(of)
+        writer.writerow(['fet', 'gate', 'side1', 'side2'] +
+                        ['toggles_' + p for p in phaseNames])
+        for i in xrange(self.chip.numFets):
+            writer.writerow([i, arrays['FET_GATE'][i], arrays['FET_SIDE1'][i],
+                             arrays['FET_SIDE2'][i], self.fetToggles[0][i],
+                             self.fetToggles[1][i]])
+        of.close()
+
+        of = open(paths[2], 'wb')
+        writer = csv.writer(of)
+        writer.writerow(['histogram', 'value'] + phaseNames)
+        for name, hists in [('groupSize', self.groupSizes),
+                            ('recalcSteps', self.recalcSteps)]:
+            hist = self.getHistogram(hists)
+            for key in sorted(hist.keys()):
+                writer.writerow([name, key] + hist[key])
+        of.close()
+        return paths
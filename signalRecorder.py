@@ -0,0 +1,425 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+#------------------------------------------------------------------------------
+#
+# signalRecorder.py
+# A logic analyzer for the console.  SignalRecorder samples a set of the
+# 6507's and TIA's wires at the end of every TIA half clock, see
+# Sim2600Console.recordSignals(), and SignalTrace reads them back.
+#
+# A signal is given as 'cpu:NAME' or 'tia:NAME', where NAME is one of
+# the chip's wireNames, like 'cpu:R/W' or 'tia:VSYNC', or a bus of pads
+# from params.py, like 'cpu:AB' or 'tia:DB', which records one signal
+# per pad: 'cpu:AB0', 'cpu:AB1', ...
+#
+# Samples are stored in columns, one per signal, so a signal can be
+# read without reading the others.  Each chunk of chunkHalfClocks
+# samples of a signal is packed 8 samples to a byte, least significant
+# bit first, and zlib compressed.  The file is:
+#   magic, version
+#   the compressed columns of each chunk
+#   a JSON index of the signals and of each chunk's TIA half clock,
+#   number of samples and column offsets and sizes
+#   the offset and size of the index, and the magic again
+# SignalTrace memory maps the file and only decompresses the chunks
+# and columns asked for.  It can also write a VCD file for viewing in
+# GTKWave and other waveform viewers.  From the command line:
+#
+#   python batchSim.py roms/Pitfall.bin --half-clocks 20000 --record-signals p.sig
+#   python signalRecorder.py p.sig --list
+#   python signalRecorder.py p.sig --vcd p.vcd --start 10000 --end 12000
+#
+
+import argparse, binascii, json, mmap, os, struct, sys, zlib
+import params
+from wire import Wire
+
+fileMagic = 'S2600SIG'
+fileVersion = 1
+footerFormat = '<QQ8s'
+
+# Buses that can be recorded by name, least significant pad first
+busPadNames = {'cpu': {'AB': params.cpuAddressBusPadNames,
+                       'DB': params.dataBusPadNames},
+               'tia': {'AB': params.tiaAddressBusPadNames,
+                       'DB': params.dataBusPadNames,
+                       'I' : params.tiaInputPadNames}}
+
+# The buses and control signals between the chips, and the TIA's sync
+# and color outputs.  61 signals.
+defaultSignals = ['cpu:AB', 'cpu:DB', 'cpu:R/W', 'cpu:SYNC', 'cpu:CLK0',
+                  'cpu:RDY', 'cpu:RES',
+                  'tia:AB', 'tia:DB', 'tia:I', 'tia:CLK0', 'tia:CLK2',
+                  'tia:PH0', 'tia:R/W', 'tia:CS0', 'tia:CS3', 'tia:RDY_lowCtrl',
+                  'tia:VSYNC', 'tia:VBLANK', 'tia:WSYNC', 'tia:RSYNC',
+                  'tia:L0_lowCtrl', 'tia:L1_lowCtrl', 'tia:L2_lowCtrl',
+                  'tia:COLCNT_T0', 'tia:COLCNT_T1', 'tia:COLCNT_T2',
+                  'tia:COLCNT_T3']
+
+# Maps a wire state to '1' if it's high, '0' if not, for
+# bytearray.translate()
+highChars = ''.join(['1' if state in (Wire.PULLED_HIGH, Wire.HIGH,
+                                      Wire.FLOATING_HIGH) else '0'
+                     for state in xrange(256)])
+
+def packBits(states):
+    """ Packs a sequence of wire states into a string of bits, 8 to a
+        byte, the first state in the least significant bit. """
+    bits = bytearray(states).translate(highChars)
+    numBytes = (len(bits) + 7) // 8
+    value = int(str(bits[::-1]), 2)
+    return binascii.unhexlify('%0*x'%(numBytes * 2, value))[::-1]
+
+def unpackBits(data, count):
+    """ Returns a string of count '0' and '1' characters from the
+        bits packed by packBits(). """
+    value = int(binascii.hexlify(data[::-1]), 16)
+    return bin(value)[2:].zfill(len(data) * 8)[::-1][:count]
+
+def parseSignals(sim, signalSpecs):
+    """ Returns a list of dicts, one per signal, with the signal's
+        'name', 'chip', 'wire' name and 'wireIndex', and the 'bus' and
+        'bit' it belongs to if it's part of a bus. """
+    chips = {'cpu': sim.sim6507, 'tia': sim.simTIA}
+    signals = []
+    for spec in signalSpecs:
+        chipName, sep, name = spec.partition(':')
+        if sep == '' or not chipName in chips:
+            raise RuntimeError('ERROR: Signal "%s" should start '%(spec) +
+                               'with cpu: or tia:')
+        chip = chips[chipName]
+        if name in busPadNames[chipName]:
+            for bit, padName in enumerate(busPadNames[chipName][name]):
+                signals.append({'name': chipName + ':' + padName,
+                                'chip': chipName, 'wire': padName,
+                                'wireIndex': chip.getWireIndex(padName),
+                                'bus': spec, 'bit': bit})
+        elif name in chip.wireNames:
+            signals.append({'name': spec, 'chip': chipName, 'wire': name,
+                            'wireIndex': chip.getWireIndex(name)})
+        else:
+            raise RuntimeError('ERROR: No wire or bus named "%s" '%(name) +
+                               'in the %s'%(chipName))
+    return signals
+
+class SignalRecorder:
+    def __init__(self, filePath, sim, signalSpecs=None, chunkHalfClocks=4096):
+        if signalSpecs == None:
+            signalSpecs = defaultSignals
+        self.filePath = filePath
+        self.sim = sim
+        self.signals = parseSignals(sim, signalSpecs)
+        self.chunkHalfClocks = chunkHalfClocks
+
+        # Each chip's signals are read with one call of a state getter,
+        # which returns them as a string of bytes.  columns[i] is (chip's
+        # index in getters, position in the string) for signal i
+        self.getters = []
+        self.columns = [None] * len(self.signals)
+        for chipName, chip in [('cpu', sim.sim6507), ('tia', sim.simTIA)]:
+            chipSignals = [i for i, s in enumerate(self.signals)
+                           if s['chip'] == chipName]
+            if len(chipSignals) == 0:
+                continue
+            for pos, i in enumerate(chipSignals):
+                self.columns[i] = (len(self.getters), pos)
+            indices = [self.signals[i]['wireIndex'] for i in chipSignals]
+            self.getters.append(chip.getWireStateStringGetter(indices))
+
+        # Samples not yet written, one list of state strings per getter
+        self.rows = [[] for g in self.getters]
+        self.chunkStart = None
+        self.nextHalfClock = None
+        self.chunks = []
+
+        self.file = open(filePath, 'wb')
+        self.file.write(struct.pack('<8sI', fileMagic, fileVersion))
+
+    def sample(self):
+        """ Records the signals.  Called after each TIA half clock. """
+        halfClock = self.sim.simTIA.halfClkCount
+        if halfClock != self.nextHalfClock:
+            # Starting, or the console skipped ahead or was restored
+            # to another state.  Start a new chunk.
+            self.flush()
+            self.chunkStart = halfClock
+        self.nextHalfClock = halfClock + 1
+        # One string of states per chip per sample
+        rows = self.rows
+        for g, getter in enumerate(self.getters):
+            rows[g].append(getter())
+        if len(rows[0]) >= self.chunkHalfClocks:
+            self.flush()
+            self.chunkStart = self.nextHalfClock
+
+    def flush(self):
+        # Writes the samples so far as a chunk
+        if len(self.rows) == 0 or len(self.rows[0]) == 0:
+            return
+        # Every numSignals'th state, from pos, is one signal's column
+        chipStates = [''.join(rows) for rows in self.rows]
+        numSignals = [len(rows[0]) for rows in self.rows]
+        columnOffsets = []
+        for g, pos in self.columns:
+            column = chipStates[g][pos::numSignals[g]]
+            data = zlib.compress(packBits(column))
+            columnOffsets.append([self.file.tell(), len(data)])
+            self.file.write(data)
+        self.chunks.append({'start': self.chunkStart,
+                            'count': len(self.rows[0]),
+                            'columns': columnOffsets})
+        self.rows = [[] for g in self.getters]
+
+    def close(self):
+        self.flush()
+        sim = self.sim
+        index = {'signals': [dict((k, s[k]) for k in s if k != 'wireIndex')
+                             for s in self.signals],
+                 'chunks': self.chunks,
+                 'chunkHalfClocks': self.chunkHalfClocks,
+                 'romSHA1': sim.getROMHash(),
+                 'netlistHashes': [sim.sim6507.getNetlistHash(),
+                                   sim.simTIA.getNetlistHash()]}
+        indexStr = json.dumps(index, sort_keys=True)
+        indexOffset = self.file.tell()
+        self.file.write(indexStr)
+        self.file.write(struct.pack(footerFormat, indexOffset, len(indexStr),
+                                    fileMagic))
+        self.file.close()
+        self.file = None
+
+
+class SignalTrace:
+    """ Reads a file written by SignalRecorder """
+    def __init__(self, filePath):
+        self.filePath = filePath
+        of = open(filePath, 'rb')
+        self.data = mmap.mmap(of.fileno(), 0, access=mmap.ACCESS_READ)
+        of.close()
+        data = self.data
+        magic, version = struct.unpack_from('<8sI', data)
+        footerSize = struct.calcsize(footerFormat)
+        indexOffset, indexLen, endMagic = struct.unpack_from(footerFormat, data,
+                                                             len(data) - footerSize)
+        if magic != fileMagic or endMagic != fileMagic:
+            raise RuntimeError('ERROR: %s is not a complete signal trace'%(filePath))
+        if version != fileVersion:
+            raise RuntimeError('ERROR: Signal trace is version %d, '%version +
+                               'expected version %d'%fileVersion)
+        self.index = json.loads(data[indexOffset:indexOffset + indexLen])
+        self.signals = self.index['signals']
+        self.chunks = self.index['chunks']
+        self.signalIndex = dict((s['name'], i) for i, s in enumerate(self.signals))
+
+    def close(self):
+        self.data.close()
+
+    def getSignalNames(self):
+        return [s['name'] for s in self.signals]
+
+    def getBuses(self):
+        """ Returns a list of (bus name, [signal names, least significant
+            first]) for the buses recorded """
+        buses = []
+        for s in self.signals:
+            bus = s.get('bus')
+            if bus == None:
+                continue
+            if len(buses) == 0 or buses[-1][0] != bus:
+                buses.append((bus, []))
+            buses[-1][1].append(s['name'])
+        return buses
+
+    def getHalfClockRange(self):
+        """ Returns the first and one past the last TIA half clock
+            recorded """
+        if len(self.chunks) == 0:
+            return 0, 0
+        return (min(c['start'] for c in self.chunks),
+                max(c['start'] + c['count'] for c in self.chunks))
+
+    def iterChunks(self, signalNames, start=None, end=None):
+        """ For each chunk with samples from TIA half clocks start up to
+            end, yields (first TIA half clock, [a string of '0' and '1'
+            for each signal in signalNames]).  None is no limit. """
+        columns = [self.signalIndex[name] for name in signalNames]
+        data = self.data
+        for chunk in self.chunks:
+            chunkStart = chunk['start']
+            count = chunk['count']
+            first = 0
+            last = count
+            if start != None:
+                first = max(first, start - chunkStart)
+            if end != None:
+                last = min(last, end - chunkStart)
+            if first >= last:
+                continue
+            bits = []
+            for col in columns:
+                offset, size = chunk['columns'][col]
+                packed = zlib.decompress(data[offset:offset + size])
+                bits.append(unpackBits(packed, count)[first:last])
+            yield chunkStart + first, bits
+
+    def getBits(self, signalName, start=None, end=None):
+        """ Returns a string of '0' and '1', one for each half clock
+            from start up to end """
+        return ''.join([bits[0] for chunkStart, bits in
+                        self.iterChunks([signalName], start, end)])
+
+    def getBusValues(self, busName, start=None, end=None):
+        """ Returns a list of the bus's integer value at each half clock
+            from start up to end """
+        names = dict(self.getBuses())[busName]
+        values = []
+        for chunkStart, bits in self.iterChunks(names, start, end):
+            # Most significant bit first for int()
+            values.extend([int(''.join(b), 2) for b in zip(*reversed(bits))])
+        return values
+
+    def writeVCD(self, filePath, signalNames=None, start=None, end=None):
+        """ Writes the signals in signalNames, or all of them if None,
+            from TIA half clock start up to end as a VCD file.  Buses
+            are written as vectors.  Each TIA half clock is 140 ns. """
+        if signalNames == None:
+            signalNames = self.getSignalNames()
+        # Variables: (VCD name, signal names, least significant first)
+        wanted = set(signalNames)
+        variables = []
+        busesDone = set()
+        for s in self.signals:
+            name = s['name']
+            if not name in wanted:
+                continue
+            bus = s.get('bus')
+            if bus != None:
+                if bus in busesDone:
+                    continue
+                busesDone.add(bus)
+                names = [n for n in dict(self.getBuses())[bus] if n in wanted]
+                variables.append((bus, names))
+            else:
+                variables.append((name, [name]))
+        allNames = []
+        for vcdName, names in variables:
+            allNames.extend(names)
+        codes = [getVCDCode(i) for i in xrange(len(variables))]
+
+        of = open(filePath, 'w')
+        of.write('$comment Sim2600 signal trace %s $end\n'%
+                 (os.path.basename(self.filePath)))
+        of.write('$timescale 10 ns $end\n')
+        for chipName in ['cpu', 'tia']:
+            of.write('$scope module %s $end\n'%(chipName))
+            for (vcdName, names), code in zip(variables, codes):
+                if vcdName.split(':')[0] != chipName:
+                    continue
+                varName = vcdName.split(':', 1)[1].replace(' ', '_')
+                if len(names) > 1:
+                    varName += ' [%d:0]'%(len(names) - 1)
+                of.write('$var wire %d %s %s $end\n'%(len(names), code, varName))
+            of.write('$upscope $end\n')
+        of.write('$enddefinitions $end\n')
+
+        lastValues = [None] * len(variables)
+        for chunkStart, bits in self.iterChunks(allNames, start, end):
+            # Bits of each variable, most significant first
+            varBits = []
+            pos = 0
+            for vcdName, names in variables:
+                varBits.append(list(reversed(bits[pos:pos + len(names)])))
+                pos += len(names)
+            for t in xrange(len(bits[0])):
+                changes = []
+                for v, vb in enumerate(varBits):
+                    if len(vb) == 1:
+                        value = vb[0][t]
+                    else:
+                        value = ''.join([b[t] for b in vb])
+                    if value != lastValues[v]:
+                        lastValues[v] = value
+                        if len(vb) == 1:
+                            changes.append(value + codes[v])
+                        else:
+                            changes.append('b%s %s'%(value, codes[v]))
+                if len(changes) > 0:
+                    of.write('#%d\n'%((chunkStart + t) * 14))
+                    of.write('\n'.join(changes))
+                    of.write('\n')
+        of.close()
+
+def getVCDCode(i):
+    # Short identifiers made of the printable characters '!' to '~'
+    code = ''
+    while True:
+        code += chr(33 + i % 94)
+        i //= 94
+        if i == 0:
+            return code
+
+def getArgParser():
+    parser = argparse.ArgumentParser(description='List the signals in a ' +
+                 'signal trace, or write them to a VCD file.')
+    parser.add_argument('traceFile', help='file written by SignalRecorder')
+    parser.add_argument('--list', action='store_true',
+                        help='list the signals and half clocks recorded')
+    parser.add_argument('--vcd', default=None, help='VCD file to write')
+    parser.add_argument('--signal', action='append', default=None,
+                        help='signal or bus to write, like cpu:AB0 or ' +
+                             'cpu:AB.  Can be given more than once.  ' +
+                             'Default is all of them')
+    parser.add_argument('--start', type=int, default=None,
+                        help='first TIA half clock to write')
+    parser.add_argument('--end', type=int, default=None,
+                        help='TIA half clock to stop before')
+    return parser
+
+def main(argv):
+    args = getArgParser().parse_args(argv)
+    trace = SignalTrace(args.traceFile)
+    if args.list or args.vcd == None:
+        start, end = trace.getHalfClockRange()
+        print('TIA half clocks %d to %d in %d chunks'%(start, end,
+                                                        len(trace.chunks)))
+        buses = dict(trace.getBuses())
+        for s in trace.signals:
+            if s.get('bit', 0) == 0:
+                bus = s.get('bus')
+                if bus != None:
+                    print('  %s (%d bits)'%(bus, len(buses[bus])))
+                else:
+                    print('  %s'%(s['name']))
+    if args.vcd != None:
+        signalNames = None
+        if args.signal != None:
+            buses = dict(trace.getBuses())
+            signalNames = []
+            for name in args.signal:
+                signalNames.extend(buses.get(name, [name]))
+        trace.writeVCD(args.vcd, signalNames, args.start, args.end)
+        print('Wrote %s'%(args.vcd))
+    trace.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -18,19 +18,43 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import os, struct
+import os, struct, zlib, hashlib
 from array import array
 import params
+import simBackends
 from sim6502 import Sim6502
 from simTIA import SimTIA
 from emuPIA import EmuPIA
+from checkpointCache import CheckpointCache
+from wireBus import WireBus
+from signalRecorder import SignalRecorder
 
 class Sim2600Console:
-    def __init__(self, romFilePath):
-        self.sim6507 = Sim6502()
-        self.simTIA  = SimTIA()
+    # Saved console state files start with these, followed by a
+    # zlib compressed body.  See getSnapshot().
+    snapshotMagic = 'S2600SNP'
+    snapshotVersion = 1
+    # ROM SHA-1, bank offset, PIA timer period, value, clock count, finished
+    snapshotHeaderFormat = '<20sI3iB'
+    snapshotFileExtension = '.snap'
+
+    def __init__(self, romFilePath, backendName = None, chips = None):
+        # backendName chooses the circuit simulator used by both chips.
+        # If None, params.circuitSimulatorBackend is used.
+        # chips may be a (Sim6502, SimTIA) pair already loaded, whose
+        # state has been set back to how it was after loading, to
+        # avoid loading the netlists again.  See farmSim.py
+        if chips != None:
+            self.sim6507, self.simTIA = chips
+        else:
+            self.sim6507 = simBackends.makeChipClass(Sim6502, backendName)()
+            self.simTIA  = simBackends.makeChipClass(SimTIA, backendName)()
         self.emuPIA  = EmuPIA()
 
+        # The 6507 address pads wired to the TIA's address pads
+        self.cpuToTIAAddressBus = WireBus(self.sim6507,
+            self.sim6507.addressBusPads[:len(self.simTIA.addressBusPads)])
+
         self.rom = array('B', [0] * 4096)
         self.bankSwitchROMOffset = 0
         self.programLen = 0
@@ -61,6 +85,25 @@ class Sim2600Console:
         # joystick trigger buttons read on bit 7 of INPT4 and INPT5 of TIA
         self.writeMemory(0x0280, 0xFF, True)
 
+        # Checkpoints saved as the simulation runs.  See useCheckpointCache()
+        self.checkpointCache = None
+        self.checkpointInterval = 0
+        self.checkpointKey = None
+        if params.checkpointCacheDir != None:
+            self.useCheckpointCache(params.checkpointCacheDir,
+                                    params.checkpointInterval,
+                                    params.checkpointCacheMaxBytes)
+
+        # Detection of the console returning to a state it was in at
+        # an earlier VSYNC.  See useLoopDetection()
+        self.loopDetection = False
+        self.resetLoopDetection()
+        if params.detectStateLoops:
+            self.useLoopDetection()
+
+        # Logic analyzer trace of the chips' wires.  See recordSignals()
+        self.signalRecorder = None
+
     # Memory is mapped as follows:
     # 0x00 - 0x2C  write to TIA
     # 0x30 - 0x3D  read from TIA
@@ -126,8 +169,9 @@ class Sim2600Console:
       if addr & 0x200 and addr < 0x2FF:
           print('6507 READ [0x%X]: 0x%X'%(addr, data))
 
-      cpu.setDataBusValue(data)
-      cpu.recalcWireList(cpu.dataBusPads)
+      changedPads = cpu.setDataBusValue(data)
+      if len(changedPads) > 0:
+          cpu.recalcWireList(changedPads)
 
       return data
 
@@ -269,22 +313,31 @@ class Sim2600Console:
 
         self.loadProgramBytes(program, baseAddr, False)
 
-    def updateDataBus(self):
+    def updateDataBus(self, changedPads=None):
+      # If changedPads is a list, the TIA data bus pads that change
+      # are added to it for the caller to recalculate, rather than
+      # being recalculated here.
       cpu = self.sim6507
       tia = self.simTIA
+      recalcPads = changedPads == None
+      if recalcPads:
+        changedPads = []
 
       # transfer 6507 data bus to TIA
       # TIA DB0-DB5 are pure inputs
       # TIA DB6 and DB7 can be driven high or low by the TIA
       # TIA CS3 or CS0 high inhibits tia from driving db6 and db7
 
-      i = 0
-      numPads = len(cpu.dataBusPads)
-      while i < numPads:
-        dbPadHigh = cpu.isHigh(cpu.dataBusPads[i])
-        tia.setPulled(tia.dataBusPads[i], dbPadHigh)
-        i += 1
-      tia.recalcWireList(tia.dataBusPads)
+      cpu.dataBus.copyTo(tia.dataBus, changedPads)
+      if not recalcPads:
+        return
+      if len(changedPads) > 0:
+        tia.recalcWireList(changedPads)
+      self.checkDataBusDrivers()
+
+    def checkDataBusDrivers(self):
+      cpu = self.sim6507
+      tia = self.simTIA
 
       hidrv = False
       for wireInd in tia.dataBusDrivers:
@@ -314,60 +367,51 @@ class Sim2600Console:
         # high for 10 half clocks.  After this, they should remain pulled
         # high, so choosing 10 half clocks or N > 0 half clocks makes no
         # difference.
+        # The pads set from the 6507's outputs are recalculated together
+        # in one recalcWireList, and only those pads whose pulled state
+        # or state changed.
+        changedPads = []
         if tia.halfClkCount < 10:
-          for wireIndex in tia.inputPads:
-            tia.setPulledHigh(wireIndex)
-          tia.recalcWireList(tia.inputPads)
+          tia.inputBus.setValue((1 << len(tia.inputBus)) - 1, changedPads)
 
-        tia.setPulledHigh(tia.padIndDEL)
-        tia.recalcWire(tia.padIndDEL)
+        if tia.setPulledHigh(tia.padIndDEL):
+          changedPads.append(tia.padIndDEL)
     
         # TIA 6x45 control ROM will change when R/W goes HI to LOW only if
         # the TIA CLK2 is LOW, so update R/W first, then CLK2.
         # R/W is high when 6502 is reading, low when 6502 is writing
 
-        tia.setPulled(tia.padIndRW, cpu.isHigh(cpu.padIndRW))
-        tia.recalcWire(tia.padIndRW)
+        if tia.setPulled(tia.padIndRW, cpu.isHigh(cpu.padIndRW)):
+          changedPads.append(tia.padIndRW)
 
         addr = cpu.getAddressBusValue()
 
         # Transfer the state of the 6507 simulation's address bus
         # to the corresponding address inputs of the TIA simulation
-        for i, tiaWireIndex in enumerate(tia.addressBusPads):
-            padValue = cpu.isHigh(cpu.addressBusPads[i])
-            if cpu.isHigh(cpu.addressBusPads[i]):
-                tia.setHigh(tiaWireIndex)
-            else:
-                tia.setLow(tiaWireIndex)
-        tia.recalcWireList(tia.addressBusPads)
+        self.cpuToTIAAddressBus.copyTo(tia.addressBus, changedPads)
 
         # 6507 AB7 goes to TIA CS3 and PIA CS1
         # 6507 AB12 goes to TIA CS0 and PIA CS0, but which 6502 AB line is it?
         # 6507 AB12, AB11, AB10 are not connected externally, so 6507 AB12 is
         # 6502 AB15
         #
-        # TODO: return changed/unchanged from setHigh, setLow to decide to recalc
-        if addr > 0x7F:
-            # It's not a TIA address, so set TIA CS3 high
-            # Either CS3 high or CS0 high should disable TIA from writing
-            tia.setHigh(tia.padIndCS3)
-            tia.setHigh(tia.padIndCS0)
-        else:
-            # It is a TIA addr from 0x00 to 0x7F, so set CS3 and CS0 low
-            tia.setLow(tia.padIndCS3)
-            tia.setLow(tia.padIndCS0)
-        tia.recalcWireList(tia.padIndsCS0CS3)
+        # If addr > 0x7F, it's not a TIA address, so set TIA CS3 high.
+        # Either CS3 high or CS0 high should disable TIA from writing.
+        # If it is a TIA addr from 0x00 to 0x7F, set CS3 and CS0 low.
+        notTIAAddr = addr > 0x7F
+        for wireIndex in tia.padIndsCS0CS3:
+            if tia.setPulled(wireIndex, notTIAAddr):
+                changedPads.append(wireIndex)
     
-        self.updateDataBus()
+        self.updateDataBus(changedPads)
+        if len(changedPads) > 0:
+            tia.recalcWireList(changedPads)
+        self.checkDataBusDrivers()
 
         # Advance the TIA 2nd input clock that is controlled
         # by the 6507's clock generator.
-        tia.setPulled(tia.padIndCLK2, cpu.isHigh(cpu.padIndCLK1Out))
-        tia.recalcWire(tia.padIndCLK2)
-    
-        #print('TIA sim num wires added to groups %d, num ant %d'%
-        #      (tia.numAddWireToGroup, tia.numAddWireTransistor))
-        tia.clearSimStats()
+        if tia.setPulled(tia.padIndCLK2, cpu.isHigh(cpu.padIndCLK1Out)):
+            tia.recalcWire(tia.padIndCLK2)
 
         # Advance TIA 'CLK0' by one half clock
         tia.setPulled(tia.padIndCLK0, not tia.isHigh(tia.padIndCLK0))
@@ -376,13 +420,14 @@ class Sim2600Console:
 
         # This is a good place to record the TIA and 6507 (6502)
         # state if you want to capture something like a logic
-        # analyzer trace.
+        # analyzer trace.  recordSignals() records a trace at the end
+        # of the half clock, once the 6507 has been advanced too.
 
         # Transfer bits from TIA pads to 6507 pads
         # TIA RDY and 6507 RDY are pulled high through external resistor, so pull
         # the pad low if the TIA RDY_lowCtrl is on.
-        cpu.setPulled(cpu.padIndRDY, not tia.isHigh(tia.indRDY_lowCtrl))
-        cpu.recalcWire(cpu.padIndRDY)
+        if cpu.setPulled(cpu.padIndRDY, not tia.isHigh(tia.indRDY_lowCtrl)):
+            cpu.recalcWire(cpu.padIndRDY)
     
         # TIA sends a clock to the 6507.  Propagate this clock from the
         # TIA simulation to the 6507 simulation.
@@ -436,3 +481,254 @@ class Sim2600Console:
                 # 6507's CLK0 is low
                 if cpu.isHigh(cpu.padIndRW):
                     self.readMemory(addr)
+
+        if self.checkpointInterval > 0 and \
+           tia.halfClkCount % self.checkpointInterval == 0:
+            self.saveCheckpoint()
+
+        if self.loopDetection:
+            self.checkForStateLoop()
+
+        if self.signalRecorder != None:
+            self.signalRecorder.sample()
+
+    def getROMHash(self):
+        # SHA-1 of the ROM as mapped at 0xF000, as a hex string
+        return hashlib.sha1(self.rom.tostring()).hexdigest()
+
+    def getStateHash(self):
+        """ Returns a 64 bit hash of the console's state: the state hash
+            of each chip, which is kept up to date as the chips run, and
+            a hash of the PIA RAM, i/o and timer and the ROM bank offset.
+            Half clock counts aren't included, so the console returning
+            to an earlier state gives the same hash. """
+        pia = self.emuPIA
+        piaState = struct.pack('<I3iB', self.bankSwitchROMOffset,
+                               pia.timerPeriod, pia.timerValue,
+                               pia.timerClockCount, int(pia.timerFinished))
+        piaHash = struct.unpack('<Q', hashlib.md5(piaState + pia.ram.tostring() +
+                                                  pia.iot.tostring()).digest()[:8])[0]
+        return self.sim6507.getStateHash() ^ self.simTIA.getStateHash() ^ piaHash
+
+    def getSnapshot(self):
+        """ Returns a string holding the complete state of the console:
+            the wire, transistor gate and pulled states and half clock
+            count of each chip, the PIA RAM, i/o and timer, and the ROM
+            bank offset.  The ROM itself isn't included, just its hash,
+            so the snapshot can only be restored to a console running
+            the same ROM. """
+        pia = self.emuPIA
+        body = struct.pack(self.snapshotHeaderFormat,
+                           hashlib.sha1(self.rom.tostring()).digest(),
+                           self.bankSwitchROMOffset, pia.timerPeriod,
+                           pia.timerValue, pia.timerClockCount,
+                           int(pia.timerFinished))
+        parts = [body]
+        for sim in (self.sim6507, self.simTIA):
+            parts.append(struct.pack('<3I', sim.numWires, sim.numFets,
+                                     sim.halfClkCount))
+            parts.append(sim.getWireStates().tostring())
+            parts.append(sim.getGateStates().tostring())
+            parts.append(sim.getPulledStates().tostring())
+        parts.append(pia.ram.tostring())
+        parts.append(pia.iot.tostring())
+
+        return struct.pack('<8sI', self.snapshotMagic, self.snapshotVersion) + \
+               zlib.compress(''.join(parts))
+
+    def restoreSnapshot(self, snapshot):
+        """ Sets the console to the state in a string returned by
+            getSnapshot() """
+        magic, version = struct.unpack_from('<8sI', snapshot)
+        if magic != self.snapshotMagic:
+            raise RuntimeError('ERROR: Not a console snapshot')
+        if version != self.snapshotVersion:
+            raise RuntimeError('ERROR: Console snapshot is version %d, '%version +
+                               'expected version %d'%self.snapshotVersion)
+        body = zlib.decompress(snapshot[struct.calcsize('<8sI'):])
+
+        fmt = self.snapshotHeaderFormat
+        romHash, bankOffset, timerPeriod, timerValue, timerClockCount, \
+            timerFinished = struct.unpack_from(fmt, body)
+        if romHash != hashlib.sha1(self.rom.tostring()).digest():
+            raise RuntimeError('ERROR: Console snapshot was saved from a ' +
+                               'different ROM than %s'%(self.programFilePath))
+        pos = struct.calcsize(fmt)
+
+        # Read everything before changing anything, so a bad
+        # snapshot leaves the console as it was.
+        chipStates = []
+        for sim in (self.sim6507, self.simTIA):
+            numWires, numFets, halfClkCount = struct.unpack_from('<3I', body, pos)
+            if numWires != sim.numWires or numFets != sim.numFets:
+                raise RuntimeError('ERROR: Console snapshot has %d wires '%numWires +
+                                   'and %d transistors for %s, '%(numFets, sim.__class__.__name__) +
+                                   'expected %d and %d'%(sim.numWires, sim.numFets))
+            pos += struct.calcsize('<3I')
+            wireStates = array('B', body[pos:pos + numWires])
+            pos += numWires
+            gateStates = array('B', body[pos:pos + numFets])
+            pos += numFets
+            pulledStates = array('B', body[pos:pos + numWires])
+            pos += numWires
+            chipStates.append((halfClkCount, wireStates, gateStates, pulledStates))
+
+        pia = self.emuPIA
+        numRAM = len(pia.ram)
+        numIOT = len(pia.iot)
+        if len(body) != pos + numRAM + numIOT:
+            raise RuntimeError('ERROR: Console snapshot is the wrong size')
+
+        for sim, chipState in zip((self.sim6507, self.simTIA), chipStates):
+            sim.setChipState(chipState)
+
+        pia.ram = array('B', body[pos:pos + numRAM])
+        pos += numRAM
+        pia.iot = array('B', body[pos:pos + numIOT])
+        pia.timerPeriod = timerPeriod
+        pia.timerValue = timerValue
+        pia.timerClockCount = timerClockCount
+        pia.timerFinished = bool(timerFinished)
+        self.bankSwitchROMOffset = bankOffset
+        self.resetLoopDetection()
+
+    def saveSnapshot(self, filePath):
+        of = open(filePath, 'wb')
+        of.write(self.getSnapshot())
+        of.close()
+
+    def loadSnapshot(self, filePath):
+        if not os.path.exists(filePath):
+            raise RuntimeError('ERROR: Could not find console snapshot "%s"'%(filePath))
+        of = open(filePath, 'rb')
+        snapshot = of.read()
+        of.close()
+        self.restoreSnapshot(snapshot)
+
+    def useCheckpointCache(self, cacheDir, interval, maxBytes):
+        """ Saves a checkpoint in cacheDir every interval TIA half clocks
+            (none if interval is 0) and lets resumeFromCheckpoint() use
+            them.  Checkpoints are keyed by the ROM and the hashes of both
+            chips' netlists. """
+        self.checkpointCache = CheckpointCache(cacheDir, maxBytes)
+        self.checkpointInterval = interval
+        self.checkpointKey = (self.getROMHash(),
+                              self.sim6507.getNetlistHash(),
+                              self.simTIA.getNetlistHash())
+
+    def saveCheckpoint(self):
+        count = self.simTIA.halfClkCount
+        if not self.checkpointCache.contains(self.checkpointKey, count):
+            self.checkpointCache.save(self.checkpointKey, count, self.getSnapshot())
+
+    def resumeFromCheckpoint(self, maxHalfClkCount=None):
+        """ Restores the latest checkpoint that is ahead of the current
+            TIA half clock and not past maxHalfClkCount.  Returns True if
+            one was restored. """
+        if self.checkpointCache == None:
+            return False
+        count, snapshot = self.checkpointCache.loadNearest(self.checkpointKey,
+                              maxHalfClkCount, self.simTIA.halfClkCount + 1)
+        if snapshot == None:
+            return False
+        print('Resuming from checkpoint at TIA half clock %d'%(count))
+        self.restoreSnapshot(snapshot)
+        return True
+
+    def advanceToHalfClock(self, halfClkCount):
+        # Runs until the TIA half clock count reaches halfClkCount,
+        # starting from a checkpoint if there's one on the way, and
+        # skipping ahead once the console is in a loop.
+        self.resumeFromCheckpoint(halfClkCount)
+        while self.simTIA.halfClkCount < halfClkCount:
+            self.advanceOneHalfClock()
+            if self.stateLoop != None:
+                self.skipStateLoops(halfClkCount)
+
+    # Loop detection.  Many ROMs sit in the same frame over and over,
+    # Asteroids waiting for the Reset switch, or a title screen.  The
+    # simulation is deterministic and its inputs are part of the state
+    # hash, so once the console is in a state it was in before, it
+    # will repeat everything between the two from then on.  The state
+    # hash is sampled when VSYNC goes high, and when a hash comes up
+    # again, stateLoop records the loop:
+    #   startTIAHalfClock      TIA half clock when the loop was first
+    #                          entered
+    #   periodTIAHalfClocks    length of the loop in TIA half clocks,
+    #   periodCPUHalfClocks    6507 half clocks
+    #   periodVSyncs           and VSYNCs
+    #   foundAtTIAHalfClock    TIA half clock the loop was found at
+    # Running on after that only repeats the loop, so callers can stop,
+    # or skip whole loops with skipStateLoops().
+    def useLoopDetection(self, enable=True):
+        self.loopDetection = enable
+        self.resetLoopDetection()
+
+    def resetLoopDetection(self):
+        # State hashes seen at VSYNC, each with the VSYNC count and
+        # TIA and 6507 half clock counts of when it was seen
+        self.vsyncStates = dict()
+        self.numVSyncs = 0
+        self.lastVSyncHigh = False
+        self.stateLoop = None
+
+    def checkForStateLoop(self):
+        """ Called each half clock when loop detection is on.  Returns
+            True when a loop is first found. """
+        tia = self.simTIA
+        vsyncHigh = tia.isHigh(tia.vsync)
+        risingEdge = vsyncHigh and not self.lastVSyncHigh
+        self.lastVSyncHigh = vsyncHigh
+        if not risingEdge or self.stateLoop != None:
+            return False
+
+        cpu = self.sim6507
+        stateHash = self.getStateHash()
+        seen = self.vsyncStates.get(stateHash)
+        if seen == None:
+            self.vsyncStates[stateHash] = (self.numVSyncs, tia.halfClkCount,
+                                           cpu.halfClkCount)
+            self.numVSyncs += 1
+            return False
+
+        numVSyncs, tiaHalfClkCount, cpuHalfClkCount = seen
+        self.stateLoop = {'startTIAHalfClock': tiaHalfClkCount,
+                          'periodTIAHalfClocks': tia.halfClkCount - tiaHalfClkCount,
+                          'periodCPUHalfClocks': cpu.halfClkCount - cpuHalfClkCount,
+                          'periodVSyncs': self.numVSyncs - numVSyncs,
+                          'foundAtTIAHalfClock': tia.halfClkCount}
+        print('Steady state reached: the console state at TIA half clock ' +
+              '%d repeats every %d half clocks (%d VSYNCs)'%
+              (tiaHalfClkCount, self.stateLoop['periodTIAHalfClocks'],
+               self.stateLoop['periodVSyncs']))
+        return True
+
+    def skipStateLoops(self, maxHalfClkCount, maxLoops=None):
+        """ Once a loop has been found, moves the half clock counts
+            ahead by as many whole loops as fit before maxHalfClkCount,
+            and no more than maxLoops, without simulating them.  The
+            console ends up in the state it would have been in.
+            Returns the number of loops skipped. """
+        if self.stateLoop == None:
+            return 0
+        period = self.stateLoop['periodTIAHalfClocks']
+        numLoops = (maxHalfClkCount - self.simTIA.halfClkCount) // period
+        if maxLoops != None:
+            numLoops = min(numLoops, maxLoops)
+        if numLoops <= 0:
+            return 0
+        self.simTIA.halfClkCount += numLoops * period
+        self.sim6507.halfClkCount += numLoops * self.stateLoop['periodCPUHalfClocks']
+        return numLoops
+
+    # Logic analyzer.  Records the 6507 and TIA wires in signals, see
+    # signalRecorder.py, at the end of every half clock from now until
+    # stopRecordingSignals() is called.
+    def recordSignals(self, filePath, signals=None):
+        self.stopRecordingSignals()
+        self.signalRecorder = SignalRecorder(filePath, self, signals)
+
+    def stopRecordingSignals(self):
+        if self.signalRecorder != None:
+            self.signalRecorder.close()
+            self.signalRecorder = None
@@ -20,19 +20,26 @@
 
 import params
 
-# Choose between two flavors of simulation.  One uses sets
-# to track the groups of wires switched together by transistors.
-# The other uses lists.
+# Choose between flavors of simulation with params.circuitSimulatorBackend.
+# One uses sets to track the groups of wires switched together by
+# transistors.  Another uses lists.  Another keeps all circuit state in
+# flat arrays.  simBackends.makeChipClass() builds a version of this
+# class that uses a different backend.
 
-from circuitSimulatorUsingLists import CircuitSimulator
-#from circuitSimulatorUsingSets import CircuitSimulator
+import simBackends
+from wireBus import WireBus
+CircuitSimulator = simBackends.getCircuitSimulatorClass()
 
 
 class Sim6502(CircuitSimulator):
+    circuitSimulatorClass = CircuitSimulator
+
     def __init__(self):
-        CircuitSimulator.__init__(self)
+        self.circuitSimulatorClass.__init__(self)
+        self.collapseStaticNetlist = params.collapseStaticNetlist
 
         self.loadCircuit(params.chip6502File)
+        self.enableRecalcCache(params.recalcCacheMaxEntries)
 
         # No need to update the names based on params.mos6502WireInit.
         # The names have already been saved in the net_6502.pkl file.
@@ -53,6 +60,10 @@ class Sim6502(CircuitSimulator):
             wireIndex = self.getWireIndex(padName)
             self.dataBusPads.append(wireIndex)
 
+        # The same pads, read and set as integers
+        self.addressBus = WireBus(self, self.addressBusPads)
+        self.dataBus = WireBus(self, self.dataBusPads)
+
         self.padIndRW      = self.getWireIndex('R/W')
         self.padIndCLK0    = self.getWireIndex('CLK0')
         self.padIndRDY     = self.getWireIndex('RDY')
@@ -61,31 +72,14 @@ class Sim6502(CircuitSimulator):
         self.padReset      = self.getWireIndex('RES')
 
     def getAddressBusValue(self):
-        addr = 0
-        shift = 0
-        for wireIndex in self.addressBusPads:
-            if self.isHigh(wireIndex):
-                addr |= (1 << shift)
-            shift += 1
-        return addr
+        return self.addressBus.getValue()
         
     def getDataBusValue(self):
-        data = 0
-        shift = 0
-        for wireIndex in self.dataBusPads:
-            if self.isHigh(wireIndex):
-                data |= 1 << shift
-            shift += 1
-        return data
+        return self.dataBus.getValue()
 
     def setDataBusValue(self, value):
-        shift = 0
-        for wireIndex in self.dataBusPads:
-            if (value & (1 << shift)) != 0:
-                self.setHigh(wireIndex)
-            else:
-                self.setLow(wireIndex)
-            shift += 1
+        # Returns the list of data bus pads that changed
+        return self.dataBus.setValue(value)
 
     def getStateStr1(self):
         return str('6502 CLK %d RES %d RDY %d  ADDR 0x%4.4X  DB 0x%2.2X'%
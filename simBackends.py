@@ -0,0 +1,78 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+#------------------------------------------------------------------------------
+#
+# simBackends.py
+# The chip simulations Sim6502 and SimTIA derive from one of several
+# interchangeable circuit simulators.  Each one implements the same
+# semantics, but holds the circuit state in a different way.  This
+# module maps a short backend name to the module holding that
+# circuit simulator, and builds chip simulation classes that derive
+# from whichever backend is asked for.
+#
+
+import params
+
+# Short backend name: module that defines a CircuitSimulator class
+backendModuleNames = {
+    'lists'  : 'circuitSimulatorUsingLists',
+    'sets'   : 'circuitSimulatorUsingSets',
+    'tables' : 'circuitSimulatorUsingTables',
+    'arrays' : 'circuitSimulatorUsingArrays',
+    'compiled' : 'circuitSimulatorCompiled',
+    'frontier' : 'circuitSimulatorFrontier',
+}
+
+def getBackendNames():
+    return sorted(backendModuleNames.keys())
+
+def getCircuitSimulatorClass(backendName = None):
+    """ Returns the CircuitSimulator class for the named backend.
+        If backendName is None, params.circuitSimulatorBackend is used. """
+    if backendName == None:
+        backendName = params.circuitSimulatorBackend
+    if not backendName in backendModuleNames:
+        raise RuntimeError('Unknown circuit simulator backend "%s".  '%(backendName) +
+                           'Choose one of: %s'%(', '.join(getBackendNames())))
+    module = __import__(backendModuleNames[backendName])
+    return module.CircuitSimulator
+
+# Cache of chip classes built by makeChipClass so that each
+# (chip, backend) pair is only built once.
+chipClassCache = dict()
+
+def makeChipClass(chipClass, backendName = None):
+    """ chipClass is Sim6502 or SimTIA, which derive from the default
+        backend.  Returns a class with the same methods as chipClass
+        that derives from the named backend instead. """
+    circuitSimulatorClass = getCircuitSimulatorClass(backendName)
+    if circuitSimulatorClass is chipClass.circuitSimulatorClass:
+        return chipClass
+
+    key = (chipClass, circuitSimulatorClass)
+    if not key in chipClassCache:
+        classDict = dict(chipClass.__dict__)
+        classDict['circuitSimulatorClass'] = circuitSimulatorClass
+        # type(chipClass) is types.ClassType for old-style classes
+        chipClassCache[key] = type(chipClass)(chipClass.__name__,
+                                              (circuitSimulatorClass,),
+                                              classDict)
+    return chipClassCache[key]
@@ -21,25 +21,39 @@
 from array import array
 import params
 
-# Choose between two flavors of simulation.  One uses sets
-# to track the groups of wires switched together by transistors.
-# The other uses lists.
+# Choose between flavors of simulation with params.circuitSimulatorBackend.
+# One uses sets to track the groups of wires switched together by
+# transistors.  Another uses lists.  Another keeps all circuit state in
+# flat arrays.  simBackends.makeChipClass() builds a version of this
+# class that uses a different backend.
 
-from circuitSimulatorUsingLists import CircuitSimulator
-#from circuitSimulatorUsingSets import CircuitSimulator
+import simBackends
+from wireBus import WireBus
+CircuitSimulator = simBackends.getCircuitSimulatorClass()
 
+# SECAM consoles show one of these colors for each 3-bit luminance,
+# whatever the color bits are.
+secamColors = [(0, 0, 0),     (33, 33, 255),  (240, 60, 121), (255, 80, 255),
+               (127, 255, 0), (127, 255, 255), (255, 255, 63), (255, 255, 255)]
 
 class SimTIA(CircuitSimulator):
+    circuitSimulatorClass = CircuitSimulator
+
     def __init__(self):
-        CircuitSimulator.__init__(self)
+        self.circuitSimulatorClass.__init__(self)
+        self.collapseStaticNetlist = params.collapseStaticNetlist
         self.loadCircuit(params.chipTIAFile)
+        self.enableRecalcCache(params.recalcCacheMaxEntries)
         self.colLumToRGB8LUT = []
+        # Packed 0xRRGGBBAA colors of the palette in use.  See setPalette()
+        self.colLumToRGBA8LUT = []
 
         # For debugging or inspecting, this can be used to hold
         # the last values written to our write-only control addresses.
         self.lastControlValue = array('B', [0] * (0x2C + 1))
 
         self.initColLumLUT()
+        self.setPalette(params.tiaPalette)
 
         # Temporarily inhibit TIA from driving DB6 and DB7
         self.setHighWN('CS3')
@@ -63,6 +77,10 @@ class SimTIA(CircuitSimulator):
             wireIndex = self.getWireIndex(padName)
             self.dataBusPads.append(wireIndex)
 
+        # The same pads, read and set as integers
+        self.addressBus = WireBus(self, self.addressBusPads)
+        self.dataBus = WireBus(self, self.dataBusPads)
+
         self.dataBusDrivers = []
         for padName in params.tiaDataBusDrivers:
             wireIndex = self.getWireIndex(padName)
@@ -72,6 +90,7 @@ class SimTIA(CircuitSimulator):
         for padName in params.tiaInputPadNames:
             wireIndex = self.getWireIndex(padName)
             self.inputPads.append(wireIndex)
+        self.inputBus = WireBus(self, self.inputPads)
 
         self.indDB6_drvLo   = self.getWireIndex('DB6_drvLo')
         self.indDB6_drvHi   = self.getWireIndex('DB6_drvHi')
@@ -103,6 +122,14 @@ class SimTIA(CircuitSimulator):
         self.colcnt_t2      = self.getWireIndex('COLCNT_T2')
         self.colcnt_t3      = self.getWireIndex('COLCNT_T3')
 
+        # The states of these 7 wires decide the pixel color, so
+        # getColorRGBA8() reads them all at once and caches the color
+        # for each combination of states it sees.
+        self.getPixelWireStates = self.getWireStateGetter(
+            [self.L0_lowCtrl, self.L1_lowCtrl, self.L2_lowCtrl,
+             self.colcnt_t0, self.colcnt_t1, self.colcnt_t2, self.colcnt_t3])
+        self.pixelStatesToRGBA = dict()
+
     def getTIAStateStr1(self):
         sigs = {'LUM':['L0_lowCtrl', 'L1_lowCtrl', 'L2_lowCtrl'], 
                 'COL':['COLCNT_T0','COLCNT_T1','COLCNT_T2','COLCNT_T3']}
@@ -191,15 +218,35 @@ class SimTIA(CircuitSimulator):
             col += 8
         return col
 
-    def getColorRGBA8(self):
+    def getColLumIndex(self):
         lum = self.get3BitLuminance()
         col = self.get4BitColor()
 
         # Lowest 4 bits of col, shift them 3 bits to the right,
         # and add the low 3 bits of luminance
-        index = ((col & 0xF) << 3) + (lum & 0x7)
+        return ((col & 0xF) << 3) + (lum & 0x7)
 
-        rgb8Tuple = self.colLumToRGB8LUT[index]
-        return (rgb8Tuple[0] << 24) | (rgb8Tuple[1] << 16) | \
-               (rgb8Tuple[2] << 8) | 0xFF
+    def getColorRGBA8(self):
+        states = self.getPixelWireStates()
+        rgba = self.pixelStatesToRGBA.get(states)
+        if rgba == None:
+            rgba = self.colLumToRGBA8LUT[self.getColLumIndex()]
+            self.pixelStatesToRGBA[states] = rgba
+        return rgba
+
+    def setPalette(self, paletteName):
+        """ Sets the colors returned by getColorRGBA8().
+            'NTSC' : colLumToRGB8LUT, from initColLumLUT()
+            'SECAM': 8 colors chosen by luminance alone, as on a
+                     SECAM console """
+        if paletteName == 'NTSC':
+            rgbList = self.colLumToRGB8LUT
+        elif paletteName == 'SECAM':
+            rgbList = [secamColors[colLumInd & 0x7] for colLumInd in xrange(128)]
+        else:
+            raise RuntimeError('ERROR: Unknown TIA palette %s'%(str(paletteName)))
+
+        self.colLumToRGBA8LUT = [(r << 24) | (g << 16) | (b << 8) | 0xFF
+                                 for r, g, b in rgbList]
+        self.pixelStatesToRGBA = dict()
 
@@ -0,0 +1,141 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#------------------------------------------------------------------------------
+#
+# staticCollapseCheck.py
+# Checks CircuitSimulatorBase.collapseStaticWires() on a small made up
+# netlist.  Neither chip's netlist has transistors that join two wires
+# through a gate tied to VCC, so the 6502 and TIA never exercise the
+# merge.  This builds a netlist that does, loads it twice with the
+# 'lists' simulator, once merged and once not, drives its inputs
+# through every pattern, and compares the state of every named wire
+# after each recalc.
+#
+#   python staticCollapseCheck.py
+#
+
+import itertools, sys
+from circuitSimulatorUsingLists import CircuitSimulator
+from nmosFet import NmosFet
+from wire import Wire
+
+# (name, pulled)
+wireDefs = [('VCC',  Wire.PULLED_HIGH),
+            ('VSS',  Wire.PULLED_LOW),
+            ('IN1',  Wire.PULLED_LOW),
+            ('IN2',  Wire.PULLED_LOW),
+            ('IN3',  Wire.PULLED_LOW),
+            ('INV1', Wire.PULLED_HIGH),     # IN1 inverted
+            ('A',    Wire.PULLED_HIGH),     # A, B and C are always joined
+            ('B',    0),
+            ('C',    0),
+            ('D',    Wire.PULLED_HIGH),     # D and E are always joined,
+            ('E',    Wire.PULLED_LOW),      #   pulled both ways
+            ('F',    0),                    # dynamic nodes, joined to each
+            ('G',    0),                    #   other always, and to H
+            ('H',    0),                    #   while IN3 is high
+            ('I',    Wire.PULLED_HIGH),     # never joined to A
+            ('OUT',  Wire.PULLED_HIGH)]
+
+# (side1, side2, gate)
+fetDefs = [('INV1', 'VSS',  'IN1'),
+           ('A',    'B',    'VCC'),
+           ('B',    'C',    'VCC'),
+           ('C',    'VSS',  'IN2'),
+           ('D',    'E',    'VCC'),
+           ('E',    'A',    'INV1'),
+           ('F',    'G',    'VCC'),
+           ('G',    'C',    'IN1'),
+           ('H',    'VSS',  'IN2'),
+           ('G',    'H',    'IN3'),
+           ('I',    'A',    'VSS'),
+           ('OUT',  'VSS',  'B')]
+
+inputNames = ['IN1', 'IN2', 'IN3']
+
+def buildChip(collapse):
+    wireIndex = dict([(name, i) for i, (name, pulled) in enumerate(wireDefs)])
+    ctInds = [[] for w in wireDefs]
+    gateInds = [[] for w in wireDefs]
+    chip = CircuitSimulator()
+    chip.name = 'collapsed' if collapse else 'not collapsed'
+    chip.collapseStaticNetlist = collapse
+    chip.transistorList = []
+    for i, (side1, side2, gate) in enumerate(fetDefs):
+        s1 = wireIndex[side1]
+        s2 = wireIndex[side2]
+        g = wireIndex[gate]
+        chip.transistorList.append(NmosFet(i, s1, s2, g))
+        ctInds[s1].append(i)
+        ctInds[s2].append(i)
+        gateInds[g].append(i)
+    chip.wireList = []
+    for i, (name, pulled) in enumerate(wireDefs):
+        chip.wireList.append(Wire(i, name, ctInds[i], gateInds[i], pulled))
+        chip.wireNames[name] = i
+    chip.finishLoadCircuit()
+    # As CircuitSimulator.loadCircuit()
+    chip.groupList = [0] * len(chip.wireList)
+    chip.stackWires = [0] * len(chip.wireList)
+    chip.stackIters = [None] * len(chip.wireList)
+    chip.initStateHash()
+    chip.recalcAllWires()
+    return chip
+
+def getNamedStates(chip):
+    return [chip.wireList[chip.wireNames[name]].state
+            for name, pulled in wireDefs]
+
+def main(argv):
+    chip = buildChip(False)
+    collapsedChip = buildChip(True)
+    numMerged = sum([1 for i, rep in enumerate(collapsedChip.staticWireRep)
+                     if rep != i])
+    print('Merged %d wires'%(numMerged))
+
+    # Every pair of input patterns, so each is reached from every
+    # other and the dynamic nodes are left holding both values
+    patterns = list(itertools.product([False, True], repeat=len(inputNames)))
+    numChecked = 0
+    for first, second in itertools.product(patterns, repeat=2):
+        for pattern in [first, second]:
+            for c in [chip, collapsedChip]:
+                for name, high in zip(inputNames, pattern):
+                    if high:
+                        c.setHighWN(name)
+                    else:
+                        c.setLowWN(name)
+                c.recalcWireNameList(inputNames)
+            states = getNamedStates(chip)
+            collapsedStates = getNamedStates(collapsedChip)
+            numChecked += 1
+            if states != collapsedStates:
+                print('FAILED after inputs %s %s'%(str(first), str(second)))
+                for (name, pulled), s, cs in zip(wireDefs, states,
+                                                 collapsedStates):
+                    if s != cs:
+                        print('  %s: %d not collapsed, %d collapsed'%
+                              (name, s, cs))
+                return 1
+    print('OK: the same wire states after %d recalcs'%(numChecked))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
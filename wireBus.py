@@ -0,0 +1,89 @@
+# Copyright (c) 2014 Greg James, Visual6502.org
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+#------------------------------------------------------------------------------
+#
+# wireBus.py
+# A group of a chip's wires, like the address or data bus pads, read or
+# set together as the bits of an integer, least significant bit first.
+# The wire indices are looked up once, and the states of all the wires
+# are read in one call (see CircuitSimulatorBase.getWireStateGetter).
+# The integer value and high/low bits for each combination of wire
+# states are worked out the first time that combination is seen and
+# kept in a dict, so reading a bus is a gather and a dict lookup.
+#
+
+class WireBus:
+    # Limit on the combinations of states remembered
+    maxCachedStates = 1 << 16
+
+    def __init__(self, sim, wireIndices):
+        self.sim = sim
+        self.wireIndices = list(wireIndices)
+        self.numBits = len(self.wireIndices)
+        self.getStates = sim.getWireStateGetter(self.wireIndices)
+        # wire states tuple : (integer value, tuple of bools)
+        self.statesToValue = dict()
+
+    def __len__(self):
+        return self.numBits
+
+    def getValueAndHighs(self):
+        states = self.getStates()
+        valueAndHighs = self.statesToValue.get(states)
+        if valueAndHighs == None:
+            highs = tuple([self.sim.isHigh(wireIndex) == True
+                           for wireIndex in self.wireIndices])
+            value = 0
+            for bit, high in enumerate(highs):
+                if high:
+                    value |= 1 << bit
+            valueAndHighs = (value, highs)
+            if len(self.statesToValue) >= self.maxCachedStates:
+                self.statesToValue.clear()
+            self.statesToValue[states] = valueAndHighs
+        return valueAndHighs
+
+    def getValue(self):
+        return self.getValueAndHighs()[0]
+
+    def getHighs(self):
+        # Tuple of True or False for each wire's isHigh()
+        return self.getValueAndHighs()[1]
+
+    def setHighs(self, highs, changedWires=None):
+        """ Sets each wire pulled high or low.  Returns the list of wires
+            that changed and need to be recalculated.  If changedWires is
+            given, they are appended to it. """
+        if changedWires == None:
+            changedWires = []
+        self.sim.setPulledList(self.wireIndices, highs, changedWires)
+        return changedWires
+
+    def setValue(self, value, changedWires=None):
+        highs = [(value >> bit) & 1 == 1 for bit in xrange(self.numBits)]
+        return self.setHighs(highs, changedWires)
+
+    def copyTo(self, otherBus, changedWires=None):
+        """ Sets the wires of otherBus, which may be on another chip,
+            high or low to match this bus's wires.  Returns the changed
+            wires of otherBus as setHighs() does. """
+        return otherBus.setHighs(self.getHighs(), changedWires)